@@ -1,8 +1,11 @@
 from aiogram import Bot, Dispatcher
 from app.core.config import settings
 from app.core.telemetry import UserMiddleware
+from app.core.sender import sender
+from app.core import runtime
 
-bot = Bot(token=settings.bot_token)
+bot = Bot(token=settings.bot_token, session=runtime.bot_session())
+bot.session.middleware(sender)
 dp = Dispatcher()
 
 dp.message.middleware(UserMiddleware())
@@ -0,0 +1,107 @@
+import asyncio
+import logging
+import os
+import shutil
+import time
+from contextlib import contextmanager
+
+from app.core.config import settings
+from app.core.scheduler import scheduler
+from app.core import workspace
+
+logger = logging.getLogger(__name__)
+
+OK = "ok"
+DEGRADED = "degraded"        # отвечаем только из кэша
+OVERLOADED = "overloaded"    # сразу отказываем
+
+_inflight = 0
+_last_state = OK
+_disk_cache: tuple[float, int | None] = (0.0, None)
+
+class OverloadError(Exception): ...
+
+@contextmanager
+def track():
+    global _inflight
+    _inflight += 1
+    try:
+        yield
+    finally:
+        _inflight -= 1
+
+def inflight() -> int:
+    return _inflight
+
+def executor_backlog() -> int:
+    # задачи, ожидающие поток в executor по умолчанию (run_in_executor(None, ...))
+    try:
+        executor = asyncio.get_running_loop()._default_executor
+        return executor._work_queue.qsize() if executor else 0
+    except (RuntimeError, AttributeError):
+        return 0
+
+def executor_usage() -> dict[str, int]:
+    # занятость executor по умолчанию: busy == max при растущем backlog — пул насыщен
+    try:
+        executor = asyncio.get_running_loop()._default_executor
+        if executor is None:
+            return {"busy": 0, "max": 0, "backlog": 0}
+        busy = len(executor._threads) - executor._idle_semaphore._value
+        return {"busy": max(0, busy), "max": executor._max_workers, "backlog": executor._work_queue.qsize()}
+    except (RuntimeError, AttributeError):
+        # другой цикл событий или другая реализация executor — внутренностей может не быть
+        return {"busy": 0, "max": 0, "backlog": 0}
+
+def queue_depth() -> int:
+    return scheduler.waiting + executor_backlog()
+
+def free_disk_mb() -> int | None:
+    # None — места ещё ни разу не удалось измерить: дисковый сигнал тогда не учитывается
+    global _disk_cache
+    ts, free = _disk_cache
+    now = time.monotonic()
+    if now - ts > 1.0:
+        try:
+            os.makedirs(workspace.ROOT, exist_ok=True)
+            free = shutil.disk_usage(workspace.ROOT).free // (1024 * 1024)
+        except OSError as e:
+            # разовая ошибка stat не должна переводить бота в OVERLOADED: остаётся прошлое значение
+            logger.warning(f"Не удалось измерить свободное место в {workspace.ROOT}: {e}")
+        _disk_cache = (now, free)
+    return free
+
+def load_state() -> str:
+    global _last_state
+    inflight_, depth, free = _inflight, queue_depth(), free_disk_mb()
+    if (inflight_ >= settings.hard_inflight
+            or depth >= settings.hard_queue_depth
+            or (free is not None and free < settings.hard_free_disk_mb)):
+        state = OVERLOADED
+    elif (inflight_ >= settings.soft_inflight
+            or depth >= settings.soft_queue_depth
+            or (free is not None and free < settings.soft_free_disk_mb)):
+        state = DEGRADED
+    else:
+        state = OK
+    if state != _last_state:
+        logger.warning(f"Нагрузка: {_last_state} -> {state} (inflight={inflight_}, queue={depth}, free_disk={free}MB)")
+        _last_state = state
+    return state
+
+def check_download_allowed():
+    # вызывается перед тяжёлой загрузкой; ответы из кэша разрешены всегда, кроме OVERLOADED
+    state = load_state()
+    if state != OK:
+        raise OverloadError("Сейчас высокая нагрузка: отвечаю только из кэша. Попробуйте через пару минут.")
+
+def snapshot() -> dict:
+    return {
+        "state": load_state(),
+        "inflight": _inflight,
+        "scheduler_running": scheduler.running,
+        "scheduler_waiting": scheduler.waiting,
+        "executor_backlog": executor_backlog(),
+        "free_disk_mb": free_disk_mb(),
+        "workspace_mb": workspace.usage_bytes() // (1024 * 1024),
+    }
@@ -9,11 +9,10 @@ MAX_QUEUE = 2           # сколько задач держим в очеред
 
 _last_seen: dict[int, float] = {}
 _window_hits: dict[int, Deque[float]] = defaultdict(deque)
-_user_locks: dict[int, asyncio.Lock] = defaultdict(asyncio.Lock)
 
 _inflight: dict[tuple[int, str], asyncio.Task] = {}
 
-_user_queues: dict[int, Deque[asyncio.Future]] = defaultdict(deque)
+_user_queued: dict[int, int] = defaultdict(int)
 
 class RateLimitError(Exception): ...
 class QueueOverflowError(Exception): ...
@@ -32,9 +31,6 @@ def check_rate(user_id: int):
     hits.append(now)
     _last_seen[user_id] = now
 
-def get_user_lock(user_id: int) -> asyncio.Lock:
-    return _user_locks[user_id]
-
 def get_inflight_task(user_id: int, url: str) -> asyncio.Task | None:
     return _inflight.get((user_id, url))
 
@@ -42,20 +38,18 @@ def set_inflight_task(user_id: int, url: str, task: asyncio.Task):
     _inflight[(user_id, url)] = task
     task.add_done_callback(lambda t: _inflight.pop((user_id, url), None))
 
-async def enqueue_or_fail(user_id: int):
-    q = _user_queues[user_id]
-    if len(q) >= MAX_QUEUE:
+def enqueue_or_fail(user_id: int):
+    # только резервирует место: порядок выполнения задаёт app.core.scheduler
+    if _user_queued[user_id] >= MAX_QUEUE:
         raise QueueOverflowError("Слишком много задач в очереди, попробуй позже.")
-    fut = asyncio.get_running_loop().create_future()
-    q.append(fut)
-    if q[0] is fut:
-        fut.set_result(True)
-    else:
-        await fut
+    _user_queued[user_id] += 1
+
+def queued_total() -> int:
+    return sum(_user_queued.values())
 
 def dequeue(user_id: int):
-    q = _user_queues[user_id]
-    if q:
-        q.popleft()
-        if q:
-            q[0].set_result(True)
+    left = _user_queued.get(user_id, 0) - 1
+    if left > 0:
+        _user_queued[user_id] = left
+    else:
+        _user_queued.pop(user_id, None)
@@ -0,0 +1,128 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import shutil
+from dataclasses import dataclass
+from importlib import metadata
+
+from app.core import proc, workspace
+
+logger = logging.getLogger(__name__)
+
+KNOWN = ("ffmpeg", "ffprobe", "gallery-dl", "spotdl")
+PACKAGES = ("yt-dlp", "aiogram")  # библиотеки внутри процесса: версия из метаданных, без импорта
+VERSION_ARGS = {"ffmpeg": ["-version"], "ffprobe": ["-version"]}  # остальные понимают --version
+VERSION_TIMEOUT_SEC = 30
+CACHE_PATH = os.path.join(workspace.ROOT, "binaries.json")
+VERSION_RE = re.compile(r"version\s+(\S+)", re.I)
+
+@dataclass
+class Binary:
+    name: str
+    path: str | None
+    version: str | None = None
+
+_paths: dict[str, str | None] = {}
+_found: dict[str, Binary] = {}
+
+def which(name: str) -> str | None:
+    # shutil.which обходит PATH с stat на каждый каталог: один раз на имя, discover() — заранее при старте
+    if name not in _paths:
+        _paths[name] = shutil.which(name)
+    return _paths[name]
+
+def available(name: str) -> bool:
+    return which(name) is not None
+
+def _fingerprint(path: str) -> list:
+    st = os.stat(path)
+    return [os.path.realpath(path), st.st_size, st.st_mtime_ns]
+
+def _load_cache() -> dict:
+    try:
+        with open(CACHE_PATH, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _save_cache(cache: dict):
+    os.makedirs(os.path.dirname(CACHE_PATH), exist_ok=True)
+    tmp = CACHE_PATH + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(cache, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, CACHE_PATH)
+
+def _parse_version(output: str) -> str | None:
+    first = output.strip().splitlines()[0] if output.strip() else ""
+    m = VERSION_RE.search(first)
+    return (m.group(1) if m else first)[:80] or None
+
+async def _version(name: str, path: str) -> str | None:
+    try:
+        res = await proc.run([path, *VERSION_ARGS.get(name, ["--version"])],
+                             timeout=VERSION_TIMEOUT_SEC, capture=True, check=False)
+    except Exception as e:
+        logger.warning(f"{name}: версию получить не удалось: {e}")
+        return None
+    return _parse_version(res.stdout) if res.returncode == 0 else None
+
+def _scan(names: tuple[str, ...]) -> tuple[dict[str, str | None], dict[str, list]]:
+    paths = {n: which(n) for n in names}
+    prints = {}
+    for name, path in paths.items():
+        if path:
+            try:
+                prints[name] = _fingerprint(path)
+            except OSError:
+                paths[name] = None
+    return paths, prints
+
+async def discover(names: tuple[str, ...] = KNOWN) -> dict[str, Binary]:
+    """
+    Один раз при старте находит внешние бинарники и их версии.
+
+    Версия запоминается в DOWNLOAD_DIR/binaries.json вместе с размером и mtime
+    файла и берётся оттуда, пока файл не изменился: gallery-dl и spotdl —
+    Python-скрипты, их --version на каждом перезапуске стоит секунды.
+    """
+    cache = await asyncio.to_thread(_load_cache)
+    paths, prints = await asyncio.to_thread(_scan, names)
+
+    async def _one(name: str) -> Binary:
+        path = paths[name]
+        if not path:
+            return Binary(name, None)
+        cached = cache.get(name) or {}
+        if cached.get("fingerprint") == prints[name]:
+            return Binary(name, path, cached.get("version"))
+        version = await _version(name, path)
+        cache[name] = {"fingerprint": prints[name], "version": version}
+        return Binary(name, path, version)
+
+    found = await asyncio.gather(*(_one(n) for n in names))
+    _found.update({b.name: b for b in found})
+    try:
+        await asyncio.to_thread(_save_cache, cache)
+    except OSError as e:
+        logger.warning(f"Кэш версий не сохранён: {e}")
+    logger.info(f"Внешние программы: {summary()}")
+    return dict(_found)
+
+def packages() -> dict[str, str | None]:
+    out = {}
+    for name in PACKAGES:
+        try:
+            out[name] = metadata.version(name)
+        except metadata.PackageNotFoundError:
+            out[name] = None
+    return out
+
+def summary() -> str:
+    parts = [
+        f"{b.name} {b.version or '?'}" if b.path else f"{b.name} нет"
+        for b in _found.values()
+    ]
+    parts += [f"{name} {version or 'нет'}" for name, version in packages().items()]
+    return ", ".join(parts)
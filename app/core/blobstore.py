@@ -0,0 +1,145 @@
+import hashlib
+import logging
+import os
+import threading
+
+from app.core.config import settings
+from app.core import workspace, metrics
+
+logger = logging.getLogger(__name__)
+
+BLOBS_DIR = os.path.join(workspace.ROOT, "blobs")
+NAME_SEP = "--"  # <хэш ключа>--<исходное имя файла>
+
+_lock = threading.Lock()
+_total_bytes: int | None = None
+_evicting = False
+
+def _key_hash(extractor: str, media_id: str, variant: str) -> str:
+    return hashlib.sha1(f"{extractor}\0{media_id}\0{variant}".encode()).hexdigest()
+
+def _shard(h: str) -> str:
+    return os.path.join(BLOBS_DIR, h[:2])
+
+def enabled() -> bool:
+    return settings.blob_cache_mb > 0
+
+def lookup(extractor: str, media_id: str, variant: str) -> str | None:
+    if not enabled():
+        return None
+    h = _key_hash(extractor, media_id, variant)
+    shard = _shard(h)
+    try:
+        names = [n for n in os.listdir(shard) if n.startswith(h)]
+    except FileNotFoundError:
+        names = []
+    metrics.cache_result("blob", variant.split("@")[0], bool(names))
+    if not names:
+        return None
+    path = os.path.join(shard, names[0])
+    try:
+        os.utime(path)  # mtime — время последнего обращения для LRU
+    except OSError:
+        return None
+    return path
+
+def checkout(extractor: str, media_id: str, variant: str, dst_dir: str, name: str | None = None) -> str | None:
+    # отдаёт копию-ссылку в каталог задачи: release() задачи не трогает сам блоб
+    path = lookup(extractor, media_id, variant)
+    if not path:
+        return None
+    original_name = os.path.basename(path).split(NAME_SEP, 1)[-1]
+    return workspace.link(path, dst_dir, name or original_name)
+
+def store(extractor: str, media_id: str, variant: str, src: str) -> str | None:
+    global _total_bytes
+    if not enabled():
+        return None
+    try:
+        size = os.path.getsize(src)
+    except OSError:
+        return None
+    if size == 0 or size > settings.blob_max_item_mb * 1024 * 1024:
+        return None
+
+    h = _key_hash(extractor, media_id, variant)
+    shard = _shard(h)
+    os.makedirs(shard, exist_ok=True)
+    # прежняя запись того же ключа (параллельный промах, повторный store) заменяется:
+    # её байты вычитаются, иначе счётчик растёт и вытеснение начинается раньше времени
+    replaced = 0
+    for old in (n for n in os.listdir(shard) if n.startswith(h)):
+        try:
+            replaced += os.path.getsize(os.path.join(shard, old))
+            os.remove(os.path.join(shard, old))
+        except OSError:
+            pass
+    dst = workspace.link(src, shard, f"{h}{NAME_SEP}{os.path.basename(src)}")
+
+    with _lock:
+        if _total_bytes is not None:
+            _total_bytes += size - replaced
+        over = _total_bytes is None or _total_bytes > settings.blob_cache_mb * 1024 * 1024
+    if over:
+        _schedule_evict()
+    return dst
+
+def _schedule_evict():
+    # обход кэша и удаление файлов — в отдельном потоке: store() вызывается из цикла событий
+    global _evicting
+    with _lock:
+        if _evicting:
+            return
+        _evicting = True
+    threading.Thread(target=_evict, name="blob-evict", daemon=True).start()
+
+def _scan() -> tuple[list[tuple[float, int, str]], int]:
+    entries, total = [], 0
+    for root, _, files in os.walk(BLOBS_DIR):
+        for f in files:
+            p = os.path.join(root, f)
+            try:
+                st = os.stat(p)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, p))
+            total += st.st_size
+    return entries, total
+
+def _evict():
+    # LRU по байтам: удаляем давно не использованные файлы, пока не уложимся в 90% бюджета
+    global _total_bytes, _evicting
+    try:
+        with _lock:
+            counted = _total_bytes
+        entries, total = _scan()
+        budget = settings.blob_cache_mb * 1024 * 1024
+        target = budget * 0.9 if total > budget else budget
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        with _lock:
+            # store() во время обхода прибавлял к счётчику: обход применяется как поправка к нему
+            if _total_bytes is None or counted is None:
+                _total_bytes = total
+            else:
+                _total_bytes += total - counted
+    finally:
+        _evicting = False
+    if removed:
+        logger.info(f"Blob cache: вытеснено файлов: {removed}, занято {total // (1024 * 1024)} MB")
+
+def usage_bytes() -> int:
+    global _total_bytes
+    with _lock:
+        if _total_bytes is None:
+            _total_bytes = _scan()[1]
+        return _total_bytes
+
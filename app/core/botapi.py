@@ -0,0 +1,46 @@
+import os
+
+from aiogram.client.telegram import PRODUCTION, TelegramAPIServer
+from aiogram.types import FSInputFile
+
+from app.core.config import settings
+from app.core import workspace
+
+LOCAL_SCHEME = "file://"
+
+def server() -> TelegramAPIServer:
+    # BOT_API_URL — свой telegram-bot-api (например http://127.0.0.1:8081); пусто — api.telegram.org
+    if not settings.bot_api_url:
+        return PRODUCTION
+    return TelegramAPIServer.from_base(settings.bot_api_url.rstrip("/"), is_local=settings.bot_api_local)
+
+def _files_dir() -> str:
+    # DOWNLOAD_DIR так, как его видит сервер Bot API (в другом контейнере путь может отличаться)
+    return settings.bot_api_files_dir or workspace.ROOT
+
+def server_path(path: str) -> str | None:
+    rel = os.path.relpath(os.path.abspath(path), workspace.ROOT)
+    if rel.startswith(".."):
+        return None
+    return os.path.join(_files_dir(), rel)
+
+def input_file(path: str) -> FSInputFile | str:
+    """
+    Файл для send*. С локальным сервером (BOT_API_LOCAL=1) — ссылка file://
+    на тот же файл: сервер читает его с диска сам, без multipart-копии по HTTP.
+    Путь не экранируется: telegram-bot-api берёт его как есть, без URL-декодирования.
+    Файлы вне DOWNLOAD_DIR сервер может не видеть — они загружаются как обычно.
+    """
+    if settings.bot_api_local:
+        mapped = server_path(path)
+        if mapped:
+            return LOCAL_SCHEME + mapped
+    return FSInputFile(path)
+
+def local_path(value) -> str | None:
+    # обратное преобразование для учёта байтов: file://-ссылка -> путь у бота
+    if not isinstance(value, str) or not value.startswith(LOCAL_SCHEME):
+        return None
+    path = value[len(LOCAL_SCHEME):]
+    rel = os.path.relpath(path, _files_dir())
+    return path if rel.startswith("..") else os.path.join(workspace.ROOT, rel)
@@ -1,7 +1,8 @@
 from sqlalchemy import select
 from sqlalchemy.exc import IntegrityError
 from app.core.db import Session
-from app.core.models import MediaCache
+from app.core.models import MediaCache, ContentCache, TikTokMusic
+from app.core import metrics
 
 async def get_cached_tg_file_id(session: Session, extractor: str, media_id: str, kind: str) -> str | None:
     q = await session.execute(
@@ -11,7 +12,9 @@ async def get_cached_tg_file_id(session: Session, extractor: str, media_id: str,
             MediaCache.kind == kind,
         )
     )
-    return q.scalar()
+    file_id = q.scalar()
+    metrics.cache_result("file_id", kind, file_id is not None)
+    return file_id
 
 async def upsert_cached_tg_file_id(
     session: Session,
@@ -50,3 +53,67 @@ async def upsert_cached_tg_file_id(
         await session.commit()
     except IntegrityError:
         await session.rollback()
+
+async def get_file_id_by_hash(session: Session, content_hash: str, kind: str) -> str | None:
+    q = await session.execute(
+        select(ContentCache.tg_file_id).where(
+            ContentCache.content_hash == content_hash,
+            ContentCache.kind == kind,
+        )
+    )
+    file_id = q.scalar()
+    metrics.cache_result("content", kind, file_id is not None)
+    return file_id
+
+async def upsert_file_id_by_hash(
+    session: Session,
+    *,
+    content_hash: str,
+    kind: str,
+    tg_file_id: str,
+    tg_file_unique_id: str,
+    size: int | None = None,
+) -> None:
+    existing_q = await session.execute(
+        select(ContentCache).where(
+            ContentCache.content_hash == content_hash,
+            ContentCache.kind == kind,
+        )
+    )
+    row = existing_q.scalar_one_or_none()
+    if row:
+        row.tg_file_id = tg_file_id
+        row.tg_file_unique_id = tg_file_unique_id
+        await session.commit()
+        return
+
+    session.add(ContentCache(
+        content_hash=content_hash,
+        kind=kind,
+        size=size,
+        tg_file_id=tg_file_id,
+        tg_file_unique_id=tg_file_unique_id,
+    ))
+    try:
+        await session.commit()
+    except IntegrityError:
+        await session.rollback()
+
+async def get_tiktok_music_id(session: Session, post_id: str) -> str | None:
+    q = await session.execute(select(TikTokMusic.music_id).where(TikTokMusic.post_id == post_id))
+    return q.scalar()
+
+async def remember_tiktok_music_id(session: Session, post_id: str, music_id: str) -> None:
+    existing_q = await session.execute(select(TikTokMusic).where(TikTokMusic.post_id == post_id))
+    row = existing_q.scalar_one_or_none()
+    if row:
+        if row.music_id != music_id:
+            row.music_id = music_id
+            await session.commit()
+        return
+
+    session.add(TikTokMusic(post_id=post_id, music_id=music_id))
+    try:
+        await session.commit()
+    except IntegrityError:
+        await session.rollback()
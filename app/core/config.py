@@ -1,23 +1,130 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+import logging
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+def _env_bool(name: str, default: str = "0") -> bool:
+    return (os.getenv(name, default) or "").strip().lower() in {"1", "true", "yes", "on"}
+
+def _proc_limits() -> dict[str, int]:
+    # "ffmpeg=4,gallery-dl=2"; ошибочная запись пропускается, а не роняет запуск
+    limits = {}
+    for item in filter(None, (x.strip() for x in (os.getenv("PROC_LIMITS") or "").split(","))):
+        name, _, value = item.partition("=")
+        try:
+            limit = int(value)
+        except ValueError:
+            limit = 0
+        if not name.strip() or limit < 1:
+            logger.warning(f"PROC_LIMITS: пропускаю некорректную запись {item!r}")
+            continue
+        limits[name.strip()] = limit
+    return limits
+
+# Облачный Bot API принимает файлы до 50 MB, локальный telegram-bot-api (--local) — до 2000 MB
+_DEFAULT_MAX_MB = "2000" if _env_bool("BOT_API_LOCAL") else "48"
+
 @dataclass
 class Settings:
     bot_token: str = os.getenv("BOT_TOKEN", "")
     database_url: str = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./bot.db")
 
-    max_mb: int = int(os.getenv("MAX_MB", "48"))
+    max_mb: int = int(os.getenv("MAX_MB") or _DEFAULT_MAX_MB)  # пустое MAX_MB= — тоже значение по умолчанию
     trim_minutes: int = int(os.getenv("TRIM_MINUTES", "2"))
     ytdlp_timeout: int = int(os.getenv("YTDLP_TIMEOUT", "180"))
 
+    # Рабочий каталог загрузок: у каждой задачи свой подкаталог в DOWNLOAD_DIR/jobs
+    download_dir: str = os.getenv("DOWNLOAD_DIR", "./data")
+    download_quota_mb: int = int(os.getenv("DOWNLOAD_QUOTA_MB", "10240"))  # 0 — без ограничения
+    job_dir_max_age_sec: int = int(os.getenv("JOB_DIR_MAX_AGE_SEC", "3600"))
+    janitor_interval_sec: int = int(os.getenv("JANITOR_INTERVAL_SEC", "600"))
+
+    # Локальный кэш скачанных файлов (DOWNLOAD_DIR/blobs), вытеснение LRU по байтам; 0 — выключен
+    blob_cache_mb: int = int(os.getenv("BLOB_CACHE_MB", "2048"))
+    # не следует за MAX_MB: с BOT_API_LOCAL=1 один файл до 2000 MB вытеснил бы весь кэш
+    blob_max_item_mb: int = int(os.getenv("BLOB_MAX_ITEM_MB", "48"))
+
+    # Процессы для подготовки превью картинок (Pillow); 0 — по числу CPU
+    image_workers: int = int(os.getenv("IMAGE_WORKERS", "2"))
+
+    # Одновременных процессов на бинарник, например "ffmpeg=4,gallery-dl=2" (остальные — по умолчанию)
+    proc_limits: dict[str, int] = field(default_factory=_proc_limits)
+
     ffmpeg_path: str | None = (os.getenv("FFMPEG_PATH") or "").strip() or None
     instagram_cookies: str | None = (os.getenv("INSTAGRAM_COOKIES") or "").strip() or None
+    # Прокси для обращений к платформам: yt-dlp, gallery-dl и httpx (http://host:port)
+    download_proxy: str | None = (os.getenv("DOWNLOAD_PROXY") or "").strip() or None
+
+    # Spotify: spotdl работает внутри процесса; пусто — ключи по умолчанию из spotdl
+    spotify_client_id: str | None = (os.getenv("SPOTIFY_CLIENT_ID") or "").strip() or None
+    spotify_client_secret: str | None = (os.getenv("SPOTIFY_CLIENT_SECRET") or "").strip() or None
+    spotify_threads: int = int(os.getenv("SPOTIFY_THREADS", "3"))        # параллельных загрузок треков
+    spotify_max_tracks: int = int(os.getenv("SPOTIFY_MAX_TRACKS", "50"))  # треков из альбома/плейлиста
+
+    # Сколько тяжёлых загрузок выполняется одновременно (на процесс)
+    max_concurrent_jobs: int = int(os.getenv("MAX_CONCURRENT_JOBS", "4"))
+
+    # Защита от перегрузки: выше мягкого порога — только кэш, выше жёсткого — отказ
+    soft_inflight: int = int(os.getenv("SOFT_INFLIGHT", "20"))
+    hard_inflight: int = int(os.getenv("HARD_INFLIGHT", "50"))
+    soft_queue_depth: int = int(os.getenv("SOFT_QUEUE_DEPTH", "10"))
+    hard_queue_depth: int = int(os.getenv("HARD_QUEUE_DEPTH", "40"))
+    soft_free_disk_mb: int = int(os.getenv("SOFT_FREE_DISK_MB", "2048"))
+    hard_free_disk_mb: int = int(os.getenv("HARD_FREE_DISK_MB", "512"))
+
+    # Лимиты Bot API на отправку сообщений
+    tg_global_rate: float = float(os.getenv("TG_GLOBAL_RATE", "30"))      # сообщений в секунду на бота
+    tg_chat_rate: float = float(os.getenv("TG_CHAT_RATE", "1"))           # сообщений в секунду в личный чат
+    tg_group_per_min: float = float(os.getenv("TG_GROUP_PER_MIN", "20"))  # сообщений в минуту в группу
+
+    # Свой сервер telegram-bot-api: BOT_API_URL=http://host:8081. BOT_API_LOCAL=1 — сервер
+    # запущен с --local: файлы отправляются по пути (file://), лимит файла 2000 MB.
+    # BOT_API_FILES_DIR — DOWNLOAD_DIR, как его видит сервер, если смонтирован по другому пути
+    bot_api_url: str | None = (os.getenv("BOT_API_URL") or "").strip() or None
+    bot_api_local: bool = _env_bool("BOT_API_LOCAL")
+    bot_api_files_dir: str | None = (os.getenv("BOT_API_FILES_DIR") or "").strip() or None
+
+    # Соединения с Bot API: размер пула, keep-alive и общий таймаут запроса
+    tg_pool_limit: int = int(os.getenv("TG_POOL_LIMIT", "100"))
+    tg_keepalive_sec: float = float(os.getenv("TG_KEEPALIVE_SEC", "30"))
+    tg_request_timeout_sec: float = float(os.getenv("TG_REQUEST_TIMEOUT_SEC", "60"))
+
+    # Производительный режим: uvloop и orjson, если установлены (pip install uvloop orjson)
+    fast_runtime: bool = _env_bool("FAST_RUNTIME")
+
+    # HTTP-эндпоинт /metrics в формате Prometheus; 0 — выключен
+    metrics_host: str = os.getenv("METRICS_HOST", "127.0.0.1")
+    metrics_port: int = int(os.getenv("METRICS_PORT", "0"))
+
+    # Трассировка запросов: в таблицу request_traces попадает доля TRACE_SAMPLE_RATE
+    # и все запросы дольше TRACE_SLOW_SEC (0 — только выборка); LOG_JSON=1 — логи в JSON
+    trace_sample_rate: float = float(os.getenv("TRACE_SAMPLE_RATE", "0.05"))
+    trace_slow_sec: float = float(os.getenv("TRACE_SLOW_SEC", "15"))
+    log_json: bool = _env_bool("LOG_JSON")
+
+    # Сторож цикла событий: блокировка дольше порога пишется в лог со стеком; 0 — выключен.
+    # LOOP_DEBUG=1 дополнительно включает отладочный режим asyncio (медленные колбэки)
+    loop_lag_threshold_ms: int = int(os.getenv("LOOP_LAG_THRESHOLD_MS", "250"))
+    loop_debug: bool = _env_bool("LOOP_DEBUG")
+
+    admin_ids: tuple[int, ...] = tuple(
+        int(x) for x in (os.getenv("ADMIN_IDS") or "").replace(" ", "").split(",") if x
+    )
+
+    # Очередь задач: фронтенд кладёт ссылки в таблицу jobs, worker.py их выполняет
+    job_queue: bool = _env_bool("JOB_QUEUE")
+    worker_concurrency: int = int(os.getenv("WORKER_CONCURRENCY", "2"))
+    job_lease_sec: int = int(os.getenv("JOB_LEASE_SEC", "120"))
+    job_max_attempts: int = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
 
     def __post_init__(self):
         if not self.bot_token:
             raise ValueError("BOT_TOKEN не установлен! Создайте файл .env с вашим токеном бота.")
+        if self.bot_api_local and not self.bot_api_url:
+            raise ValueError("BOT_API_LOCAL=1 работает только со своим сервером: задайте BOT_API_URL.")
 
 settings = Settings()
@@ -1,10 +1,30 @@
+import time
+
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncAttrs
 from sqlalchemy.orm import DeclarativeBase
 from app.core.config import settings
+from app.core import metrics
 
 engine = create_async_engine(settings.database_url, future=True, echo=False, pool_pre_ping=True)
 Session = async_sessionmaker(engine, expire_on_commit=False)
 
+WRITE_STATEMENTS = ("INSERT", "UPDATE", "DELETE", "REPLACE")
+
+@event.listens_for(engine.sync_engine, "before_cursor_execute")
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._metrics_started = time.perf_counter()
+
+@event.listens_for(engine.sync_engine, "after_cursor_execute")
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    # отметка живёт в контексте выполнения: при ошибке запроса убирать нечего
+    started = getattr(context, "_metrics_started", None)
+    if started is None:
+        return
+    stage = "db_write" if statement.lstrip()[:7].upper().startswith(WRITE_STATEMENTS) else "db_read"
+    metrics.observe_stage(stage, time.perf_counter() - started)
+
 class Base(AsyncAttrs, DeclarativeBase):
     pass
 
@@ -0,0 +1,45 @@
+import httpx
+
+from app.core.config import settings
+from app.core import metrics
+
+DEFAULT_HEADERS = {"User-Agent": "Mozilla/5.0"}
+CHUNK_SIZE = 1024 * 1024
+
+_client: httpx.AsyncClient | None = None
+
+def client() -> httpx.AsyncClient:
+    # один пул соединений на процесс: keep-alive к CDN переиспользуется между загрузками
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            follow_redirects=True,
+            headers=DEFAULT_HEADERS,
+            timeout=httpx.Timeout(30, connect=10),
+            limits=httpx.Limits(max_connections=64, max_keepalive_connections=16),
+            proxy=settings.download_proxy,
+        )
+    return _client
+
+async def fetch_to(url: str, path: str, max_bytes: int | None = None, headers: dict | None = None) -> httpx.Headers:
+    # потоковая загрузка в файл; возвращает заголовки ответа (Content-Type и т.п.)
+    size = 0
+    try:
+        with metrics.stage("download"):
+            async with client().stream("GET", url, headers=headers) as r:
+                r.raise_for_status()
+                with open(path, "wb") as f:
+                    async for chunk in r.aiter_bytes(CHUNK_SIZE):
+                        size += len(chunk)
+                        if max_bytes is not None and size > max_bytes:
+                            raise RuntimeError("File too large")
+                        f.write(chunk)
+                return r.headers
+    finally:
+        metrics.add_bytes("download", size)
+
+async def close():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
@@ -0,0 +1,84 @@
+import asyncio
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from app.core.config import settings
+from app.core import blobstore
+from app.utils import file_hash
+
+logger = logging.getLogger(__name__)
+
+# Лимиты sendPhoto: до 10 MB, сумма сторон до 10000, соотношение сторон до 20
+PHOTO_MAX_BYTES = 10 * 1024 * 1024
+PHOTO_MAX_SIDE_SUM = 10000
+PHOTO_MAX_RATIO = 20
+PREVIEW_MAX_SIDE = 2560  # больше Telegram всё равно не показывает
+JPEG_QUALITIES = (87, 80, 70, 60)
+
+_pool: ProcessPoolExecutor | None = None
+
+def make_preview(src: str, dst: str) -> str | None:
+    """
+    Готовит фото для sendPhoto: JPEG не больше PREVIEW_MAX_SIDE по длинной
+    стороне и не тяжелее PHOTO_MAX_BYTES. Возвращает src, если файл уже
+    подходит, и None, если картинку можно отправить только документом.
+    Выполняется в процессе пула: файл декодируется один раз.
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(src) as im:
+        w, h = im.size
+        if max(w, h) / max(1, min(w, h)) > PHOTO_MAX_RATIO:
+            return None
+        if (im.format == "JPEG" and max(w, h) <= PREVIEW_MAX_SIDE and w + h <= PHOTO_MAX_SIDE_SUM
+                and os.path.getsize(src) <= PHOTO_MAX_BYTES and im.getexif().get(0x0112, 1) == 1):
+            return src
+
+        im.draft("RGB", (PREVIEW_MAX_SIDE, PREVIEW_MAX_SIDE))  # JPEG декодируется сразу в уменьшенном масштабе
+        img = ImageOps.exif_transpose(im)
+        if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+            rgba = img.convert("RGBA")
+            img = Image.new("RGB", rgba.size, "white")
+            img.paste(rgba, mask=rgba.getchannel("A"))
+        elif img.mode != "RGB":
+            img = img.convert("RGB")
+        img.thumbnail((PREVIEW_MAX_SIDE, PREVIEW_MAX_SIDE), Image.LANCZOS)
+
+        for quality in JPEG_QUALITIES:
+            img.save(dst, "JPEG", quality=quality, optimize=True, progressive=True)
+            if os.path.getsize(dst) <= PHOTO_MAX_BYTES:
+                return dst
+    return None
+
+def _executor() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=settings.image_workers or None)
+    return _pool
+
+async def photo_preview(src: str, out_dir: str) -> str | None:
+    # результат кэшируется по хэшу содержимого: одна и та же картинка перекодируется один раз
+    digest = await asyncio.to_thread(file_hash, src)
+    name = os.path.splitext(os.path.basename(src))[0] + ".jpg"
+    cached = blobstore.checkout("preview", digest, "jpeg", out_dir, name)
+    if cached:
+        return cached
+
+    try:
+        result = await asyncio.get_running_loop().run_in_executor(
+            _executor(), make_preview, src, os.path.join(out_dir, name)
+        )
+    except Exception as e:
+        logger.warning(f"Превью {os.path.basename(src)} не подготовлено: {e}")
+        return src if os.path.getsize(src) <= PHOTO_MAX_BYTES else None
+
+    if result and result != src:
+        blobstore.store("preview", digest, "jpeg", result)
+    return result
+
+def shutdown():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
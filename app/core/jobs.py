@@ -0,0 +1,180 @@
+import os
+import socket
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select, update, func, or_, and_
+
+from app.core.db import Session
+from app.core.models import Job
+
+ACTIVE_STATUSES = ("queued", "running")
+
+@dataclass
+class JobRun:
+    # одна попытка задачи воркером; delivered — сколько сообщений с медиа уже ушло пользователю
+    job_id: int
+    delivered: int = 0
+
+_current_run: ContextVar[JobRun | None] = ContextVar("job_run", default=None)
+
+@contextmanager
+def running(run: JobRun):
+    # внутри задачи обработчики не отвечают об ошибке сами, а пробрасывают её воркеру
+    token = _current_run.set(run)
+    try:
+        yield run
+    finally:
+        _current_run.reset(token)
+
+def current_run() -> JobRun | None:
+    return _current_run.get()
+
+def mark_delivered():
+    run = _current_run.get()
+    if run is not None:
+        run.delivered += 1
+
+def _now() -> datetime:
+    # naive UTC: одинаково сравнивается и в SQLite, и в Postgres (DateTime без tz)
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def _claimable(now: datetime):
+    # свободная задача или задача, чей воркер умер и не продлил аренду
+    return and_(
+        Job.attempts < Job.max_attempts,
+        or_(
+            Job.status == "queued",
+            and_(Job.status == "running", Job.lease_until < now),
+        ),
+    )
+
+async def enqueue_job(
+    *,
+    url: str,
+    chat_id: int,
+    user_tg_id: int,
+    message_json: str,
+    status_message_id: int | None = None,
+    max_attempts: int = 3,
+) -> int:
+    async with Session() as s:
+        job = Job(
+            url=url,
+            chat_id=chat_id,
+            user_tg_id=user_tg_id,
+            message=message_json,
+            status_message_id=status_message_id,
+            max_attempts=max_attempts,
+        )
+        s.add(job)
+        await s.commit()
+        return job.id
+
+async def count_active_jobs(user_tg_id: int) -> int:
+    async with Session() as s:
+        q = await s.execute(
+            select(func.count()).select_from(Job).where(
+                Job.user_tg_id == user_tg_id,
+                Job.status.in_(ACTIVE_STATUSES),
+            )
+        )
+        return q.scalar() or 0
+
+async def has_active_job(user_tg_id: int, url: str) -> bool:
+    async with Session() as s:
+        q = await s.execute(
+            select(Job.id).where(
+                Job.user_tg_id == user_tg_id,
+                Job.url == url,
+                Job.status.in_(ACTIVE_STATUSES),
+            ).limit(1)
+        )
+        return q.scalar() is not None
+
+async def claim_job(owner: str, lease_sec: int) -> Job | None:
+    now = _now()
+    async with Session() as s:
+        candidates = (await s.execute(
+            select(Job.id).where(_claimable(now)).order_by(Job.id).limit(5)
+        )).scalars().all()
+
+        for job_id in candidates:
+            # оптимистичная блокировка: забираем задачу, только если её не успел взять другой воркер
+            res = await s.execute(
+                update(Job)
+                .where(Job.id == job_id, _claimable(now))
+                .values(
+                    status="running",
+                    lease_owner=owner,
+                    lease_until=now + timedelta(seconds=lease_sec),
+                    attempts=Job.attempts + 1,
+                    updated_at=now,
+                )
+            )
+            await s.commit()
+            if res.rowcount == 1:
+                return await s.get(Job, job_id)
+    return None
+
+async def renew_lease(job_id: int, owner: str, lease_sec: int) -> bool:
+    now = _now()
+    async with Session() as s:
+        res = await s.execute(
+            update(Job)
+            .where(Job.id == job_id, Job.lease_owner == owner, Job.status == "running")
+            .values(lease_until=now + timedelta(seconds=lease_sec), updated_at=now)
+        )
+        await s.commit()
+        return res.rowcount == 1
+
+async def complete_job(job_id: int, owner: str) -> None:
+    async with Session() as s:
+        await s.execute(
+            update(Job)
+            .where(Job.id == job_id, Job.lease_owner == owner)
+            .values(status="done", lease_until=None, error=None, updated_at=_now())
+        )
+        await s.commit()
+
+async def fail_job(job_id: int, owner: str, error: str) -> bool:
+    # True — задача вернулась в очередь для повторной попытки
+    async with Session() as s:
+        job = await s.get(Job, job_id)
+        if not job or job.lease_owner != owner:
+            return False
+        retry = job.attempts < job.max_attempts
+        job.status = "queued" if retry else "failed"
+        job.lease_owner = None
+        job.lease_until = None
+        job.error = error[:2000]
+        job.updated_at = _now()
+        await s.commit()
+        return retry
+
+async def reap_dead_jobs() -> list[Job]:
+    # задачи, брошенные упавшими воркерами и исчерпавшие попытки, помечаются failed
+    now = _now()
+    dead_cond = and_(
+        Job.status == "running",
+        Job.lease_until < now,
+        Job.attempts >= Job.max_attempts,
+    )
+    reaped: list[Job] = []
+    async with Session() as s:
+        dead = (await s.execute(select(Job).where(dead_cond))).scalars().all()
+        for job in dead:
+            res = await s.execute(
+                update(Job)
+                .where(Job.id == job.id, dead_cond)
+                .values(status="failed", error=job.error or "lease expired", updated_at=now)
+            )
+            if res.rowcount == 1:
+                reaped.append(job)
+        await s.commit()
+    return reaped
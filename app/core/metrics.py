@@ -0,0 +1,234 @@
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable
+
+from app.core import tracing
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин в секундах: от запроса к БД до многоминутной загрузки
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+_registry: list = []
+_lock = threading.Lock()  # наблюдения приходят и из потоков executor
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _fmt_labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _fmt_value(v: float) -> str:
+    return str(int(v)) if float(v).is_integer() else repr(float(v))
+
+class _Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        _registry.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def _header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+
+class Counter(_Metric):
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def collect(self) -> list[str]:
+        with _lock:
+            items = sorted(self._values.items())
+        return self._header() + [f"{self.name}{_fmt_labels(self.labelnames, k)} {_fmt_value(v)}" for k, v in items]
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = (), buckets: tuple[float, ...] = STAGE_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values: dict[tuple, list] = {}  # ключ -> [счётчики корзин..., +Inf, sum]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with _lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            row[i] += 1
+            row[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def collect(self) -> list[str]:
+        with _lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        lines = self._header()
+        for key, row in items:
+            cumulative = 0
+            for le, n in zip(self.buckets + (float("inf"),), row[:-1]):
+                cumulative += n
+                bound = "+Inf" if le == float("inf") else repr(le)
+                le_label = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, key, le_label)} {cumulative}")
+            labels = _fmt_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_fmt_value(row[-1])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+class Callback(_Metric):
+    """
+    Значение, вычисляемое в момент опроса: глубины очередей, занятость пулов,
+    счётчики, которые уже ведёт сам модуль (proc.stats).
+
+    fn возвращает число либо словарь {значения меток: число}.
+    """
+
+    def __init__(self, name: str, help: str, fn: Callable, labelnames: tuple[str, ...] = (), type: str = "gauge"):
+        super().__init__(name, help, labelnames)
+        self.fn = fn
+        self.type = type
+
+    def collect(self) -> list[str]:
+        try:
+            value = self.fn()
+        except Exception as e:
+            logger.debug(f"Метрика {self.name} не собрана: {e}")
+            return []
+        items = sorted(value.items()) if isinstance(value, dict) else [((), value)]
+        lines = self._header()
+        for key, v in items:
+            key = key if isinstance(key, tuple) else (key,)
+            lines.append(f"{self.name}{_fmt_labels(self.labelnames, key)} {_fmt_value(v)}")
+        return lines
+
+def render() -> str:
+    lines: list[str] = []
+    for metric in _registry:
+        lines.extend(metric.collect())
+    return "\n".join(lines) + "\n"
+
+# --- метрики горячего пути ---
+
+stage_seconds = Histogram(
+    "bot_stage_seconds",
+    "Длительность этапов обработки: redirect, extract_info, download, ffmpeg, upload, db_write, db_read",
+    ("stage",),
+)
+cache_requests = Counter(
+    "bot_cache_requests_total",
+    "Обращения к кэшам: layer=file_id|content|blob, result=hit|miss",
+    ("layer", "kind", "result"),
+)
+transfer_bytes = Counter(
+    "bot_transfer_bytes_total",
+    "Байт скачано с платформ (download) и загружено в Telegram (upload)",
+    ("direction",),
+)
+subprocess_seconds = Histogram(
+    "bot_subprocess_seconds",
+    "Время работы внешних процессов",
+    ("binary",),
+)
+
+# хелперы ниже пишут и в метрики процесса, и в трассировку текущего запроса
+
+def observe_stage(name: str, seconds: float):
+    stage_seconds.observe(seconds, stage=name)
+    tracing.add_stage(name, seconds)
+
+@contextmanager
+def stage(name: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(name, time.perf_counter() - started)
+
+def cache_result(layer: str, kind: str, hit: bool):
+    result = "hit" if hit else "miss"
+    cache_requests.inc(layer=layer, kind=kind, result=result)
+    tracing.note_cache(layer, kind, result)
+
+def add_bytes(direction: str, n: int):
+    transfer_bytes.inc(n, direction=direction)
+    tracing.add_bytes(direction, n)
+
+# --- мгновенные значения: модули импортируются при опросе, чтобы не было циклов ---
+
+def _antispam_queued() -> int:
+    from app.core import antispam
+    return antispam.queued_total()
+
+def _scheduler() -> dict:
+    from app.core.scheduler import scheduler
+    return {"running": scheduler.running, "waiting": scheduler.waiting, "slots": scheduler.slots}
+
+def _inflight() -> int:
+    from app.core import admission
+    return admission.inflight()
+
+def _executor() -> dict:
+    from app.core import admission
+    return admission.executor_usage()
+
+def _proc(field: str) -> Callable[[], dict]:
+    def _collect():
+        from app.core import proc
+        return {binary: st[field] for binary, st in proc.stats.items()}
+    return _collect
+
+Callback("bot_antispam_queued", "Задач, ожидающих в очереди antispam (по всем пользователям)", _antispam_queued)
+Callback("bot_scheduler_slots", "Слоты планировщика тяжёлых загрузок", _scheduler, ("state",))
+Callback("bot_inflight_requests", "Запросов в обработке", _inflight)
+Callback("bot_executor_threads", "Пул потоков по умолчанию: busy, max и длина очереди (backlog)", _executor, ("state",))
+Callback("bot_subprocess_running", "Работающих внешних процессов", _proc("running"), ("binary",))
+Callback("bot_subprocess_waiting", "Процессов, ждущих лимита PROC_LIMITS", _proc("waiting"), ("binary",))
+Callback("bot_subprocess_failed_total", "Процессов, завершившихся с ошибкой", _proc("failed"), ("binary",), type="counter")
+Callback("bot_subprocess_timeouts_total", "Процессов, убитых по таймауту", _proc("timeouts"), ("binary",), type="counter")
+
+async def serve(host: str, port: int):
+    """
+    Поднимает HTTP-сервер с GET /metrics для локального сборщика (Prometheus,
+    vmagent). Возвращает web.AppRunner: при остановке вызвать cleanup().
+    """
+    from aiohttp import web
+
+    async def _handle(request: web.Request) -> web.Response:
+        return web.Response(
+            body=render().encode(),
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+        )
+
+    app = web.Application()
+    app.router.add_get("/metrics", _handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Метрики: http://{host}:{port}/metrics")
+    return runner
@@ -1,5 +1,5 @@
 from sqlalchemy.orm import Mapped, mapped_column, relationship
-from sqlalchemy import Integer, String, BigInteger, DateTime, ForeignKey, Text, Index, UniqueConstraint
+from sqlalchemy import Integer, String, BigInteger, DateTime, ForeignKey, Text, Index, UniqueConstraint, Float
 from datetime import datetime, timedelta, timezone
 from app.core.db import Base
 
@@ -63,6 +63,66 @@ class MediaCache(Base):
         Index("ix_media_cache_lookup", "extractor", "media_id", "kind"),
     )
 
+class ContentCache(Base):
+    __tablename__ = "content_cache"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+
+    content_hash: Mapped[str] = mapped_column(String(64))   # blake2b-256 содержимого файла
+    kind: Mapped[str] = mapped_column(String(16))
+    size: Mapped[int | None] = mapped_column(BigInteger)
+
+    tg_file_id: Mapped[str] = mapped_column(String(512))
+    tg_file_unique_id: Mapped[str] = mapped_column(String(256))
+
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+    __table_args__ = (
+        UniqueConstraint("content_hash", "kind", name="uq_content_cache_key"),
+    )
+
+class TikTokMusic(Base):
+    # пост TikTok -> id его звука: звук, взятый из кэша по ключу поста, пополняет и кэш music:<id>
+    __tablename__ = "tiktok_music"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    post_id: Mapped[str] = mapped_column(String(64), unique=True, index=True)
+    music_id: Mapped[str] = mapped_column(String(64))
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+class ExtractorStat(Base):
+    __tablename__ = "extractor_stats"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    extractor: Mapped[str] = mapped_column(String(32))
+    kind: Mapped[str] = mapped_column(String(16))
+
+    samples: Mapped[int] = mapped_column(Integer, default=0)
+    bytes_per_media_sec: Mapped[float | None] = mapped_column(Float)   # EWMA битрейта результата
+    bytes_per_wall_sec: Mapped[float | None] = mapped_column(Float)    # EWMA скорости загрузки
+
+    # точность прогнозов: сумма относительных ошибок |прогноз - факт| / факт
+    predictions: Mapped[int] = mapped_column(Integer, default=0)
+    bytes_err_sum: Mapped[float] = mapped_column(Float, default=0.0)
+    seconds_err_sum: Mapped[float] = mapped_column(Float, default=0.0)
+
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+    __table_args__ = (
+        UniqueConstraint("extractor", "kind", name="uq_extractor_stats_key"),
+    )
+
+class SpotifyMatch(Base):
+    __tablename__ = "spotify_matches"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    spotify_id: Mapped[str] = mapped_column(String(64), unique=True, index=True)
+    youtube_url: Mapped[str | None] = mapped_column(String(256))   # найденное соответствие на YouTube
+    meta: Mapped[str] = mapped_column(Text)                         # Song.json от spotdl
+
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=lambda: datetime.now(timezone.utc))
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=lambda: datetime.now(timezone.utc))
+
 class Token(Base):
     __tablename__ = "tokens"
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
@@ -72,3 +132,41 @@ class Token(Base):
     expires_at: Mapped[datetime] = mapped_column(DateTime, index=True)
 
 Index("ix_tokens_ns_token", Token.ns, Token.token, unique=True)
+
+class Job(Base):
+    __tablename__ = "jobs"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    url: Mapped[str] = mapped_column(Text)
+    chat_id: Mapped[int] = mapped_column(BigInteger)
+    user_tg_id: Mapped[int] = mapped_column(BigInteger, index=True)
+    message: Mapped[str] = mapped_column(Text)                        # исходное сообщение (JSON), чтобы ответить из воркера
+    status_message_id: Mapped[int | None] = mapped_column(BigInteger) # "Загружаю медиа..." — удаляется по завершении
+    status: Mapped[str] = mapped_column(String(16), default="queued") # queued|running|done|failed
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    max_attempts: Mapped[int] = mapped_column(Integer, default=3)
+    lease_owner: Mapped[str | None] = mapped_column(String(128))
+    lease_until: Mapped[datetime | None] = mapped_column(DateTime)
+    error: Mapped[str | None] = mapped_column(Text)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=lambda: datetime.now(timezone.utc))
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+    __table_args__ = (
+        Index("ix_jobs_claim", "status", "lease_until", "id"),
+    )
+
+class RequestTrace(Base):
+    # выборка запросов (TRACE_SAMPLE_RATE) и все медленные (TRACE_SLOW_SEC); смотреть: python traces.py
+    __tablename__ = "request_traces"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    request_id: Mapped[str] = mapped_column(String(32), index=True)
+    ts: Mapped[datetime] = mapped_column(DateTime, default=lambda: datetime.now(timezone.utc), index=True)
+    user_id: Mapped[int | None] = mapped_column(BigInteger)   # Telegram ID
+    url: Mapped[str | None] = mapped_column(Text)
+    handler: Mapped[str] = mapped_column(String(32))
+    strategy: Mapped[str | None] = mapped_column(String(64))  # какой send_* обработал запрос
+    total_sec: Mapped[float] = mapped_column(Float, index=True)
+    stages: Mapped[str] = mapped_column(Text)                 # JSON {этап: секунды}
+    cache: Mapped[str | None] = mapped_column(Text)           # JSON {"слой:kind": hit|miss}
+    bytes_down: Mapped[int] = mapped_column(BigInteger, default=0)
+    bytes_up: Mapped[int] = mapped_column(BigInteger, default=0)
+    error: Mapped[str | None] = mapped_column(String(128))    # класс исключения
@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import os
+import signal
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable
+
+from app.core.config import settings
+from app.core import metrics
+
+logger = logging.getLogger(__name__)
+
+# Сколько процессов каждого бинарника может работать одновременно (PROC_LIMITS переопределяет)
+DEFAULT_LIMITS = {
+    "ffmpeg": max(2, os.cpu_count() or 2),
+    "ffprobe": 8,
+    "gallery-dl": 4,
+    "spotdl": 2,
+}
+DEFAULT_LIMIT = 4
+FFMPEG_BINARIES = ("ffmpeg", "ffprobe")  # их время попадает в этап ffmpeg
+STDERR_TAIL_LINES = 40
+LINE_LIMIT = 16 * 1024 * 1024  # gallery-dl -j печатает большие JSON-строки
+
+_sems: dict[str, asyncio.Semaphore] = {}
+stats: dict[str, dict[str, float]] = {}
+
+class ProcError(RuntimeError):
+    def __init__(self, binary: str, returncode: int, stderr: str):
+        super().__init__(f"{binary} exited with {returncode}: {stderr[-500:]}")
+        self.returncode = returncode
+        self.stderr = stderr
+
+class ProcTimeout(ProcError): ...
+
+@dataclass
+class ProcResult:
+    returncode: int
+    stdout: str
+    stderr: str
+
+def _limit(binary: str) -> int:
+    return settings.proc_limits.get(binary) or DEFAULT_LIMITS.get(binary, DEFAULT_LIMIT)
+
+def _sem(binary: str) -> asyncio.Semaphore:
+    sem = _sems.get(binary)
+    if sem is None:
+        sem = _sems[binary] = asyncio.Semaphore(_limit(binary))
+    return sem
+
+def _stat(binary: str) -> dict[str, float]:
+    return stats.setdefault(binary, {"launches": 0, "running": 0, "waiting": 0, "failed": 0, "timeouts": 0, "seconds": 0.0})
+
+def _kill(proc: asyncio.subprocess.Process):
+    # процесс запущен в своей группе: убиваем и его потомков (ffmpeg из yt-dlp, python из spotdl)
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+async def run(
+    args: list[str],
+    *,
+    timeout: float | None = None,
+    cwd: str | None = None,
+    on_line: Callable[[str], None] | None = None,
+    capture: bool = False,
+    check: bool = True,
+) -> ProcResult:
+    """
+    Запускает внешний бинарник без занятия потока из пула.
+
+    stdout читается построчно: каждая строка передаётся в on_line и, если
+    capture, собирается в ProcResult.stdout. Из stderr хранится хвост для
+    сообщения об ошибке. По таймауту или отмене убивается вся группа
+    процессов. Одновременно работает не больше _limit(binary) процессов.
+    """
+    binary = os.path.basename(args[0])
+    st = _stat(binary)
+    st["waiting"] += 1
+    async with _sem(binary):
+        st["waiting"] -= 1
+        st["launches"] += 1
+        st["running"] += 1
+        started = time.monotonic()
+        out_lines: list[str] = []
+        err_tail: deque[str] = deque(maxlen=STDERR_TAIL_LINES)
+
+        async def _pump_stdout(stream: asyncio.StreamReader):
+            async for raw in stream:
+                line = raw.decode(errors="replace").rstrip("\r\n")
+                if on_line:
+                    on_line(line)
+                if capture:
+                    out_lines.append(line)
+
+        async def _pump_stderr(stream: asyncio.StreamReader):
+            async for raw in stream:
+                err_tail.append(raw.decode(errors="replace").rstrip("\r\n"))
+
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                *args,
+                cwd=cwd,
+                stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE if (capture or on_line) else asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.PIPE,
+                start_new_session=True,
+                limit=LINE_LIMIT,
+            )
+            pumps = [_pump_stderr(proc.stderr)]
+            if proc.stdout is not None:
+                pumps.append(_pump_stdout(proc.stdout))
+            try:
+                await asyncio.wait_for(asyncio.gather(*pumps, proc.wait()), timeout)
+            except asyncio.TimeoutError:
+                _kill(proc)
+                await proc.wait()
+                st["timeouts"] += 1
+                raise ProcTimeout(binary, proc.returncode, f"timed out after {timeout}s\n" + "\n".join(err_tail))
+            except BaseException:
+                # отмена: процесс тоже дожидаемся, иначе останется зомби с открытым транспортом
+                _kill(proc)
+                await proc.wait()
+                raise
+        finally:
+            elapsed = time.monotonic() - started
+            st["running"] -= 1
+            st["seconds"] += elapsed
+            metrics.subprocess_seconds.observe(elapsed, binary=binary)
+            if binary in FFMPEG_BINARIES:
+                metrics.observe_stage("ffmpeg", elapsed)
+
+    result = ProcResult(proc.returncode, "\n".join(out_lines), "\n".join(err_tail))
+    if result.returncode != 0:
+        st["failed"] += 1
+        if check:
+            raise ProcError(binary, result.returncode, result.stderr)
+    return result
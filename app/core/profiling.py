@@ -0,0 +1,213 @@
+import asyncio
+import io
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+
+from app.core import workspace
+
+logger = logging.getLogger(__name__)
+
+PROFILES_DIR = os.path.join(workspace.ROOT, "profiles")
+SAMPLE_INTERVAL_SEC = 0.005
+MAX_PROFILE_SEC = 300
+TRACEMALLOC_FRAMES = 25
+TOP_N = 25
+
+_cpu_lock = asyncio.Lock()
+_mem_baseline: tracemalloc.Snapshot | None = None
+
+class ProfilerBusyError(Exception): ...
+
+def _out_path(prefix: str, ext: str) -> str:
+    os.makedirs(PROFILES_DIR, exist_ok=True)
+    return os.path.join(PROFILES_DIR, f"{prefix}-{datetime.now():%Y%m%d-%H%M%S}.{ext}")
+
+def _write(path: str, text: str) -> str:
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+    return path
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+# --- CPU: сэмплирующий профилировщик ---
+
+class _Sampler(threading.Thread):
+    """
+    Раз в SAMPLE_INTERVAL_SEC снимает стеки всех потоков через
+    sys._current_frames и считает одинаковые стеки. Код не инструментируется,
+    поэтому накладные расходы не зависят от нагрузки бота.
+    """
+
+    def __init__(self, interval: float):
+        super().__init__(name="cpu-sampler", daemon=True)
+        self.interval = interval
+        self.stacks: Counter[str] = Counter()
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        me = threading.get_ident()
+        names = {}
+        while not self._stop_event.wait(self.interval):
+            if len(names) != threading.active_count():
+                names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                parts = []
+                while frame is not None:
+                    parts.append(_frame_name(frame))
+                    frame = frame.f_back
+                parts.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(parts))] += 1
+            self.samples += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+def _cpu_report(stacks: Counter, samples: int, seconds: float) -> tuple[str, str]:
+    # collapsed stacks (flamegraph.pl, speedscope) и текстовая сводка self/total по функциям
+    collapsed = "\n".join(f"{stack} {n}" for stack, n in stacks.most_common()) + "\n"
+    own: Counter[str] = Counter()
+    total: Counter[str] = Counter()
+    for stack, n in stacks.items():
+        frames = stack.split(";")[1:]  # первый элемент — имя потока
+        if not frames:
+            continue
+        own[frames[-1]] += n
+        for name in set(frames):
+            total[name] += n
+    all_samples = sum(stacks.values()) or 1
+    lines = [f"CPU-профиль: {seconds:.1f} с, {samples} срезов, интервал {SAMPLE_INTERVAL_SEC * 1000:.0f} мс", "", "self %   total %  функция"]
+    for name, n in own.most_common(TOP_N):
+        lines.append(f"{n / all_samples:6.1%}  {total[name] / all_samples:7.1%}  {name}")
+    return collapsed, "\n".join(lines)
+
+async def cpu_profile(seconds: float) -> tuple[str, str]:
+    # возвращает (путь к collapsed-файлу, сводка); одновременно — только один профиль
+    if _cpu_lock.locked():
+        raise ProfilerBusyError("Профилирование уже идёт")
+    seconds = max(1.0, min(seconds, MAX_PROFILE_SEC))
+    async with _cpu_lock:
+        sampler = _Sampler(SAMPLE_INTERVAL_SEC)
+        started = time.monotonic()
+        sampler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            await asyncio.to_thread(sampler.stop)
+        collapsed, summary = _cpu_report(sampler.stacks, sampler.samples, time.monotonic() - started)
+        path = await asyncio.to_thread(_write, _out_path("cpu", "collapsed.txt"), collapsed)
+    logger.info(f"CPU-профиль записан: {path}")
+    return path, summary
+
+# --- память: tracemalloc ---
+
+def containers() -> dict[str, int]:
+    # размеры долгоживущих структур, которые растут вместе с числом пользователей
+    from app.core import antispam, proc
+    from app.core.sender import sender
+
+    return {
+        "antispam._last_seen": len(antispam._last_seen),
+        "antispam._window_hits": len(antispam._window_hits),
+        "antispam._inflight": len(antispam._inflight),
+        "antispam._user_queued": len(antispam._user_queued),
+        "sender._chats": len(sender._chats),
+        "proc.stats": len(proc.stats),
+        "asyncio tasks": len(asyncio.all_tasks()),
+    }
+
+async def mem_start() -> str:
+    global _mem_baseline
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+    _mem_baseline = await asyncio.to_thread(tracemalloc.take_snapshot)
+    current, peak = tracemalloc.get_traced_memory()
+    return f"tracemalloc включён, базовый снимок: {current / 1024 / 1024:.1f} MB (пик {peak / 1024 / 1024:.1f} MB)"
+
+def mem_stop() -> str:
+    global _mem_baseline
+    _mem_baseline = None
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+        return "tracemalloc выключен"
+    return "tracemalloc не был включён"
+
+def _mem_report(baseline: tracemalloc.Snapshot, sizes: dict[str, int]) -> tuple[str, str]:
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ))
+    by_line = snapshot.compare_to(baseline, "lineno")
+    by_trace = snapshot.compare_to(baseline, "traceback")
+    current, peak = tracemalloc.get_traced_memory()
+
+    head = [f"Память (tracemalloc): {current / 1024 / 1024:.1f} MB, пик {peak / 1024 / 1024:.1f} MB", ""]
+    head += [f"{name}: {n}" for name, n in sizes.items()]
+    head += ["", "Рост с базового снимка по строкам:"]
+    head += [str(stat) for stat in by_line[:TOP_N]]
+    summary = "\n".join(head)
+
+    full = [summary, "", "Рост по стекам вызовов:"]
+    for stat in by_trace[:TOP_N]:
+        full.append(f"\n{stat.size_diff / 1024:+.1f} KiB, блоков {stat.count_diff:+d}")
+        full.extend(stat.traceback.format())
+    return "\n".join(full) + "\n", summary
+
+async def mem_diff() -> tuple[str, str]:
+    if _mem_baseline is None:
+        raise RuntimeError("Сначала /mem start")
+    # снимок и сравнение — секунды работы на большом процессе: не в цикле событий
+    text, summary = await asyncio.to_thread(_mem_report, _mem_baseline, containers())
+    path = await asyncio.to_thread(_write, _out_path("mem", "txt"), text)
+    return path, summary
+
+# --- стеки потоков и задач ---
+
+def _executor_state() -> list[str]:
+    from app.core import admission, images
+    from app.features.downloader.spotify import engine
+
+    usage = admission.executor_usage()
+    lines = [f"default executor: занято {usage['busy']}/{usage['max']}, в очереди {usage['backlog']}"]
+    spotdl = engine._executor
+    lines.append(f"spotdl executor: потоков {len(spotdl._threads)}/{spotdl._max_workers}, в очереди {spotdl._work_queue.qsize()}")
+    pool = images._pool
+    if pool is not None:
+        lines.append(f"image pool: процессов {len(pool._processes or {})}, задач {len(pool._pending_work_items)}")
+    return lines
+
+def _dump_stacks(tasks: list[asyncio.Task]) -> str:
+    out = io.StringIO()
+    out.write("\n".join(_executor_state()) + "\n")
+
+    names = {t.ident: t.name for t in threading.enumerate()}
+    frames = sys._current_frames()
+    out.write(f"\n=== Потоки: {len(frames)} ===\n")
+    for ident, frame in frames.items():
+        out.write(f"\n--- {names.get(ident, ident)} ({ident})\n")
+        out.write("".join(traceback.format_stack(frame)))
+
+    out.write(f"\n=== Задачи asyncio: {len(tasks)} ===\n")
+    for task in tasks:
+        out.write(f"\n--- {task.get_name()}: {task.get_coro()!r}\n")
+        task.print_stack(limit=20, file=out)
+    return out.getvalue()
+
+async def dump_stacks() -> tuple[str, str]:
+    tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+    text = _dump_stacks(tasks)
+    path = await asyncio.to_thread(_write, _out_path("stacks", "txt"), text)
+    summary = "\n".join(_executor_state() + [f"потоков: {threading.active_count()}, задач asyncio: {len(tasks)}"])
+    return path, summary
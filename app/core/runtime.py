@@ -0,0 +1,80 @@
+import asyncio
+import json
+import logging
+from typing import Any, Callable
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_loop: str = "asyncio"
+
+def install_event_loop() -> str:
+    # до asyncio.run(): с FAST_RUNTIME=1 и установленным uvloop цикл событий — uvloop
+    global _loop
+    if settings.fast_runtime:
+        try:
+            import uvloop
+        except ImportError:
+            _loop = "asyncio (uvloop не установлен)"
+        else:
+            asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+            _loop = f"uvloop {uvloop.__version__}"
+    return _loop
+
+def json_codec() -> tuple[Callable[..., Any], Callable[..., str], str]:
+    # (loads, dumps, имя): orjson при FAST_RUNTIME=1, если установлен, иначе stdlib json
+    if settings.fast_runtime:
+        try:
+            import orjson
+        except ImportError:
+            pass
+        else:
+            def _dumps(obj: Any) -> str:
+                return orjson.dumps(obj).decode()
+
+            return orjson.loads, _dumps, f"orjson {orjson.__version__}"
+    return json.loads, json.dumps, "json"
+
+def bot_session(api=None, **kwargs):
+    """
+    Сессия Bot API с настройками пула: до TG_POOL_LIMIT соединений, keep-alive
+    TG_KEEPALIVE_SEC (соединение к api.telegram.org переживает паузы между
+    отправками), общий таймаут запроса TG_REQUEST_TIMEOUT_SEC и JSON из json_codec().
+    Сервер — api или botapi.server() (BOT_API_URL).
+    """
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from app.core import botapi
+
+    loads, dumps, _ = json_codec()
+    session = AiohttpSession(
+        api=api or botapi.server(),
+        limit=settings.tg_pool_limit,
+        json_loads=loads,
+        json_dumps=dumps,
+        timeout=settings.tg_request_timeout_sec,
+        **kwargs,
+    )
+    session._connector_init["keepalive_timeout"] = settings.tg_keepalive_sec
+    return session
+
+def describe() -> str:
+    from aiohttp import http_parser
+
+    # C-парсер aiohttp и aiodns ставятся вместе с aiohttp[speedups]; без них — чистый Python
+    c_parser = http_parser.HttpResponseParser is not getattr(http_parser, "HttpResponseParserPy", None)
+    try:
+        import aiodns  # noqa: F401
+        resolver = "aiodns"
+    except ImportError:
+        resolver = "потоковый"
+    return (
+        f"цикл: {_loop}; JSON Bot API: {json_codec()[2]}; "
+        f"aiohttp: {'C-парсер' if c_parser else 'Python-парсер'}, DNS {resolver}; "
+        f"Bot API: {settings.bot_api_url or 'api.telegram.org'}{' (--local)' if settings.bot_api_local else ''}, "
+        f"пул {settings.tg_pool_limit} соединений, keep-alive {settings.tg_keepalive_sec:g} с, "
+        f"таймаут {settings.tg_request_timeout_sec:g} с"
+    )
+
+def log_active():
+    logger.info(f"Режим выполнения ({'FAST_RUNTIME' if settings.fast_runtime else 'стандартный'}): {describe()}")
@@ -0,0 +1,102 @@
+import asyncio
+import heapq
+import itertools
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+
+from app.core.config import settings
+
+@dataclass(order=True)
+class _Waiter:
+    finish: float
+    seq: int
+    start: float = field(compare=False)
+    user_id: int = field(compare=False)
+    fut: asyncio.Future = field(compare=False)
+
+class FairScheduler:
+    """
+    Глобальный планировщик тяжёлых загрузок: взвешенная справедливая очередь
+    (start-time fair queuing) между пользователями.
+
+    Каждая задача получает виртуальное время окончания start + cost / weight,
+    где start — max(виртуальное время системы, окончание предыдущей задачи юзера).
+    Слот отдаётся задаче с наименьшим временем окончания, поэтому короткие задачи
+    обгоняют длинные, а один активный пользователь не занимает все слоты.
+    """
+
+    def __init__(self, slots: int, per_user: int = 1):
+        self.slots = max(1, slots)
+        self.per_user = max(1, per_user)
+        self._running = 0
+        self._user_running: dict[int, int] = {}
+        self._user_finish: dict[int, float] = {}
+        self._vtime = 0.0
+        self._waiting: list[_Waiter] = []
+        self._seq = itertools.count()
+
+    @property
+    def running(self) -> int:
+        return self._running
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for w in self._waiting if not w.fut.done())
+
+    def _can_run(self, user_id: int) -> bool:
+        return self._running < self.slots and self._user_running.get(user_id, 0) < self.per_user
+
+    def _grant(self, user_id: int, start: float):
+        self._running += 1
+        self._user_running[user_id] = self._user_running.get(user_id, 0) + 1
+        self._vtime = max(self._vtime, start)
+
+    def _release(self, user_id: int):
+        self._running -= 1
+        left = self._user_running.get(user_id, 1) - 1
+        if left:
+            self._user_running[user_id] = left
+        else:
+            self._user_running.pop(user_id, None)
+        if not self._running and not self._waiting:
+            # система простаивает — сбрасываем виртуальные часы, чтобы не копить историю
+            self._vtime = 0.0
+            self._user_finish.clear()
+        self._dispatch()
+
+    def _dispatch(self):
+        skipped: list[_Waiter] = []
+        while self._waiting and self._running < self.slots:
+            w = heapq.heappop(self._waiting)
+            if w.fut.done():  # ожидание отменено
+                continue
+            if not self._can_run(w.user_id):
+                skipped.append(w)
+                continue
+            self._grant(w.user_id, w.start)
+            w.fut.set_result(True)
+        for w in skipped:
+            heapq.heappush(self._waiting, w)
+
+    @asynccontextmanager
+    async def slot(self, user_id: int, cost: float = 1.0, weight: float = 1.0):
+        start = max(self._vtime, self._user_finish.get(user_id, 0.0))
+        finish = start + max(cost, 0.01) / max(weight, 0.01)
+        self._user_finish[user_id] = finish
+
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiting, _Waiter(finish, next(self._seq), start, user_id, fut))
+        self._dispatch()
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                # слот уже выдан, но задача отменена — возвращаем его
+                self._release(user_id)
+            raise
+        try:
+            yield
+        finally:
+            self._release(user_id)
+
+scheduler = FairScheduler(settings.max_concurrent_jobs)
@@ -0,0 +1,210 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import time
+from typing import Any
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import TelegramMethod, SendMediaGroup
+from aiogram.methods.base import Response, TelegramType
+from aiogram.types import InputFile
+
+from app.core.config import settings
+from app.core import botapi, jobs, metrics
+
+logger = logging.getLogger(__name__)
+
+MAX_RETRIES = 3
+MAX_CHAT_BUCKETS = 5000
+
+PRIORITY_MESSAGE = 0   # текст, удаление, отправка по file_id
+PRIORITY_UPLOAD = 1    # загрузка файла в Telegram
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, n: float = 1) -> float:
+        self._refill()
+        return 0.0 if self.tokens >= n else (n - self.tokens) / self.rate
+
+    def take(self, n: float = 1):
+        self._refill()
+        self.tokens -= n
+
+    def pause(self, seconds: float):
+        # retry_after от Telegram: уводим ведро в минус, чтобы никто не слал до конца паузы
+        self._refill()
+        self.tokens = min(self.tokens, 0.0) - seconds * self.rate
+
+    @property
+    def idle(self) -> bool:
+        self._refill()
+        return self.tokens >= self.capacity
+
+def _message_count(method: TelegramMethod) -> int:
+    # альбом Telegram считает как несколько сообщений
+    if isinstance(method, SendMediaGroup):
+        return max(1, len(method.media))
+    return 1
+
+def _is_file(value) -> bool:
+    # InputFile или file://-ссылка для локального сервера Bot API (BOT_API_LOCAL=1)
+    return isinstance(value, InputFile) or botapi.local_path(value) is not None
+
+def _files(method: TelegramMethod) -> list[InputFile | str]:
+    files: list[InputFile | str] = []
+    for name in type(method).model_fields:
+        value = getattr(method, name, None)
+        if _is_file(value):
+            files.append(value)
+        elif isinstance(value, list):
+            files.extend(m.media for m in value if _is_file(getattr(m, "media", None)))
+    return files
+
+def _has_upload(method: TelegramMethod) -> bool:
+    return bool(_files(method))
+
+def _upload_bytes(method: TelegramMethod) -> int:
+    # размер загружаемых файлов: FSInputFile и file:// — по пути на диске, BufferedInputFile — по буферу
+    total = 0
+    for f in _files(method):
+        path = botapi.local_path(f) if isinstance(f, str) else getattr(f, "path", None)
+        try:
+            total += os.path.getsize(path) if path else len(getattr(f, "data", b""))
+        except OSError:
+            pass
+    return total
+
+def _is_send(method: TelegramMethod) -> bool:
+    return type(method).__name__.startswith(("Send", "Copy", "Forward"))
+
+def _is_delivery(method: TelegramMethod) -> bool:
+    # сообщение с медиа: после него повтор задачи продублировал бы пользователю уже полученное
+    return _is_send(method) and type(method).__name__ not in ("SendMessage", "SendChatAction")
+
+class RateLimitedSender(BaseRequestMiddleware):
+    """
+    Центральная точка всех исходящих запросов к Bot API.
+
+    Отправка сообщений проходит через два ведра токенов — глобальное
+    (~30 сообщений/с) и на чат (1/с в личке, ~20/мин в группах); при ожидании
+    глобального ведра обычные сообщения обгоняют загрузки файлов.
+    На TelegramRetryAfter запрос повторяется после указанной паузы.
+    """
+
+    def __init__(self):
+        self._global = TokenBucket(settings.tg_global_rate, settings.tg_global_rate)
+        self._chats: dict[Any, TokenBucket] = {}
+        self._waiters: list[tuple[int, int]] = []
+        self._seq = itertools.count()
+        self._cond = asyncio.Condition()
+        self.stats: dict[str, float] = {
+            "requests": 0,
+            "uploads": 0,
+            "retries": 0,
+            "queued_sec_message": 0.0,
+            "queued_sec_upload": 0.0,
+            "request_sec_message": 0.0,
+            "request_sec_upload": 0.0,
+        }
+
+    def _chat_bucket(self, chat_id: Any) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) > MAX_CHAT_BUCKETS:
+                self._chats = {k: b for k, b in self._chats.items() if not b.idle}
+            is_group = isinstance(chat_id, str) or chat_id < 0
+            if is_group:
+                bucket = TokenBucket(settings.tg_group_per_min / 60, settings.tg_group_per_min)
+            else:
+                bucket = TokenBucket(settings.tg_chat_rate, max(1.0, settings.tg_chat_rate * 3))
+            self._chats[chat_id] = bucket
+        return bucket
+
+    async def _acquire_chat(self, chat_id: Any, n: int):
+        bucket = self._chat_bucket(chat_id)
+        while (d := bucket.delay(min(n, bucket.capacity))) > 0:
+            await asyncio.sleep(d)
+        bucket.take(n)
+
+    async def _acquire_global(self, n: int, priority: int):
+        key = (priority, next(self._seq))
+        async with self._cond:
+            heapq.heappush(self._waiters, key)
+            self._cond.notify_all()
+            try:
+                while True:
+                    await self._cond.wait_for(lambda: self._waiters[0] == key)
+                    d = self._global.delay(min(n, self._global.capacity))
+                    if d <= 0:
+                        break
+                    # ждём токены, оставаясь в очереди: более срочный запрос может нас обогнать
+                    try:
+                        await asyncio.wait_for(self._cond.wait(), timeout=d)
+                    except asyncio.TimeoutError:
+                        pass
+                self._global.take(n)
+            finally:
+                self._waiters.remove(key)
+                heapq.heapify(self._waiters)
+                self._cond.notify_all()
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        chat_id = getattr(method, "chat_id", None)
+        limited = chat_id is not None and _is_send(method)
+        upload = _has_upload(method)
+        kind = "upload" if upload else "message"
+        n = _message_count(method)
+
+        for attempt in range(MAX_RETRIES + 1):
+            if limited:
+                queued_at = time.monotonic()
+                await self._acquire_chat(chat_id, n)
+                await self._acquire_global(n, PRIORITY_UPLOAD if upload else PRIORITY_MESSAGE)
+                self.stats[f"queued_sec_{kind}"] += time.monotonic() - queued_at
+
+            started = time.monotonic()
+            try:
+                response = await make_request(bot, method)
+                if _is_delivery(method):
+                    jobs.mark_delivered()
+                if upload:
+                    metrics.observe_stage("upload", time.monotonic() - started)
+                    metrics.add_bytes("upload", _upload_bytes(method))
+                return response
+            except TelegramRetryAfter as e:
+                if attempt == MAX_RETRIES:
+                    raise
+                self.stats["retries"] += 1
+                logger.warning(f"429 от Telegram ({type(method).__name__}, chat={chat_id}), пауза {e.retry_after} сек.")
+                if chat_id is not None:
+                    self._chat_bucket(chat_id).pause(e.retry_after)
+                else:
+                    self._global.pause(e.retry_after)
+                if not limited:
+                    await asyncio.sleep(e.retry_after)
+            finally:
+                self.stats["requests"] += 1
+                self.stats["uploads"] += int(upload)
+                self.stats[f"request_sec_{kind}"] += time.monotonic() - started
+
+        raise RuntimeError("unreachable")
+
+sender = RateLimitedSender()
@@ -0,0 +1,184 @@
+import asyncio
+import functools
+import json
+import logging
+import random
+import time
+import uuid
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+
+logger = logging.getLogger("app.trace")
+
+_current: ContextVar["RequestTrace | None"] = ContextVar("request_trace", default=None)
+_pending: set[asyncio.Task] = set()
+
+@dataclass
+class RequestTrace:
+    """
+    Запись об одном запросе пользователя.
+
+    stages — суммарное время по этапам (этапы параллельных загрузок видео и
+    аудио складываются, поэтому сумма может превышать total). Контекст
+    наследуется задачами asyncio.create_task, так что фоновые загрузки пишут
+    в тот же запрос.
+    """
+
+    handler: str
+    user_id: int | None
+    url: str | None
+    request_id: str = field(default_factory=lambda: uuid.uuid4().hex[:16])
+    ts: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+    started: float = field(default_factory=time.perf_counter)
+    total: float = 0.0
+    stages: dict[str, float] = field(default_factory=dict)
+    strategy: str | None = None
+    cache: dict[str, str] = field(default_factory=dict)
+    bytes_down: int = 0
+    bytes_up: int = 0
+    error: str | None = None
+
+    def as_dict(self) -> dict:
+        return {
+            "request_id": self.request_id,
+            "handler": self.handler,
+            "user_id": self.user_id,
+            "url": self.url,
+            "total_sec": round(self.total, 3),
+            "stages": {k: round(v, 3) for k, v in self.stages.items()},
+            "strategy": self.strategy,
+            "cache": self.cache,
+            "bytes_down": self.bytes_down,
+            "bytes_up": self.bytes_up,
+            "error": self.error,
+        }
+
+def current() -> RequestTrace | None:
+    return _current.get()
+
+def add_stage(name: str, seconds: float):
+    trace = _current.get()
+    if trace is not None:
+        trace.stages[name] = trace.stages.get(name, 0.0) + seconds
+
+def note_cache(layer: str, kind: str, outcome: str):
+    trace = _current.get()
+    if trace is not None:
+        trace.cache[f"{layer}:{kind}"] = outcome
+
+def add_bytes(direction: str, n: int):
+    trace = _current.get()
+    if trace is not None:
+        if direction == "upload":
+            trace.bytes_up += n
+        else:
+            trace.bytes_down += n
+
+def fail(exc: BaseException):
+    # для обработчиков, которые сами отвечают пользователю об ошибке и не пробрасывают её
+    trace = _current.get()
+    if trace is not None and trace.error is None:
+        trace.error = type(exc).__name__
+
+@contextmanager
+def span(name: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_stage(name, time.perf_counter() - started)
+
+def traced(fn):
+    """
+    Оборачивает send_* в span с именем функции. Первая завершившаяся функция,
+    не вернувшая False (send_cached_* возвращают False при промахе),
+    становится стратегией запроса.
+    """
+    name = fn.__name__
+
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        with span(name):
+            result = await fn(*args, **kwargs)
+        trace = _current.get()
+        if trace is not None and trace.strategy is None and result is not False:
+            trace.strategy = name
+        return result
+    return wrapper
+
+@asynccontextmanager
+async def request(handler: str, user_id: int | None = None, url: str | None = None):
+    trace = RequestTrace(handler, user_id, url)
+    token = _current.set(trace)
+    try:
+        yield trace
+    except BaseException as e:
+        trace.error = type(e).__name__
+        raise
+    finally:
+        trace.total = time.perf_counter() - trace.started
+        _current.reset(token)
+        _finish(trace)
+
+def _finish(trace: RequestTrace):
+    from app.core.config import settings
+
+    stages = " ".join(f"{k}={v:.2f}" for k, v in sorted(trace.stages.items(), key=lambda kv: -kv[1]))
+    logger.info(
+        f"{trace.request_id} {trace.handler} {trace.total:.2f}s strategy={trace.strategy} "
+        f"error={trace.error} [{stages}]",
+        extra={"trace": trace.as_dict()},
+    )
+    slow = settings.trace_slow_sec and trace.total >= settings.trace_slow_sec
+    if slow or random.random() < settings.trace_sample_rate:
+        task = asyncio.create_task(_persist(trace))
+        _pending.add(task)
+        task.add_done_callback(_pending.discard)
+
+async def _persist(trace: RequestTrace):
+    from app.core.db import Session
+    from app.core.models import RequestTrace as RequestTraceRow
+
+    try:
+        async with Session() as s:
+            s.add(RequestTraceRow(
+                request_id=trace.request_id,
+                ts=trace.ts,
+                user_id=trace.user_id,
+                url=trace.url,
+                handler=trace.handler,
+                strategy=trace.strategy,
+                total_sec=trace.total,
+                stages=json.dumps(trace.as_dict()["stages"]),
+                cache=json.dumps(trace.cache) if trace.cache else None,
+                bytes_down=trace.bytes_down,
+                bytes_up=trace.bytes_up,
+                error=trace.error,
+            ))
+            await s.commit()
+    except Exception as e:
+        logger.warning(f"Трассировка {trace.request_id} не сохранена: {e}")
+
+class JsonFormatter(logging.Formatter):
+    # одна JSON-строка на запись; request_id текущего запроса добавляется ко всем логам
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        trace = getattr(record, "trace", None)
+        if trace is not None:
+            data["trace"] = trace
+        elif (current_trace := _current.get()) is not None:
+            data["request_id"] = current_trace.request_id
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+def use_json_logs():
+    for handler in logging.getLogger().handlers:
+        handler.setFormatter(JsonFormatter())
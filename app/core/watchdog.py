@@ -0,0 +1,108 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from dataclasses import dataclass
+
+from app.core.config import settings
+from app.core import metrics
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_SEC = 0.05
+MAX_STALLS_KEPT = 20
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+loop_lag = metrics.Histogram("bot_loop_lag_seconds", "Опоздание пробуждения цикла событий", buckets=LAG_BUCKETS)
+loop_stalls = metrics.Counter("bot_loop_stalls_total", "Блокировок цикла событий дольше LOOP_LAG_THRESHOLD_MS")
+
+@dataclass
+class Stall:
+    ts: float        # time.time() момента обнаружения
+    seconds: float   # сколько цикл уже стоял, когда снят стек
+    stack: str
+
+class LoopWatchdog:
+    """
+    Сторож цикла событий.
+
+    Корутина-пульс просыпается каждые HEARTBEAT_SEC и пишет опоздание в
+    гистограмму. Отдельный поток проверяет время последнего пульса: если цикл
+    не отвечает дольше порога, снимает стек потока цикла (sys._current_frames) —
+    это и есть синхронный вызов, который его держит, — и пишет его в лог.
+    """
+
+    def __init__(self, threshold: float):
+        self.threshold = threshold
+        self.max_lag = 0.0
+        self.stalls: deque[Stall] = deque(maxlen=MAX_STALLS_KEPT)
+        self.stall_count = 0
+        self._beat = time.monotonic()
+        self._stop = threading.Event()
+        self._task: asyncio.Task | None = None
+        self._thread: threading.Thread | None = None
+        self._loop_thread_id: int | None = None
+
+    def start(self):
+        loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        if settings.loop_debug:
+            # asyncio сам пишет «Executing <Handle ...> took N seconds» для медленных колбэков
+            loop.set_debug(True)
+            loop.slow_callback_duration = self.threshold
+        self._task = loop.create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._sample, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+
+    async def _heartbeat(self):
+        while True:
+            expected = time.monotonic() + HEARTBEAT_SEC
+            await asyncio.sleep(HEARTBEAT_SEC)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            self._beat = now
+            self.max_lag = max(self.max_lag, lag)
+            loop_lag.observe(lag)
+
+    def _sample(self):
+        reported_beat = None
+        while not self._stop.wait(HEARTBEAT_SEC):
+            beat = self._beat
+            stalled = time.monotonic() - beat
+            if stalled < self.threshold or beat == reported_beat:
+                continue
+            reported_beat = beat  # одна запись на одну блокировку
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame else "<стек недоступен>"
+            self.stalls.append(Stall(time.time(), stalled, stack))
+            self.stall_count += 1
+            loop_stalls.inc()
+            logger.warning(f"Цикл событий заблокирован уже {stalled * 1000:.0f} мс, стек:\n{stack}")
+
+_watchdog: LoopWatchdog | None = None
+
+def start(threshold_ms: int | None = None) -> LoopWatchdog | None:
+    # вызывается из работающего цикла; LOOP_LAG_THRESHOLD_MS=0 — сторож выключен
+    global _watchdog
+    threshold_ms = settings.loop_lag_threshold_ms if threshold_ms is None else threshold_ms
+    if threshold_ms <= 0:
+        return None
+    _watchdog = LoopWatchdog(threshold_ms / 1000)
+    _watchdog.start()
+    return _watchdog
+
+def stop():
+    if _watchdog:
+        _watchdog.stop()
+
+def current() -> LoopWatchdog | None:
+    return _watchdog
@@ -0,0 +1,167 @@
+import asyncio
+import logging
+import os
+import re
+import shutil
+import socket
+import tempfile
+import time
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+ROOT = os.path.abspath(settings.download_dir)
+JOBS_DIR = os.path.join(ROOT, "jobs")
+
+_HOST = socket.gethostname().replace("_", "-")
+_STARTED_AT = time.time()
+_usage_cache: tuple[float, int] = (0.0, 0)
+_usage_refreshing = False
+
+class WorkspaceFullError(RuntimeError): ...
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for f in files:
+            try:
+                total += os.path.getsize(os.path.join(root, f))
+            except OSError:
+                pass
+    return total
+
+def _refresh_usage() -> int:
+    # полный обход JOBS_DIR: только из executor (или до запуска цикла событий)
+    global _usage_cache, _usage_refreshing
+    try:
+        size = _dir_size(JOBS_DIR)
+        _usage_cache = (time.monotonic(), size)
+        return size
+    finally:
+        _usage_refreshing = False
+
+def usage_bytes(max_age: float = 5.0) -> int:
+    """
+    Занятое задачами место по последнему обходу JOBS_DIR. Из цикла событий
+    устаревшее значение обновляется в executor, а вызывающий сразу получает
+    прежнее — job_dir() и check_quota() не ждут обхода большого каталога.
+    """
+    global _usage_refreshing
+    ts, size = _usage_cache
+    if time.monotonic() - ts <= max_age or _usage_refreshing:
+        return size
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return _refresh_usage()
+    _usage_refreshing = True
+    loop.run_in_executor(None, _refresh_usage)
+    return size
+
+def check_quota():
+    if settings.download_quota_mb and usage_bytes() >= settings.download_quota_mb * 1024 * 1024:
+        raise WorkspaceFullError("Недостаточно места для загрузки, попробуйте позже.")
+
+def job_dir(prefix: str) -> str:
+    # имя содержит хост и pid владельца: так janitor отличает брошенные каталоги от живых
+    check_quota()
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    path = tempfile.mkdtemp(prefix=f"{prefix}{_HOST}_{os.getpid()}_", dir=JOBS_DIR)
+    if settings.bot_api_local:
+        # mkdtemp создаёт каталог 0700; локальный сервер Bot API читает файлы из него сам
+        os.chmod(path, 0o755)
+    return path
+
+def subdir(job: str, name: str) -> str:
+    path = os.path.join(job, name)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def move(src: str, dst_dir: str, name: str | None = None) -> str:
+    dst = os.path.join(dst_dir, name or os.path.basename(src))
+    if os.path.abspath(src) == os.path.abspath(dst):
+        return dst
+    try:
+        os.replace(src, dst)
+    except OSError:
+        shutil.move(src, dst)  # другая ФС — копирование неизбежно
+    return dst
+
+def link(src: str, dst_dir: str, name: str | None = None) -> str:
+    # ещё одно имя для того же файла без копирования байтов
+    dst = os.path.join(dst_dir, name or os.path.basename(src))
+    try:
+        if os.path.exists(dst):
+            os.remove(dst)
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+    return dst
+
+def job_root(path: str) -> str | None:
+    rel = os.path.relpath(os.path.abspath(path), JOBS_DIR)
+    if rel.startswith(".."):
+        return None
+    return os.path.join(JOBS_DIR, rel.split(os.sep)[0])
+
+def release(*paths: str):
+    # удаляет каталоги задач, которым принадлежат файлы; из цикла событий — в фоне,
+    # удаление больших файлов не должно его держать (недоудалённое подберёт janitor)
+    roots = {job_root(p) for p in paths if p} - {None, JOBS_DIR}
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+    for root in roots:
+        if loop:
+            loop.run_in_executor(None, shutil.rmtree, root, True)
+        else:
+            shutil.rmtree(root, ignore_errors=True)
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def _is_orphan(name: str, path: str, max_age_sec: float) -> bool:
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return False
+    m = re.search(rf"(?:^|-){re.escape(_HOST)}_(\d+)_", name)
+    if m:
+        pid = int(m.group(1))
+        if pid != os.getpid() and not _pid_alive(pid):
+            return True  # процесс-владелец на этой машине уже завершился
+        if pid == os.getpid() and os.stat(path).st_ctime < _STARTED_AT:
+            return True  # тот же pid после перезапуска (например, pid 1 в контейнере)
+    return time.time() - mtime > max_age_sec
+
+def sweep(max_age_sec: float | None = None) -> int:
+    if max_age_sec is None:
+        max_age_sec = settings.job_dir_max_age_sec
+    if not os.path.isdir(JOBS_DIR):
+        return 0
+    removed = 0
+    for name in os.listdir(JOBS_DIR):
+        path = os.path.join(JOBS_DIR, name)
+        if os.path.isdir(path) and _is_orphan(name, path, max_age_sec):
+            shutil.rmtree(path, ignore_errors=True)
+            removed += 1
+    if removed:
+        logger.info(f"Janitor: удалено брошенных каталогов: {removed}")
+    _refresh_usage()
+    return removed
+
+async def janitor_loop():
+    while True:
+        await asyncio.sleep(settings.janitor_interval_sec)
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, sweep)
+        except Exception as e:
+            logger.warning(f"Janitor error: {e}")
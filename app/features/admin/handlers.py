@@ -0,0 +1,109 @@
+from aiogram import Router, F
+from aiogram.filters import Command, CommandObject
+from aiogram.types import Message
+
+from app.core.config import settings
+from app.core import admission, binaries, blobstore, botapi, proc, watchdog, profiling
+from app.core.sender import sender
+from app.features.downloader.cost import accuracy_report
+
+router = Router()
+router.message.filter(F.from_user.id.in_(set(settings.admin_ids)))
+
+CAPTION_LIMIT = 1024
+DEFAULT_PROFILE_SEC = 30
+
+@router.message(Command("status"))
+async def status(msg: Message):
+    snap = admission.snapshot()
+    await msg.reply(
+        f"🩺 Состояние: {snap['state']}\n"
+        f"⚙️ Задач в обработке: {snap['inflight']} "
+        f"(мягкий порог {settings.soft_inflight}, жёсткий {settings.hard_inflight})\n"
+        f"🧵 Загрузок: {snap['scheduler_running']}/{settings.max_concurrent_jobs}, "
+        f"в очереди: {snap['scheduler_waiting']}, executor: {snap['executor_backlog']}\n"
+        f"💾 Свободно на диске: {snap['free_disk_mb'] if snap['free_disk_mb'] is not None else '—'} MB "
+        f"(пороги {settings.soft_free_disk_mb}/{settings.hard_free_disk_mb} MB)\n"
+        f"📁 Рабочий каталог: {snap['workspace_mb']} MB из {settings.download_quota_mb or '∞'} MB\n"
+        f"🗃 Кэш файлов: {blobstore.usage_bytes() // (1024 * 1024)} MB из {settings.blob_cache_mb} MB\n"
+        f"📤 Bot API: запросов {int(sender.stats['requests'])}, загрузок {int(sender.stats['uploads'])}, "
+        f"429-повторов {int(sender.stats['retries'])}\n"
+        f"   в очереди: сообщения {sender.stats['queued_sec_message']:.1f} с, файлы {sender.stats['queued_sec_upload']:.1f} с; "
+        f"отправка: сообщения {sender.stats['request_sec_message']:.1f} с, файлы {sender.stats['request_sec_upload']:.1f} с"
+        + _format_loop(watchdog.current())
+        + _format_procs(proc.stats)
+        + f"\n🧩 {binaries.summary()}"
+        + _format_accuracy(await accuracy_report())
+    )
+
+def _format_loop(wd: watchdog.LoopWatchdog | None) -> str:
+    if wd is None:
+        return ""
+    line = f"\n🔁 Цикл событий: макс. задержка {wd.max_lag * 1000:.0f} мс, блокировок > {wd.threshold * 1000:.0f} мс: {wd.stall_count}"
+    if wd.stalls:
+        last = wd.stalls[-1]
+        # последняя строка стека — место, где цикл стоял
+        where = last.stack.strip().splitlines()[-2:] if last.stack else []
+        line += "\n   последняя: " + " ".join(s.strip() for s in where)
+    return line
+
+def _format_procs(stats: dict[str, dict]) -> str:
+    if not stats:
+        return ""
+    lines = ["", "", "🛠 Внешние процессы (запусков / работают / ждут / ошибок / таймаутов, всего секунд):"]
+    for binary, st in sorted(stats.items()):
+        lines.append(
+            f"• {binary}: {int(st['launches'])} / {int(st['running'])} / {int(st['waiting'])} / "
+            f"{int(st['failed'])} / {int(st['timeouts'])}, {st['seconds']:.0f} с"
+        )
+    return "\n".join(lines)
+
+def _format_accuracy(rows: list[dict]) -> str:
+    if not rows:
+        return ""
+    lines = ["", "", "📐 Точность оценки стоимости (средняя ошибка):"]
+    for r in rows:
+        b = f"{r['bytes_mape']:.0%}" if r["bytes_mape"] is not None else "—"
+        t = f"{r['seconds_mape']:.0%}" if r["seconds_mape"] is not None else "—"
+        lines.append(f"• {r['extractor']}/{r['kind']}: размер {b}, время {t} (n={r['samples']})")
+    return "\n".join(lines)
+
+async def _send_report(msg: Message, path: str, summary: str):
+    # файл — в чат, сводка — в подпись; копия остаётся в DOWNLOAD_DIR/profiles
+    caption = summary if len(summary) <= CAPTION_LIMIT else summary[:CAPTION_LIMIT - 1] + "…"
+    await msg.answer_document(botapi.input_file(path), caption=caption)
+
+@router.message(Command("profile"))
+async def profile(msg: Message, command: CommandObject):
+    # /profile [секунды] — сэмплирующий CPU-профиль всего процесса
+    try:
+        seconds = float(command.args) if command.args else DEFAULT_PROFILE_SEC
+    except ValueError:
+        return await msg.reply("Использование: /profile [секунды]")
+    await msg.reply(f"⏱ Профилирую {min(seconds, profiling.MAX_PROFILE_SEC):.0f} с…")
+    try:
+        path, summary = await profiling.cpu_profile(seconds)
+    except profiling.ProfilerBusyError as e:
+        return await msg.reply(f"⏳ {e}")
+    await _send_report(msg, path, summary)
+
+@router.message(Command("mem"))
+async def mem(msg: Message, command: CommandObject):
+    # /mem start — базовый снимок tracemalloc, /mem — рост с него, /mem stop — выключить
+    arg = (command.args or "").strip().lower()
+    if arg == "start":
+        return await msg.reply(await profiling.mem_start())
+    if arg == "stop":
+        return await msg.reply(profiling.mem_stop())
+    try:
+        path, summary = await profiling.mem_diff()
+    except RuntimeError as e:
+        return await msg.reply(f"⚠️ {e}")
+    await _send_report(msg, path, summary)
+
+@router.message(Command("stacks"))
+async def stacks(msg: Message):
+    # стеки всех потоков и задач asyncio, состояние пулов
+    path, summary = await profiling.dump_stacks()
+    await _send_report(msg, path, summary)
+
@@ -0,0 +1,156 @@
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Literal
+
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+from app.core.config import settings
+from app.core.db import Session
+from app.core.models import ExtractorStat
+
+EWMA_ALPHA = 0.2
+OVERHEAD_SEC = 3.0                     # extract_info, ffmpeg, запуск yt-dlp
+DEFAULT_DOWNLOAD_BPS = 2 * 1024 * 1024
+DEFAULT_VIDEO_BPS = 250 * 1024         # ~2 Мбит/с
+DEFAULT_AUDIO_BPS = 24 * 1024          # mp3 192 кбит/с
+UNKNOWN_COST_SEC = 20.0
+
+# ступени понижения качества: (высота, какая доля от оценки должна влезть в лимит)
+DOWNGRADE_LADDER = ((720, 0.5), (480, 0.25), (360, 0.12))
+
+class CostRejectedError(Exception): ...
+
+@dataclass
+class CostEstimate:
+    kind: str
+    bytes: int | None
+    seconds: float
+    basis: Literal["meta", "history", "default"]
+
+@dataclass
+class KindPlan:
+    estimate: CostEstimate
+    action: Literal["ok", "downgrade", "reject"] = "ok"
+    max_height: int | None = None
+    reason: str | None = None
+
+@dataclass
+class DownloadPlan:
+    kinds: dict[str, KindPlan] = field(default_factory=dict)
+
+    @property
+    def cost(self) -> float:
+        return sum(p.estimate.seconds for p in self.kinds.values() if p.action != "reject") or UNKNOWN_COST_SEC
+
+async def _get_stat(extractor: str, kind: str) -> ExtractorStat | None:
+    async with Session() as s:
+        q = await s.execute(
+            select(ExtractorStat).where(ExtractorStat.extractor == extractor, ExtractorStat.kind == kind)
+        )
+        return q.scalar_one_or_none()
+
+async def estimate(meta, kind: str) -> CostEstimate:
+    stat = await _get_stat(meta.extractor or "unknown", kind)
+    has_history = bool(stat and stat.samples)
+    download_bps = (stat.bytes_per_wall_sec if has_history else None) or DEFAULT_DOWNLOAD_BPS
+
+    size, basis = None, "default"
+    if kind == "video" and meta.filesize_approx:
+        size, basis = int(meta.filesize_approx), "meta"
+    elif meta.duration:
+        if has_history and stat.bytes_per_media_sec:
+            size, basis = int(meta.duration * stat.bytes_per_media_sec), "history"
+        else:
+            size = int(meta.duration * (DEFAULT_AUDIO_BPS if kind == "audio" else DEFAULT_VIDEO_BPS))
+
+    seconds = OVERHEAD_SEC + size / download_bps if size else UNKNOWN_COST_SEC
+    return CostEstimate(kind=kind, bytes=size, seconds=seconds, basis=basis)
+
+def decide(est: CostEstimate, max_mb: int, timeout: int) -> KindPlan:
+    max_bytes = max_mb * 1024 * 1024
+    if est.seconds > timeout:
+        return KindPlan(est, "reject", reason=f"загрузка займёт ~{int(est.seconds)} сек., это дольше лимита {timeout} сек.")
+    if est.bytes and est.bytes > max_bytes:
+        if est.kind == "video":
+            ratio = max_bytes / est.bytes
+            for height, need in DOWNGRADE_LADDER:
+                if ratio >= need:
+                    return KindPlan(est, "downgrade", max_height=height)
+        mb = est.bytes // (1024 * 1024)
+        return KindPlan(est, "reject", reason=f"файл ~{mb} MB не помещается в лимит {max_mb} MB")
+    return KindPlan(est)
+
+async def plan_download(
+    meta,
+    kinds: tuple[str, ...] = ("video", "audio"),
+    max_mb: int | None = None,
+    timeout: int | None = None,
+) -> DownloadPlan:
+    # лимиты по умолчанию читаются при вызове, а не при импорте: так действуют переопределения settings
+    max_mb = max_mb or settings.max_mb
+    timeout = timeout or settings.ytdlp_timeout
+    plan = DownloadPlan()
+    for kind in kinds:
+        plan.kinds[kind] = decide(await estimate(meta, kind), max_mb, timeout)
+    if all(p.action == "reject" for p in plan.kinds.values()):
+        reason = next(p.reason for p in plan.kinds.values())
+        raise CostRejectedError(f"Не могу скачать: {reason}")
+    return plan
+
+def _ewma(old: float | None, new: float) -> float:
+    return new if old is None else old + EWMA_ALPHA * (new - old)
+
+async def record_download(
+    extractor: str,
+    kind: str,
+    media_duration: int | None,
+    est: CostEstimate | None,
+    actual_bytes: int,
+    actual_seconds: float,
+) -> None:
+    if actual_bytes <= 0 or actual_seconds <= 0:
+        return
+    try:
+        async with Session() as s:
+            q = await s.execute(
+                select(ExtractorStat).where(ExtractorStat.extractor == extractor, ExtractorStat.kind == kind)
+            )
+            stat = q.scalar_one_or_none()
+            if not stat:
+                stat = ExtractorStat(extractor=extractor, kind=kind, samples=0, predictions=0,
+                                     bytes_err_sum=0.0, seconds_err_sum=0.0)
+                s.add(stat)
+
+            if est is not None:
+                stat.predictions += 1
+                if est.bytes:
+                    stat.bytes_err_sum += abs(est.bytes - actual_bytes) / actual_bytes
+                stat.seconds_err_sum += abs(est.seconds - actual_seconds) / actual_seconds
+
+            if media_duration:
+                stat.bytes_per_media_sec = _ewma(stat.bytes_per_media_sec, actual_bytes / media_duration)
+            transfer_sec = max(actual_seconds - OVERHEAD_SEC, 0.5)
+            stat.bytes_per_wall_sec = _ewma(stat.bytes_per_wall_sec, actual_bytes / transfer_sec)
+            stat.samples += 1
+            stat.updated_at = datetime.now(timezone.utc)
+            await s.commit()
+    except IntegrityError:
+        # параллельная вставка той же пары (extractor, kind) — пропускаем образец
+        pass
+    except Exception as e:
+        print(f"Ошибка сохранения статистики стоимости: {e}")
+
+async def accuracy_report() -> list[dict]:
+    async with Session() as s:
+        rows = (await s.execute(select(ExtractorStat).order_by(ExtractorStat.extractor, ExtractorStat.kind))).scalars().all()
+    return [
+        {
+            "extractor": r.extractor,
+            "kind": r.kind,
+            "samples": r.samples,
+            "bytes_mape": (r.bytes_err_sum / r.predictions) if r.predictions else None,
+            "seconds_mape": (r.seconds_err_sum / r.predictions) if r.predictions else None,
+        }
+        for r in rows
+    ]
@@ -1,45 +1,78 @@
 from aiogram import Router, F
 from aiogram.filters import Command
-from aiogram.types import Message, FSInputFile, InputMediaPhoto, InputMediaVideo, InputMediaDocument
+from aiogram.types import Message, InputMediaPhoto, InputMediaVideo, InputMediaDocument
 from aiogram.exceptions import TelegramBadRequest
 
-from app.utils import is_supported_url, is_youtube_regular, bot_mention
+from app.utils import is_supported_url, is_youtube_regular, bot_mention, file_hash
 from app.features.downloader.media import (
     extract_info,
     download_media,
-    download_instagram_post_media,
+    iter_instagram_post_media,
+    PostMediaItem,
     download_tiktok_images,
     download_tiktok_sound,
-    download_spotify_track,
+    tiktok_post_meta,
+    iter_tiktok_images,
+    fetch_tiktok_sound,
 )
 
 from app.core.antispam import (
-    check_rate, get_user_lock, get_inflight_task, set_inflight_task,
-    enqueue_or_fail, dequeue, RateLimitError, QueueOverflowError
+    check_rate, get_inflight_task, set_inflight_task,
+    enqueue_or_fail, dequeue, RateLimitError, QueueOverflowError, MAX_QUEUE
 )
+from app.core.jobs import enqueue_job, count_active_jobs, has_active_job, current_run
 
 from app.core.telemetry import log_event
 from app.core.config import settings
 from app.core.db import Session
 from app.core.models import Download, User
-from app.core.cache import get_cached_tg_file_id, upsert_cached_tg_file_id
+from app.core.cache import (
+    get_cached_tg_file_id, upsert_cached_tg_file_id, get_file_id_by_hash, upsert_file_id_by_hash,
+    get_tiktok_music_id, remember_tiktok_music_id,
+)
+from app.core.scheduler import scheduler
+from app.core import botapi, workspace, http, metrics, tracing
+from app.core.tracing import traced
+from app.core.images import photo_preview
+from app.features.downloader.video import probe_video
+from app.features.downloader.spotify import (
+    SpotifyTrack,
+    parse_url as parse_spotify_url,
+    resolve as resolve_spotify,
+    download_track as download_spotify_track,
+)
+from app.features.downloader.cost import (
+    plan_download, record_download, DownloadPlan, KindPlan, CostRejectedError
+)
+from app.core.admission import track, load_state, check_download_allowed, OverloadError, OVERLOADED
 
 from sqlalchemy import select
 import os
 import asyncio
-import httpx
+import logging
 import re
+import time
+from typing import AsyncIterator
+
+logger = logging.getLogger(__name__)
 
 router = Router()
 
 async def resolve_redirect(url: str) -> str:
+    # нужен только конечный адрес: тело страницы не читаем
     try:
-        async with httpx.AsyncClient(follow_redirects=True, timeout=10) as client:
-            r = await client.get(url)
-            return str(r.url)
+        with metrics.stage("redirect"):
+            async with http.client().stream("GET", url, timeout=10) as r:
+                return str(r.url)
     except Exception:
         return url
 
+def _file_size(path: str) -> int | None:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return None
+
 @router.message(Command("start"))
 async def start(msg: Message):
     await msg.answer(
@@ -48,7 +81,7 @@ async def start(msg: Message):
         "• TikTok видео\n"
         "• YouTube Shorts\n"
         "• Instagram Reels\n"
-        "• Spotify треки\n"
+        "• Spotify треки, альбомы и плейлисты\n"
         "\U0001F3A5 Я автоматически скачаю видео и аудио!\n"
         "\U0001F4CA Статистика: /me\n\n"
         f"\U0001F4E6 Лимит файла: {settings.max_mb} MB"
@@ -72,13 +105,22 @@ async def handle_url(msg: Message):
         else:
             return
 
-    url = text
+    async with tracing.request("handle_url", msg.from_user.id, text):
+        await _handle_supported_url(msg, text)
+
+async def _handle_supported_url(msg: Message, url: str):
     if "vm.tiktok.com" in url:
         url = await resolve_redirect(url)
 
+    if load_state() == OVERLOADED:
+        return await msg.reply("🔥 Бот сейчас перегружен, попробуйте через пару минут.")
+
+    if settings.job_queue:
+        return await enqueue_url(msg, url)
+
     try:
         check_rate(msg.from_user.id)             # бросит RateLimitError при нарушении
-        await enqueue_or_fail(msg.from_user.id)  # ограничим количество параллельных задач в очереди
+        enqueue_or_fail(msg.from_user.id)        # ограничим количество задач пользователя в очереди
     except RateLimitError as e:
         return await msg.reply(f"🚦 {e}")
     except QueueOverflowError as e:
@@ -89,31 +131,22 @@ async def handle_url(msg: Message):
         dequeue(msg.from_user.id)
         return await msg.reply("♻️ Эта ссылка уже обрабатывается, дождитесь результата.")
 
-    user_lock = get_user_lock(msg.from_user.id)
-    async with user_lock:
-        set_inflight_task(msg.from_user.id, url, asyncio.current_task())
+    set_inflight_task(msg.from_user.id, url, asyncio.current_task())
 
+    with track():
         await log_event(msg.from_user.id, "get", url)
         loading_msg = await msg.reply("🔄 Загружаю медиа, подождите немного...")
 
         try:
-            if "spotify.com" in url:
-                await send_spotify_track(msg, url)
-
-            elif "tiktok.com" in url and "/photo/" in url:
-                await send_tiktok_album(msg, url, is_photo=True)
-
-            elif ("instagram.com" in url or "instagr.am" in url) and "/p/" in url:
-                await send_instagram_post_album(msg, url)
-
-            else:
-                meta = await extract_info(url)
-                if meta.extractor == "tiktok" and meta.duration is None:
-                    await send_tiktok_album(msg, url, is_photo=True)
-                else:
-                    await download_and_send_both(msg, url, meta)
-
+            await process_url(msg, url)
+        except OverloadError as e:
+            tracing.fail(e)
+            await msg.reply(f"⏳ {e}")
+        except CostRejectedError as e:
+            tracing.fail(e)
+            await msg.reply(f"📏 {e}")
         except Exception as e:
+            tracing.fail(e)
             await msg.reply(f"❌ Произошла ошибка: {e}")
         finally:
             try:
@@ -122,220 +155,521 @@ async def handle_url(msg: Message):
                 pass
             dequeue(msg.from_user.id)
 
-async def send_spotify_track(msg: Message, url: str):
-    m = re.search(r"spotify\.com/track/([A-Za-z0-9]+)", url)
-    track_id = m.group(1) if m else url
-    extractor, source = "spotify", "spotify"
-
+async def enqueue_url(msg: Message, url: str):
     try:
-        async with Session() as s:
-            cached = await get_cached_tg_file_id(s, extractor, track_id, "audio")
-        if cached:
-            mention = await bot_mention(msg.bot)
-            await msg.answer_audio(audio=cached,
-                                   caption=f"🎵 <b>Спасибо что пользуетесь нашим ботом!</b> \n\n🤖 <b>{mention}</b>",
-                                   parse_mode="HTML")
+        check_rate(msg.from_user.id)
+        if await count_active_jobs(msg.from_user.id) >= MAX_QUEUE:
+            raise QueueOverflowError("Слишком много задач в очереди, попробуй позже.")
+    except RateLimitError as e:
+        return await msg.reply(f"🚦 {e}")
+    except QueueOverflowError as e:
+        return await msg.reply(f"⏳ {e}")
+
+    if await has_active_job(msg.from_user.id, url):
+        return await msg.reply("♻️ Эта ссылка уже обрабатывается, дождитесь результата.")
+
+    await log_event(msg.from_user.id, "get", url)
+    loading_msg = await msg.reply("🔄 Загружаю медиа, подождите немного...")
+    await enqueue_job(
+        url=url,
+        chat_id=msg.chat.id,
+        user_tg_id=msg.from_user.id,
+        message_json=msg.model_dump_json(exclude_none=True),
+        status_message_id=loading_msg.message_id,
+        max_attempts=settings.job_max_attempts,
+    )
+
+# Условная стоимость задач без метаданных для планировщика: ~секунды работы загрузчика
+COST_AUDIO = 5.0
+COST_ALBUM = 30.0
+ALBUM_SIZE = 10  # максимум элементов в sendMediaGroup
+
+async def process_url(msg: Message, url: str):
+    # Быстрая полоса: ответы из кэша file_id не ждут слота планировщика
+    user_id = msg.from_user.id
+
+    if "spotify.com" in url and (parse_spotify_url(url) or ("",))[0] in ("album", "playlist"):
+        check_download_allowed()
+        async with scheduler.slot(user_id, cost=COST_ALBUM):
+            await send_spotify_collection(msg, url)
+
+    elif "spotify.com" in url:
+        if await send_cached_spotify_track(msg, url):
+            return
+        check_download_allowed()
+        async with scheduler.slot(user_id, cost=COST_AUDIO):
+            await send_spotify_track(msg, url)
+
+    elif "tiktok.com" in url and "/photo/" in url:
+        check_download_allowed()
+        async with scheduler.slot(user_id, cost=COST_ALBUM):
+            await send_tiktok_album(msg, url, is_photo=True)
+
+    elif ("instagram.com" in url or "instagr.am" in url) and "/p/" in url:
+        check_download_allowed()
+        async with scheduler.slot(user_id, cost=COST_ALBUM):
+            await send_instagram_post_album(msg, url)
+
+    else:
+        meta = await extract_info(url)
+        if meta.extractor == "tiktok" and meta.duration is None:
+            check_download_allowed()
+            async with scheduler.slot(user_id, cost=COST_ALBUM):
+                await send_tiktok_album(msg, url, is_photo=True)
+        elif await send_cached_both(msg, meta):
             return
+        else:
+            check_download_allowed()
+            plan = await plan_download(meta)  # отказ или понижение качества до загрузки
+            async with scheduler.slot(user_id, cost=plan.cost):
+                await download_and_send_both(msg, url, meta, plan)
 
-        mention = await bot_mention(msg.bot)
-        loop = asyncio.get_running_loop()
-        track_path = await loop.run_in_executor(None, lambda: download_spotify_track(url))
+def _spotify_track_id(url: str) -> str:
+    parsed = parse_spotify_url(url)
+    return parsed[1] if parsed and parsed[0] == "track" else url
+
+@traced
+async def send_cached_spotify_track(msg: Message, url: str) -> bool:
+    async with Session() as s:
+        cached = await get_cached_tg_file_id(s, "spotify", _spotify_track_id(url), "audio")
+    if not cached:
+        return False
+    mention = await bot_mention(msg.bot)
+    await msg.answer_audio(audio=cached,
+                           caption=f"🎵 <b>Спасибо что пользуетесь нашим ботом!</b> \n\n🤖 <b>{mention}</b>",
+                           parse_mode="HTML")
+    await log_event(msg.from_user.id, "download", f"spotify_cached:{url}")
+    return True
+
+@traced
+async def send_cached_both(msg: Message, meta) -> bool:
+    extractor = (meta.extractor or "unknown")
+    media_id = (meta.id or meta.webpage_url)
+    async with Session() as s:
+        cached_video_id = await get_cached_tg_file_id(s, extractor, media_id, "video")
+        cached_audio_id = await get_cached_tg_file_id(s, extractor, media_id, "audio")
+    if not (cached_video_id and cached_audio_id):
+        return False
+
+    mention = await bot_mention(msg.bot)
+    await msg.answer_video(
+        video=cached_video_id,
+        caption=f"🎥 <b>Спасибо что пользуетесь нашим ботом!</b> \n\n🤖 <b>{mention}</b>",
+        supports_streaming=True,
+        parse_mode="HTML",
+    )
+    await msg.answer_audio(audio=cached_audio_id)
+    await log_event(msg.from_user.id, "download", f"both_cached:{meta.webpage_url}")
+    return True
+
+async def _send_spotify_audio(msg: Message, url: str, track: SpotifyTrack, path: str, caption: str | None = None):
+    extractor, source = "spotify", "spotify"
+    known_id, digest = await _lookup_by_content(path, "audio")
+    sent = await msg.answer_audio(
+        audio=known_id or botapi.input_file(path),
+        title=track.title if track.performer else None,
+        performer=track.performer,
+        duration=track.duration,
+        caption=caption,
+        parse_mode="HTML" if caption else None,
+    )
+    if not known_id:
+        await _remember_content(digest, "audio", sent.audio.file_id, sent.audio.file_unique_id, path)
 
-        sent = await msg.answer_audio(
-            audio=FSInputFile(track_path),
-            caption=f"🎵 <b>Спасибо что пользуетесь нашим ботом!</b> \n\n🤖 <b>{mention}</b>",
-            parse_mode="HTML",
+    await save_download_stats(msg.from_user.id, url, path, "audio", track.duration)
+    async with Session() as s:
+        await upsert_cached_tg_file_id(
+            s, source=source, extractor=extractor, media_id=track.id, kind="audio",
+            tg_file_id=sent.audio.file_id, tg_file_unique_id=sent.audio.file_unique_id
         )
 
-        await save_download_stats(msg.from_user.id, url, track_path, "audio")
-        async with Session() as s:
-            await upsert_cached_tg_file_id(
-                s, source=source, extractor=extractor, media_id=track_id, kind="audio",
-                tg_file_id=sent.audio.file_id, tg_file_unique_id=sent.audio.file_unique_id
+@traced
+async def send_spotify_track(msg: Message, url: str):
+    extractor = "spotify"
+
+    try:
+        mention = await bot_mention(msg.bot)
+        track = (await resolve_spotify(url))[0]
+        track_path = await download_spotify_track(track, cache_key=(extractor, track.id))
+        try:
+            await _send_spotify_audio(
+                msg, url, track, track_path,
+                caption=f"🎵 <b>Спасибо что пользуетесь нашим ботом!</b> \n\n🤖 <b>{mention}</b>",
             )
-        try: os.remove(track_path)
-        except OSError: pass
+        finally:
+            workspace.release(track_path)
 
         await log_event(msg.from_user.id, "download", f"spotify:{url}")
 
     except Exception as e:
-        await msg.reply(f"❌ Не удалось скачать трек из Spotify: {e}")
         await log_event(msg.from_user.id, "error", f"spotify_download: {e}")
+        if current_run() is not None:
+            raise
+        tracing.fail(e)
+        await msg.reply(f"❌ Не удалось скачать трек из Spotify: {e}")
+
+@traced
+async def send_spotify_collection(msg: Message, url: str):
+    # альбом/плейлист: уже отправленные треки — из MediaCache, остальные качаются параллельно
+    # (не больше SPOTIFY_THREADS одновременно) и уходят по порядку, как только готовы
+    extractor = "spotify"
+    try:
+        tracks = await resolve_spotify(url)
+    except Exception as e:
+        await log_event(msg.from_user.id, "error", f"spotify_list: {e}")
+        if current_run() is not None:
+            raise
+        tracing.fail(e)
+        return await msg.reply(f"❌ Не удалось получить список треков Spotify: {e}")
+    if not tracks:
+        return await msg.reply("❌ В этом списке Spotify нет треков.")
+
+    async with Session() as s:
+        cached = {t.id: await get_cached_tg_file_id(s, extractor, t.id, "audio") for t in tracks}
+    tasks = {
+        t.id: asyncio.create_task(download_spotify_track(t, cache_key=(extractor, t.id)))
+        for t in tracks if not cached[t.id]
+    }
+
+    await msg.answer(f"🎵 Треков: {len(tracks)}, отправляю по мере загрузки…")
+    failed = 0
+    try:
+        for t in tracks:
+            if cached[t.id]:
+                await msg.answer_audio(audio=cached[t.id])
+                continue
+            try:
+                path = await tasks[t.id]
+            except Exception as e:
+                failed += 1
+                logger.warning(f"Spotify: трек {t.id} не скачан: {e}")
+                continue
+            try:
+                await _send_spotify_audio(msg, url, t, path)
+            finally:
+                workspace.release(path)
+    finally:
+        for task in tasks.values():
+            if not task.done():
+                task.cancel()
+            _release_when_done(task)
+
+    if failed:
+        await msg.answer(f"⚠️ Не удалось скачать треков: {failed} из {len(tracks)}")
+    await log_event(msg.from_user.id, "download", f"spotify_list:{url}")
+
+def _release_when_done(fut: asyncio.Future):
+    # результат фоновой загрузки не понадобился — удаляем его каталог, когда она закончится
+    def _cb(f: asyncio.Future):
+        if not f.cancelled() and f.exception() is None:
+            result = f.result()
+            workspace.release(getattr(result, "path", result))
+    fut.add_done_callback(_cb)
+
+async def _video_attrs(path: str) -> dict:
+    # размеры, длительность и кадр-превью: клиент показывает плеер, не дожидаясь всего файла
+    info = await probe_video(path)
+    attrs = {"width": info.width, "height": info.height, "duration": info.duration}
+    if info.thumbnail:
+        attrs["thumbnail"] = botapi.input_file(info.thumbnail)
+    return {k: v for k, v in attrs.items() if v is not None}
+
+async def _lookup_by_content(path: str, kind: str) -> tuple[str | None, str]:
+    # одинаковые байты под разными media_id отправляем по уже известному file_id, без загрузки
+    digest = await asyncio.to_thread(file_hash, path)
+    async with Session() as s:
+        return await get_file_id_by_hash(s, digest, kind), digest
+
+async def _remember_content(digest: str, kind: str, file_id: str, file_unique_id: str, path: str):
+    async with Session() as s:
+        await upsert_file_id_by_hash(
+            s, content_hash=digest, kind=kind,
+            tg_file_id=file_id, tg_file_unique_id=file_unique_id,
+            size=await asyncio.to_thread(_file_size, path),
+        )
+
+async def _album_item(s, extractor: str, media_id: str, kind: str, path: str) -> tuple:
+    # (источник, ссылка, путь, media_id, хэш): cached — по media_id, dedup — по содержимому, file — загрузка
+    fid = await get_cached_tg_file_id(s, extractor, media_id, kind)
+    if fid:
+        return ("cached", fid, path, media_id, None)
+    fid, digest = await _lookup_by_content(path, kind)
+    if fid:
+        return ("dedup", fid, path, media_id, digest)
+    return ("file", path, path, media_id, digest)
+
+async def _in_groups(items: AsyncIterator, size: int = ALBUM_SIZE) -> AsyncIterator[list]:
+    # группа альбома отдаётся, как только набралась, пока остальные элементы ещё качаются
+    grp = []
+    async for item in items:
+        grp.append(item)
+        if len(grp) == size:
+            yield grp
+            grp = []
+    if grp:
+        yield grp
+
+async def _iter_list(coro) -> AsyncIterator:
+    # загрузчик, возвращающий готовый список, в виде потока
+    for item in await coro:
+        yield item
+
+async def _photo_previews(paths: list[str]) -> list[str | None]:
+    # JPEG в пределах лимитов sendPhoto рядом с оригиналом, в каталоге той же задачи
+    dirs = [workspace.subdir(workspace.job_root(p) or os.path.dirname(p), "preview") for p in paths]
+    return list(await asyncio.gather(*(photo_preview(p, d) for p, d in zip(paths, dirs))))
+
+async def _answer_group(msg: Message, media_group: list) -> list[Message]:
+    # sendMediaGroup принимает от 2 элементов: одиночный уходит обычной отправкой
+    if len(media_group) > 1:
+        return await msg.answer_media_group(media_group)
+    m = media_group[0]
+    if isinstance(m, InputMediaPhoto):
+        return [await msg.answer_photo(photo=m.media)]
+    if isinstance(m, InputMediaVideo):
+        attrs = {k: getattr(m, k) for k in ("width", "height", "duration", "thumbnail", "supports_streaming")}
+        return [await msg.answer_video(video=m.media, **{k: v for k, v in attrs.items() if v is not None})]
+    return [await msg.answer_document(document=m.media)]
+
+async def _send_tiktok_group(msg: Message, s, post_id: str, paths: list[str], kind: str):
+    source, extractor = "tiktok", "tiktok"
+    prefix = "img" if kind == "image" else "orig"
+    input_media = InputMediaPhoto if kind == "image" else InputMediaDocument
+
+    send_items = []
+    for p in paths:
+        media_id = f"{post_id}:{prefix}:{os.path.basename(p)}"
+        send_items.append(await _album_item(s, extractor, media_id, kind, p))
+
+    media_group = []
+    for src, ref, _, _, _ in send_items:
+        media_group.append(input_media(media=botapi.input_file(ref) if src == "file" else ref))
+
+    msgs = await _answer_group(msg, media_group)
+
+    for sent, (src, _ref, orig_path, media_id, digest) in zip(msgs, send_items):
+        if src == "cached":
+            continue
+        if kind == "image" and sent.photo:
+            fid, fuid = sent.photo[-1].file_id, sent.photo[-1].file_unique_id
+        elif kind == "document" and sent.document:
+            fid, fuid = sent.document.file_id, sent.document.file_unique_id
+        else:
+            continue
+        await upsert_cached_tg_file_id(
+            s, source=source, extractor=extractor,
+            media_id=media_id, kind=kind,
+            tg_file_id=fid, tg_file_unique_id=fuid
+        )
+        if src == "file":
+            await _remember_content(digest, kind, fid, fuid, orig_path)
 
 def _tiktok_post_id(url: str) -> str:
     m = re.search(r"/(?:photo|video)/(\d+)", url)
     return m.group(1) if m else url
 
+@traced
 async def send_tiktok_album(msg: Message, url: str, is_photo: bool = False):
-    loop = asyncio.get_running_loop()
     post_id = _tiktok_post_id(url)
     source, extractor = "tiktok", "tiktok"
+    sound_key = f"{post_id}:sound"
 
-    sound_task = loop.run_in_executor(None, lambda: download_tiktok_sound(url, is_photo=is_photo))
-
+    # одни метаданные на пост: из них берутся и слайды, и звук; без них — прежний путь через gallery-dl/yt-dlp
     try:
-        result = await loop.run_in_executor(None, lambda: download_tiktok_images(url, max_items=None))
-        preview = result.get("preview", [])
-        originals = result.get("originals", [])
-    except Exception:
-        return await msg.reply("❌ Не удалось скачать TikTok-альбом.")
+        post = await tiktok_post_meta(url)
+    except Exception as e:
+        logger.warning(f"TikTok: метаданные поста не получены ({e}), скачиваю по отдельности")
+        post = None
 
     async with Session() as s:
-        for grp in [preview[i:i+10] for i in range(0, len(preview), 10)]:
-            send_items = []
-            for p in grp:
-                media_id = f"{post_id}:img:{os.path.basename(p)}"
-                fid = await get_cached_tg_file_id(s, extractor, media_id, "image")
-                if fid:
-                    send_items.append(("cached", fid, p, media_id))
-                else:
-                    send_items.append(("file", p, p, media_id))
-
-            media_group = []
-            for kind, ref, _, _ in send_items:
-                if kind == "cached":
-                    media_group.append(InputMediaPhoto(media=ref))
-                else:
-                    media_group.append(InputMediaPhoto(media=FSInputFile(ref)))
-
-            msgs = await msg.answer_media_group(media_group)
-
-            for sent, (kind, _ref, orig_path, media_id) in zip(msgs, send_items):
-                if kind == "file" and sent.photo:
-                    fid = sent.photo[-1].file_id
-                    fuid = sent.photo[-1].file_unique_id
-                    await upsert_cached_tg_file_id(
-                        s, source=source, extractor=extractor,
-                        media_id=media_id, kind="image",
-                        tg_file_id=fid, tg_file_unique_id=fuid
-                    )
-                    try: os.remove(orig_path)
-                    except OSError: pass
-
-    if originals:
-        await msg.answer("📦 Оригиналы в максимальном качестве, если вы любите чёткость!")
-        async with Session() as s:
-            for grp in [originals[i:i+10] for i in range(0, len(originals), 10)]:
-                send_items = []
-                for p in grp:
-                    media_id = f"{post_id}:orig:{os.path.basename(p)}"
-                    fid = await get_cached_tg_file_id(s, extractor, media_id, "document")
-                    if fid:
-                        send_items.append(("cached", fid, p, media_id))
-                    else:
-                        send_items.append(("file", p, p, media_id))
-
-                media_group = []
-                for kind, ref, _, _ in send_items:
-                    if kind == "cached":
-                        media_group.append(InputMediaDocument(media=ref))
-                    else:
-                        media_group.append(InputMediaDocument(media=FSInputFile(ref)))
-
-                msgs = await msg.answer_media_group(media_group)
+        cached_sound = await get_cached_tg_file_id(s, extractor, sound_key, "audio")
+        if not cached_sound and post and post.music_id:
+            cached_sound = await get_cached_tg_file_id(s, extractor, f"music:{post.music_id}", "audio")
+
+    sound_task = None
+    if cached_sound:
+        pass
+    elif post and post.music_url:
+        sound_task = asyncio.create_task(fetch_tiktok_sound(post, cache_key=(extractor, post_id)))
+    else:
+        sound_task = asyncio.create_task(
+            download_tiktok_sound(url, is_photo=is_photo, cache_key=(extractor, post_id))
+        )
 
-                for sent, (kind, _ref, orig_path, media_id) in zip(msgs, send_items):
-                    if kind == "file" and sent.document:
-                        fid = sent.document.file_id
-                        fuid = sent.document.file_unique_id
-                        await upsert_cached_tg_file_id(
-                            s, source=source, extractor=extractor,
-                            media_id=media_id, kind="document",
-                            tg_file_id=fid, tg_file_unique_id=fuid
-                        )
-                        try: os.remove(orig_path)
-                        except OSError: pass
+    if post and post.images:
+        images = iter_tiktok_images(post, max_items=None)
+    else:
+        images = _iter_list(download_tiktok_images(url, max_items=None))
 
+    # превью уходят группами по мере загрузки; оригиналы потом — из тех же файлов
+    originals: list[str] = []
     try:
-        sound_key = f"{post_id}:sound"
         async with Session() as s:
-            cached = await get_cached_tg_file_id(s, extractor, sound_key, "audio")
+            async for grp in _in_groups(images):
+                originals.extend(grp)
+                preview = [p for p in await _photo_previews(grp) if p]
+                if preview:
+                    await _send_tiktok_group(msg, s, post_id, preview, "image")
+
+            if originals:
+                await msg.answer("📦 Оригиналы в максимальном качестве, если вы любите чёткость!")
+                for i in range(0, len(originals), ALBUM_SIZE):
+                    await _send_tiktok_group(msg, s, post_id, originals[i:i + ALBUM_SIZE], "document")
+    except Exception:
+        workspace.release(*originals)
+        if sound_task:
+            _release_when_done(sound_task)
+        if not originals and current_run() is None:
+            return await msg.reply("❌ Не удалось скачать TikTok-альбом.")
+        raise
 
-        if cached:
-            await msg.answer_audio(audio=cached)
+    try:
+        if cached_sound:
+            await msg.answer_audio(audio=cached_sound)
         else:
             mention = await bot_mention(msg.bot)
-            sound_path = await asyncio.wait_for(sound_task, timeout=20)
-            sent = await msg.answer_audio(
-                audio=FSInputFile(sound_path),
-                caption=f"🎵 <b>Спасибо что пользуетесь нашим ботом!</b> \n\n🤖 <b>{mention}</b>",
-                parse_mode="HTML",
-            )
-            async with Session() as s:
-                await upsert_cached_tg_file_id(
-                    s, source=source, extractor=extractor,
-                    media_id=sound_key, kind="audio",
-                    tg_file_id=sent.audio.file_id, tg_file_unique_id=sent.audio.file_unique_id
+            sound = await asyncio.wait_for(sound_task, timeout=20)
+            try:
+                # один и тот же звук используется в тысячах постов: ключ — music id, а не пост.
+                # Звук из кэша по ключу поста приходит без music id — он берётся из tiktok_music
+                known_id, digest = None, None
+                async with Session() as s:
+                    music_id = sound.music_id
+                    if music_id:
+                        await remember_tiktok_music_id(s, post_id, music_id)
+                    else:
+                        music_id = await get_tiktok_music_id(s, post_id)
+                    music_key = f"music:{music_id}" if music_id else None
+                    if music_key:
+                        known_id = await get_cached_tg_file_id(s, extractor, music_key, "audio")
+                if not known_id:
+                    known_id, digest = await _lookup_by_content(sound.path, "audio")
+                sent = await msg.answer_audio(
+                    audio=known_id or botapi.input_file(sound.path),
+                    caption=f"🎵 <b>Спасибо что пользуетесь нашим ботом!</b> \n\n🤖 <b>{mention}</b>",
+                    parse_mode="HTML",
                 )
-            try: os.remove(sound_path)
-            except OSError: pass
+                fid, fuid = sent.audio.file_id, sent.audio.file_unique_id
+                async with Session() as s:
+                    for key in filter(None, (sound_key, music_key)):
+                        await upsert_cached_tg_file_id(
+                            s, source=source, extractor=extractor,
+                            media_id=key, kind="audio",
+                            tg_file_id=fid, tg_file_unique_id=fuid
+                        )
+                if digest and not known_id:
+                    await _remember_content(digest, "audio", fid, fuid, sound.path)
+            finally:
+                workspace.release(sound.path)
     except Exception as e:
+        tracing.fail(e)
         await msg.answer(f"⚠️ Не удалось получить оригинальный звук: {e}")
 
-    for p in preview + originals:
+    for p in originals:
         await save_download_stats(msg.from_user.id, url, p, "image")
+    workspace.release(*originals)
     await log_event(msg.from_user.id, "download", f"tiktok_images:{url}")
 
 def _instagram_post_id(url: str) -> str:
     m = re.search(r"/p/([^/?#]+)/?", url)
     return m.group(1) if m else url
 
+async def _send_instagram_group(msg: Message, s, post_id: str, grp: list[PostMediaItem]):
+    source, extractor = "reels", "instagram"
+    previews = await _photo_previews([item.path for item in grp if item.kind == "image"])
+    send_items = []
+    for item in grp:
+        media_id = f"{post_id}:{os.path.basename(item.path)}"
+        if item.kind != "image":
+            kind, path = "video", item.path
+        elif preview := previews.pop(0):
+            kind, path = "image", preview
+        else:
+            # без превью (фото вытянуто сильнее PHOTO_MAX_RATIO) sendPhoto его не примет — только документом
+            kind, path = "document", item.path
+        send_items.append((kind, *await _album_item(s, extractor, media_id, kind, path)))
+
+    # документы в одном альбоме с фото и видео Telegram не принимает — они уходят отдельной группой
+    album = [x for x in send_items if x[0] != "document"]
+    documents = [x for x in send_items if x[0] == "document"]
+    for part in filter(None, (album, documents)):
+        media_group = []
+        for kind, kind_src, ref, _orig_path, _mid, _digest in part:
+            media = botapi.input_file(ref) if kind_src == "file" else ref
+            if kind == "image":
+                media_group.append(InputMediaPhoto(media=media))
+            elif kind == "document":
+                media_group.append(InputMediaDocument(media=media))
+            elif kind_src == "file":
+                attrs = await _video_attrs(ref)
+                media_group.append(InputMediaVideo(media=media, supports_streaming=True, **attrs))
+            else:
+                media_group.append(InputMediaVideo(media=media))
+
+        msgs = await _answer_group(msg, media_group)
+
+        for sent, (kind, kind_src, _ref, orig_path, media_id, digest) in zip(msgs, part):
+            if kind_src == "cached":
+                continue
+            if kind == "image" and sent.photo:
+                fid, fuid = sent.photo[-1].file_id, sent.photo[-1].file_unique_id
+            elif kind == "video" and sent.video:
+                fid, fuid = sent.video.file_id, sent.video.file_unique_id
+            elif kind == "document" and sent.document:
+                fid, fuid = sent.document.file_id, sent.document.file_unique_id
+            else:
+                continue
+
+            await upsert_cached_tg_file_id(
+                s, source=source, extractor=extractor,
+                media_id=media_id, kind=kind,
+                tg_file_id=fid, tg_file_unique_id=fuid
+            )
+            if kind_src == "file":
+                await _remember_content(digest, kind, fid, fuid, orig_path)
+
+@traced
 async def send_instagram_post_album(msg: Message, url: str):
     post_id = _instagram_post_id(url)
-    source, extractor = "reels", "instagram"
+    items: list[PostMediaItem] = []
 
     try:
-        items = await asyncio.get_running_loop().run_in_executor(None, lambda: download_instagram_post_media(url, max_items=None))
-    except Exception:
-        return await msg.reply("❌ Не удалось скачать пост Instagram.")
-
-    async with Session() as s:
-        for grp in [items[i:i+10] for i in range(0, len(items), 10)]:
-            send_items = []
-            for item in grp:
-                kind = "image" if item.kind == "image" else "video"
-                media_id = f"{post_id}:{os.path.basename(item.path)}"
-                fid = await get_cached_tg_file_id(s, extractor, media_id, kind)
-                if fid:
-                    send_items.append(("cached", kind, fid, item.path, media_id))
-                else:
-                    send_items.append(("file", kind, item.path, item.path, media_id))
-
-            media_group = []
-            for kind_src, kind, ref, _orig_path, _mid in send_items:
-                if kind == "image":
-                    media_group.append(InputMediaPhoto(media=ref if kind_src == "cached" else FSInputFile(ref)))
-                else:
-                    media_group.append(InputMediaVideo(media=ref if kind_src == "cached" else FSInputFile(ref)))
-
-            msgs = await msg.answer_media_group(media_group)
-
-            for sent, (kind_src, kind, _ref, orig_path, media_id) in zip(msgs, send_items):
-                if kind_src != "file":
-                    continue
-                if kind == "image" and sent.photo:
-                    fid, fuid = sent.photo[-1].file_id, sent.photo[-1].file_unique_id
-                elif kind == "video" and sent.video:
-                    fid, fuid = sent.video.file_id, sent.video.file_unique_id
-                else:
-                    continue
-
-                await upsert_cached_tg_file_id(
-                    s, source=source, extractor=extractor,
-                    media_id=media_id, kind=kind,
-                    tg_file_id=fid, tg_file_unique_id=fuid
-                )
-                try: os.remove(orig_path)
-                except OSError: pass
+        async with Session() as s:
+            async for grp in _in_groups(iter_instagram_post_media(url, max_items=None)):
+                items.extend(grp)
+                await _send_instagram_group(msg, s, post_id, grp)
 
-    for item in items:
-        await save_download_stats(msg.from_user.id, url, item.path, item.kind)
+        for item in items:
+            await save_download_stats(msg.from_user.id, url, item.path, item.kind)
+    except Exception as e:
+        if not items and current_run() is None:
+            tracing.fail(e)
+            return await msg.reply("❌ Не удалось скачать пост Instagram.")
+        raise
+    finally:
+        workspace.release(*(item.path for item in items))
     await log_event(msg.from_user.id, "download", f"post_album:{url}")
 
-async def download_and_send_both(msg: Message, url: str, meta):
+async def _download_measured(url: str, kind: str, meta, kind_plan: KindPlan | None) -> str:
+    started = time.monotonic()
+    path = await download_media(
+        url, kind=kind,
+        max_height=kind_plan.max_height if kind_plan else None,
+        cache_key=(meta.extractor or "unknown", meta.id or meta.webpage_url),
+    )
+    await record_download(
+        meta.extractor or "unknown", kind, meta.duration,
+        kind_plan.estimate if kind_plan else None,
+        await asyncio.to_thread(_file_size, path), time.monotonic() - started,
+    )
+    return path
+
+@traced
+async def download_and_send_both(msg: Message, url: str, meta, plan: DownloadPlan | None = None):
     source = ("shorts" if "youtu" in url else ("reels" if "insta" in url else "tiktok"))
     extractor = (meta.extractor or "unknown")
     media_id = (meta.id or meta.webpage_url)
+    plans = plan.kinds if plan else {}
 
     mention = await bot_mention(msg.bot)
     
@@ -343,11 +677,13 @@ async def download_and_send_both(msg: Message, url: str, meta):
         cached_video_id = await get_cached_tg_file_id(s, extractor, media_id, "video")
         cached_audio_id = await get_cached_tg_file_id(s, extractor, media_id, "audio")
 
+    rejected = {k: p.reason for k, p in plans.items() if p.action == "reject"}
+
     tasks: dict[str, asyncio.Task] = {}
-    if not cached_video_id:
-        tasks["video"] = asyncio.create_task(download_media(url, kind="video"))
-    if not cached_audio_id:
-        tasks["audio"] = asyncio.create_task(download_media(url, kind="audio"))
+    if not cached_video_id and "video" not in rejected:
+        tasks["video"] = asyncio.create_task(_download_measured(url, "video", meta, plans.get("video")))
+    if not cached_audio_id and "audio" not in rejected:
+        tasks["audio"] = asyncio.create_task(_download_measured(url, "audio", meta, plans.get("audio")))
 
     sent_v = None
     sent_a = None
@@ -360,16 +696,21 @@ async def download_and_send_both(msg: Message, url: str, meta):
                 supports_streaming=True,
                 parse_mode="HTML",
             )
+        elif "video" in rejected:
+            await msg.reply(f"⚠️ Видео не отправлю: {rejected['video']}")
         else:
             video_path = await tasks["video"]
             try:
+                known_id, digest = await _lookup_by_content(video_path, "video")
+                attrs = {} if known_id else await _video_attrs(video_path)
                 sent_v = await msg.answer_video(
-                    video=FSInputFile(video_path),
+                    video=known_id or botapi.input_file(video_path),
+                    **attrs,
                     caption=f"🎥 <b>Спасибо что пользуетесь нашим ботом!</b> \n\n🤖 <b>{mention}</b>",
                     supports_streaming=True,
                     parse_mode="HTML",
                 )
-                await save_download_stats(msg.from_user.id, url, video_path, "video")
+                await save_download_stats(msg.from_user.id, url, video_path, "video", meta.duration)
                 async with Session() as s:
                     await upsert_cached_tg_file_id(
                         s,
@@ -380,19 +721,21 @@ async def download_and_send_both(msg: Message, url: str, meta):
                         tg_file_id=sent_v.video.file_id,
                         tg_file_unique_id=sent_v.video.file_unique_id,
                     )
+                if not known_id:
+                    await _remember_content(digest, "video", sent_v.video.file_id, sent_v.video.file_unique_id, video_path)
             finally:
-                try:
-                    os.remove(video_path)
-                except Exception:
-                    pass
+                workspace.release(video_path)
 
         if cached_audio_id:
             sent_a = await msg.answer_audio(audio=cached_audio_id)
+        elif "audio" in rejected:
+            await msg.reply(f"⚠️ Аудио не отправлю: {rejected['audio']}")
         else:
             audio_path = await tasks["audio"]
             try:
-                sent_a = await msg.answer_audio(audio=FSInputFile(audio_path))
-                await save_download_stats(msg.from_user.id, url, audio_path, "audio")
+                known_id, digest = await _lookup_by_content(audio_path, "audio")
+                sent_a = await msg.answer_audio(audio=known_id or botapi.input_file(audio_path))
+                await save_download_stats(msg.from_user.id, url, audio_path, "audio", meta.duration)
                 async with Session() as s:
                     await upsert_cached_tg_file_id(
                         s,
@@ -403,21 +746,23 @@ async def download_and_send_both(msg: Message, url: str, meta):
                         tg_file_id=sent_a.audio.file_id,
                         tg_file_unique_id=sent_a.audio.file_unique_id,
                     )
+                if not known_id:
+                    await _remember_content(digest, "audio", sent_a.audio.file_id, sent_a.audio.file_unique_id, audio_path)
             finally:
-                try:
-                    os.remove(audio_path)
-                except Exception:
-                    pass
+                workspace.release(audio_path)
 
         await log_event(msg.from_user.id, "download", f"both:{url}")
 
     except Exception as e:
-        await msg.reply(f"❌ Ошибка при скачивании: {e}")
         await log_event(msg.from_user.id, "error", f"download: {e}")
+        if current_run() is not None:
+            raise
+        tracing.fail(e)
+        await msg.reply(f"❌ Ошибка при скачивании: {e}")
 
-async def save_download_stats(user_id: int, url: str, file_path: str, kind: str):
+async def save_download_stats(user_id: int, url: str, file_path: str, kind: str, duration: float | None = None):
     try:
-        size = os.path.getsize(file_path) if os.path.exists(file_path) else None
+        size = await asyncio.to_thread(_file_size, file_path)
         async with Session() as s:
             user_result = await s.execute(select(User).where(User.tg_id == user_id))
             user = user_result.scalar()
@@ -431,7 +776,7 @@ async def save_download_stats(user_id: int, url: str, file_path: str, kind: str)
                 source=("shorts" if "youtube" in url or "youtu.be" in url else ("reels" if "instagram" in url else "tiktok")),
                 url=url,
                 title=f"{os.path.basename(file_path)} ({kind})",
-                duration_sec=None,
+                duration_sec=round(duration) if duration else None,
                 file_size=size,
                 ext=os.path.splitext(file_path)[1].lstrip("."),
             ))
@@ -1,18 +1,27 @@
 import asyncio
+import logging
 import os
 import shutil
-import tempfile
-import subprocess
 import mimetypes
 import re
 import json
-import httpx
 from dataclasses import dataclass
-from typing import Literal, List
-from yt_dlp import YoutubeDL
+from typing import AsyncIterator, Literal, List
+from urllib.parse import urlparse
 from app.core.config import settings
+from app.core import workspace, blobstore, http, proc, metrics, binaries
+from app.features.downloader.video import to_streamable_mp4
+
+logger = logging.getLogger(__name__)
 
 TT_HOST_FALLBACK = "api16-normal-c-useast1a"
+POST_FETCH_CONCURRENCY = 4
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".webp"}
+VIDEO_EXTS = {".mp4", ".mov", ".webm", ".mkv", ".avi", ".m4v"}
+MP4_FASTSTART_ARGS = ["-movflags", "+faststart"]
+AUDIO_EXTS = {".mp3", ".m4a", ".aac", ".ogg", ".opus"}
+IG_HEADERS = {"Referer": "https://www.instagram.com/"}
+TT_HEADERS = {"Referer": "https://www.tiktok.com/"}
 
 @dataclass
 class MediaMeta:
@@ -29,6 +38,25 @@ class PostMediaItem:
     kind: Literal["image", "video"]
     path: str
 
+@dataclass
+class PlannedItem:
+    index: int
+    kind: Literal["image", "video"]
+    url: str
+    name: str
+
+@dataclass
+class TikTokPost:
+    post_id: str | None
+    images: list[tuple[str, str]]   # (url, имя файла) в порядке слайдов
+    music_url: str | None
+    music_id: str | None
+
+@dataclass
+class TikTokSound:
+    path: str
+    music_id: str | None
+
 def _base_ytdlp_opts():
     opts = {
         "noprogress": True,
@@ -60,8 +88,26 @@ def _base_ytdlp_opts():
     }
     if settings.ffmpeg_path:
         opts["ffmpeg_location"] = settings.ffmpeg_path
+    if settings.download_proxy:
+        opts["proxy"] = settings.download_proxy
     return opts
 
+def _youtube_dl(opts: dict):
+    # yt_dlp тянет сотни модулей: импортируется при первой загрузке (в потоке пула) или в warm_up
+    from yt_dlp import YoutubeDL
+    return YoutubeDL(opts)
+
+def warm_up():
+    # из потока после старта: импорт yt_dlp и инициализация YoutubeDL не ждут первого запроса
+    with _youtube_dl({"quiet": True, "ignoreconfig": True}) as ydl:
+        ydl.get_info_extractor("Youtube")
+
+def _gallery_dl(*args: str) -> list[str]:
+    cmd = ["gallery-dl"]
+    if settings.download_proxy:
+        cmd += ["--proxy", settings.download_proxy]
+    return cmd + list(args)
+
 def _get_instagram_opts(url: str):
     base_opts = _base_ytdlp_opts()
     if "instagram.com" in url or "instagr.am" in url:
@@ -79,7 +125,7 @@ async def extract_info(url: str) -> MediaMeta:
 
         def _run():
             base = {**_get_instagram_opts(url), "skip_download": True}
-            with YoutubeDL({**base, "format": "bestvideo*+bestaudio/best"}) as ydl:
+            with _youtube_dl({**base, "format": "bestvideo*+bestaudio/best"}) as ydl:
                 info = ydl.extract_info(url, download=False)
                 if info.get("_type") == "playlist" and info.get("entries"):
                     for e in info["entries"] or []:
@@ -87,7 +133,8 @@ async def extract_info(url: str) -> MediaMeta:
                             return e
                 return info
 
-        info = await loop.run_in_executor(None, _run)
+        with metrics.stage("extract_info"):
+            info = await loop.run_in_executor(None, _run)
 
         return MediaMeta(
             id=info.get("id"),
@@ -101,20 +148,20 @@ async def extract_info(url: str) -> MediaMeta:
     except Exception as e:
         raise RuntimeError(f"Failed to extract info: {e}")
 
-def download_tiktok_images(url: str, max_items: int | None = 10):
-    if not shutil.which("gallery-dl"):
+async def download_tiktok_images(url: str, max_items: int | None = 10) -> List[str]:
+    if not binaries.available("gallery-dl"):
         raise RuntimeError("gallery-dl is not installed")
 
-    tmpdir = tempfile.mkdtemp(prefix="telegram-bot-gdl-tt-")
+    job = workspace.job_dir("tt-images-")
+    tmpdir = workspace.subdir(job, "src")
     try:
-        args = ["gallery-dl", "-D", tmpdir, url]
-        subprocess.run(args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=15)
+        await proc.run(_gallery_dl("-D", tmpdir, url), timeout=15, check=False)
 
         images = []
         for root, _, files in os.walk(tmpdir):
             for f in files:
                 p = os.path.join(root, f)
-                if os.path.splitext(p)[1].lower() in {".jpg", ".jpeg", ".png", ".webp"}:
+                if os.path.splitext(p)[1].lower() in IMAGE_EXTS:
                     images.append(p)
 
         if not images:
@@ -124,136 +171,175 @@ def download_tiktok_images(url: str, max_items: int | None = 10):
         if max_items is not None:
             images = images[:max_items]
 
-        preview_dir = tempfile.mkdtemp(prefix="telegram-bot-preview-tt-")
-        originals_dir = tempfile.mkdtemp(prefix="telegram-bot-original-tt-")
-
-        previews, originals = [], []
-        max_bytes = settings.max_mb * 1024 * 1024
-
-        for p in images:
-            orig_dst = os.path.join(originals_dir, os.path.basename(p))
-            shutil.copy2(p, orig_dst)
-            originals.append(orig_dst)
-
-            if os.path.getsize(p) <= max_bytes:
-                prev_dst = os.path.join(preview_dir, os.path.basename(p))
-                shutil.copy2(p, prev_dst)
-                previews.append(prev_dst)
-
-        return {"preview": previews, "originals": originals}
+        originals_dir = workspace.subdir(job, "original")
+        return [workspace.move(p, originals_dir) for p in images]
+    except Exception:
+        workspace.release(job)
+        raise
     finally:
-        shutil.rmtree(tmpdir, ignore_errors=True)
+        await asyncio.to_thread(shutil.rmtree, tmpdir, True)
 
-def download_instagram_post_media(url: str, max_items: int | None = 10) -> List[PostMediaItem]:
-    if not shutil.which("gallery-dl"):
+def _gallery_dl_nodes(output: str):
+    # gallery-dl -j печатает JSON-массив сообщений вида [тип, url?, {метаданные}]
+    # (или по сообщению на строку); обходит списки и словари в порядке следования
+    try:
+        docs = [json.loads(output)]
+    except ValueError:
+        docs = []
+        for line in output.splitlines():
+            line = line.strip()
+            if line:
+                try:
+                    docs.append(json.loads(line))
+                except ValueError:
+                    continue
+    stack = list(reversed(docs))
+    while stack:
+        item = stack.pop()
+        if isinstance(item, dict):
+            yield item
+        elif isinstance(item, list):
+            yield item
+            stack.extend(reversed(item))
+
+def _gallery_dl_urls(output: str) -> list[tuple[str, dict]]:
+    # сообщения Url ([3, url, {метаданные}]) в порядке следования в посте
+    return [
+        (item[1], item[2]) for item in _gallery_dl_nodes(output)
+        if isinstance(item, list) and len(item) >= 3 and item[0] == 3
+        and isinstance(item[1], str) and isinstance(item[2], dict)
+    ]
+
+async def plan_instagram_post(url: str, max_items: int | None = 10) -> List[PlannedItem]:
+    # один проход gallery-dl -j: список элементов поста без загрузки самих файлов
+    if not binaries.available("gallery-dl"):
         raise RuntimeError("gallery-dl is not installed")
     if not settings.instagram_cookies or not os.path.exists(settings.instagram_cookies):
         raise RuntimeError("Instagram cookies file is not configured or not found")
 
-    tmpdir = tempfile.mkdtemp(prefix="telegram-bot-gdl-album-")
+    args = _gallery_dl("--cookies", settings.instagram_cookies, "-j", url)
+    res = await proc.run(args, timeout=30, capture=True, check=False)
+    if res.returncode != 0:
+        raise RuntimeError("gallery-dl failed to read post metadata")
+
+    plan: List[PlannedItem] = []
+    for media_url, kw in _gallery_dl_urls(res.stdout):
+        ext = (kw.get("extension") or os.path.splitext(urlparse(media_url).path)[1].lstrip(".") or "").lower()
+        if media_url.startswith("ytdl:") or f".{ext}" in VIDEO_EXTS:
+            kind = "video"
+        elif f".{ext}" in IMAGE_EXTS:
+            kind = "image"
+        else:
+            continue
+        stem = str(kw.get("media_id") or kw.get("filename") or len(plan))
+        plan.append(PlannedItem(len(plan), kind, media_url, f"{stem}.{ext or 'mp4'}"))
+
+    if max_items is not None:
+        plan = plan[:max_items]
+    if not plan:
+        raise RuntimeError("No media found in post")
+    return plan
+
+async def _ensure_mp4(src_path: str) -> str:
     try:
-        final_dir = tempfile.mkdtemp(prefix="telegram-bot-final-album-")
+        return await to_streamable_mp4(src_path)
+    except Exception:
+        return src_path
 
+def _ytdlp_post_video(url: str, out_dir: str, stem: str) -> str:
+    # элементы без прямой ссылки (DASH) gallery-dl отдаёт как ytdl:<url>
+    ydl_opts = {
+        **_get_instagram_opts(url),
+        "outtmpl": os.path.join(out_dir, f"{stem}.%(ext)s"),
+        "format": "bestvideo*+bestaudio/best",
+        "merge_output_format": "mp4",
+        "prefer_ffmpeg": True,
+        "postprocessor_args": {"merger+ffmpeg_o": MP4_FASTSTART_ARGS},
+    }
+    with _youtube_dl(ydl_opts) as ydl:
+        ydl.extract_info(url, download=True)
+    for f in os.listdir(out_dir):
+        if f.startswith(f"{stem}.") and not f.endswith(".part"):
+            return os.path.join(out_dir, f)
+    raise RuntimeError("yt-dlp produced no file")
+
+async def iter_instagram_post_media(url: str, max_items: int | None = 10) -> AsyncIterator[PostMediaItem]:
+    """
+    Элементы поста Instagram по мере готовности, в порядке следования в посте.
+
+    Метаданные читаются одним вызовом gallery-dl, после чего каждый элемент
+    скачивается ровно один раз — параллельно, через общий пул HTTP (или через
+    yt-dlp, если у видео нет прямой ссылки). Файлы принадлежат вызывающему:
+    он освобождает их через workspace.release().
+    """
+    loop = asyncio.get_running_loop()
+    plan = await plan_instagram_post(url, max_items)
+
+    job = workspace.job_dir("ig-post-")
+    final_dir = workspace.subdir(job, "final")
+    max_bytes = settings.max_mb * 1024 * 1024
+    sem = asyncio.Semaphore(POST_FETCH_CONCURRENCY)
+
+    async def _fetch(item: PlannedItem) -> PostMediaItem:
+        async with sem:
+            if item.url.startswith("ytdl:"):
+                stem = os.path.splitext(item.name)[0]
+                with metrics.stage("download"):
+                    dst = await loop.run_in_executor(None, _ytdlp_post_video, item.url[5:], final_dir, stem)
+                metrics.add_bytes("download", os.path.getsize(dst))
+            else:
+                dst = os.path.join(final_dir, item.name)
+                await http.fetch_to(item.url, dst, max_bytes, headers=IG_HEADERS)
+            if item.kind == "video":
+                dst = await _ensure_mp4(dst)
+            if not 0 < os.path.getsize(dst) <= max_bytes:
+                raise RuntimeError("File is empty or too large")
+            return PostMediaItem(item.kind, dst)
+
+    produced = 0
+    try:
+        tasks = [asyncio.create_task(_fetch(item)) for item in plan]
         try:
-            ydl_outtmpl = os.path.join(final_dir, "%(id)s.%(ext)s")
-            ydl_opts = {
-                **_get_instagram_opts(url),
-                "outtmpl": ydl_outtmpl,
-                "format": "bestvideo*+bestaudio/best",
-                "merge_output_format": "mp4",
-                "prefer_ffmpeg": True,
-                "quiet": True,
-                "noprogress": True,
-            }
-            with YoutubeDL(ydl_opts) as ydl:
-                ydl.extract_info(url, download=True)
-        except Exception:
-            pass
-
-        args = ["gallery-dl", "--cookies", settings.instagram_cookies, "-D", tmpdir, url]
-        res = subprocess.run(args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        if res.returncode != 0:
-            raise RuntimeError("gallery-dl failed to download images")
-
-        media_files: List[tuple[str, float]] = []
-        for root, _, files in os.walk(tmpdir):
-            for f in files:
-                p = os.path.join(root, f)
+            for item, task in zip(plan, tasks):
                 try:
-                    media_files.append((p, os.path.getmtime(p)))
-                except OSError:
+                    result = await task
+                except Exception as e:
+                    logger.warning(f"Instagram: элемент {item.index} не скачан: {e}")
                     continue
-
-        if not media_files:
+                produced += 1
+                yield result
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        if not produced:
             raise RuntimeError("No media downloaded")
-
-        media_files.sort(key=lambda t: os.path.basename(t[0]))
-        if max_items is not None:
-            media_files = media_files[:max_items]
-
-        items: List[PostMediaItem] = []
-        max_bytes = settings.max_mb * 1024 * 1024
-        image_exts = {".jpg", ".jpeg", ".png", ".webp"}
-        video_exts = {".mp4", ".mov", ".webm", ".mkv", ".avi", ".m4v"}
-
-        def convert_to_mp4_if_needed(src_path: str) -> str:
-            root, ext = os.path.splitext(src_path)
-            if ext.lower() == ".mp4":
-                return src_path
-            out_path = os.path.join(final_dir, os.path.basename(root) + ".mp4")
-            cmd = [
-                "ffmpeg", "-y", "-i", src_path,
-                "-c:v", "libx264", "-preset", "veryfast", "-crf", "23",
-                "-c:a", "aac", "-b:a", "192k",
-                out_path,
-            ]
-            subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
-            if not os.path.exists(out_path) or os.path.getsize(out_path) == 0:
-                raise RuntimeError("ffmpeg conversion failed")
-            return out_path
-
-        existing_video_names = set()
-        for f in os.listdir(final_dir):
-            ext = os.path.splitext(f)[1].lower()
-            if ext in video_exts:
-                existing_video_names.add(os.path.splitext(f)[0])
-
-        for p, _ in media_files:
-            ext = os.path.splitext(p)[1].lower()
-            if ext in image_exts:
-                dst = os.path.join(final_dir, os.path.basename(p))
-                shutil.copy2(p, dst)
-                if 0 < os.path.getsize(dst) <= max_bytes:
-                    items.append(PostMediaItem("image", dst))
-            elif ext in video_exts:
-                base = os.path.splitext(os.path.basename(p))[0]
-                if base in existing_video_names:
-                    continue
-                try:
-                    processed = convert_to_mp4_if_needed(p)
-                except Exception:
-                    processed = p
-                dst = os.path.join(final_dir, os.path.basename(processed))
-                if processed != dst:
-                    shutil.copy2(processed, dst)
-                if 0 < os.path.getsize(dst) <= max_bytes:
-                    items.append(PostMediaItem("video", dst))
-
-        if not items:
-            raise RuntimeError("No media found after processing")
-
-        return items
-    finally:
-        shutil.rmtree(tmpdir, ignore_errors=True)
+    except BaseException:
+        workspace.release(job)
+        raise
+
+async def _extract_audio_mp3(src: str, out_dir: str) -> str:
+    out_path = os.path.join(out_dir, os.path.splitext(os.path.basename(src))[0] + ".mp3")
+    cmd = [
+        "ffmpeg", "-y", "-i", src,
+        "-vn", "-c:a", "libmp3lame", "-b:a", "192k",
+        out_path,
+    ]
+    await proc.run(cmd, timeout=settings.ytdlp_timeout)
+    if not os.path.exists(out_path) or os.path.getsize(out_path) == 0:
+        raise RuntimeError("ffmpeg audio extraction failed")
+    return out_path
 
 async def download_media(
     url: str,
     kind: Literal["video", "audio"] = "video",
-    max_mb: int = settings.max_mb,
+    max_mb: int | None = None,
+    max_height: int | None = None,
+    cache_key: tuple[str, str] | None = None,
 ) -> str:
     try:
         loop = asyncio.get_running_loop()
-        max_bytes = max_mb * 1024 * 1024
+        max_bytes = (max_mb or settings.max_mb) * 1024 * 1024
 
         format_candidates = [
             "bv*+ba/b[ext=mp4]/b",
@@ -268,31 +354,67 @@ async def download_media(
             "bestaudio/best"
         ]
 
+        if kind == "video" and max_height:
+            # оценка стоимости показала, что лучшее качество не влезет в лимит
+            format_candidates = [
+                f"bv[height<={max_height}]+ba/b[height<={max_height}]",
+                f"best[height<={max_height}]",
+                "worst[height>=360]",
+                "worst",
+            ]
+
         postprocessors = [{
             "key": "FFmpegExtractAudio",
             "preferredcodec": "mp3",
             "preferredquality": "192",
         }] if kind == "audio" else []
 
-        tmpdir = tempfile.mkdtemp(prefix="telegram-bot-")
-
-        def _convert_to_mp4(src_path: str) -> str:
-            root, ext = os.path.splitext(src_path)
-            if ext.lower() == ".mp4":
-                return src_path
-            out_path = root + ".__mp4__.mp4"
-            cmd = [
-                "ffmpeg", "-y", "-i", src_path,
-                "-c:v", "libx264", "-preset", "veryfast", "-crf", "23",
-                "-c:a", "aac", "-b:a", "192k",
-                out_path
-            ]
-            subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
-            if not os.path.exists(out_path) or os.path.getsize(out_path) == 0:
-                raise RuntimeError("ffmpeg conversion failed")
-            return out_path
+        variant = f"{kind}@{max_height}p" if kind == "video" and max_height else kind
+
+        async def _from_blob_cache(job: str) -> str | None:
+            if not cache_key:
+                return None
+            cached = blobstore.checkout(*cache_key, variant, job)
+            if cached:
+                return cached
+            video = blobstore.lookup(*cache_key, "video") if kind == "audio" else None
+            if video:
+                # аудио получаем из уже скачанного видео, без обращения к платформе
+                try:
+                    out = await _extract_audio_mp3(video, job)
+                    blobstore.store(*cache_key, variant, out)
+                    return out
+                except Exception:
+                    pass
+            return None
 
-        def _run():
+        async def _run() -> str:
+            # yt-dlp работает в потоке, ffmpeg — отдельным процессом, не занимая поток
+            job = workspace.job_dir("dl-")
+            try:
+                cached = await _from_blob_cache(job)
+                if cached:
+                    return cached
+                tmpdir = workspace.subdir(job, "work")
+                try:
+                    with metrics.stage("download"):
+                        latest = await loop.run_in_executor(None, _download, tmpdir)
+                    metrics.add_bytes("download", os.path.getsize(latest))
+                    if kind == "video":
+                        latest = await _ensure_mp4(latest)
+                    if os.path.getsize(latest) > max_bytes:
+                        raise RuntimeError("Produced file is larger than size limit.")
+                    path = workspace.move(latest, job)
+                finally:
+                    await asyncio.to_thread(shutil.rmtree, tmpdir, True)
+                if cache_key:
+                    blobstore.store(*cache_key, variant, path)
+                return path
+            except BaseException:
+                workspace.release(job)
+                raise
+
+        def _download(tmpdir: str) -> str:
             outtmpl = os.path.join(tmpdir, "%(title).80s.%(ext)s")
             last_err = None
 
@@ -317,9 +439,11 @@ async def download_media(
                 if kind == "video":
                     opts["merge_output_format"] = "mp4"
                     opts["prefer_ffmpeg"] = True
+                    # moov переносится в начало при слиянии дорожек — отдельный проход не нужен
+                    opts["postprocessor_args"] = {"merger+ffmpeg_o": MP4_FASTSTART_ARGS}
 
                 try:
-                    with YoutubeDL(opts) as ydl:
+                    with _youtube_dl(opts) as ydl:
                         ydl.extract_info(url, download=True)
                 except Exception as e:
                     last_err = e
@@ -340,22 +464,11 @@ async def download_media(
                     last_err = RuntimeError("No valid media file downloaded")
                     continue
 
-                if kind == "video":
-                    try:
-                        latest = _convert_to_mp4(latest)
-                    except Exception:
-                        pass
-
-                if os.path.getsize(latest) > max_bytes:
-                    raise RuntimeError("Produced file is larger than size limit.")
-
-                final_path = os.path.join(tempfile.mkdtemp(prefix="telegram-bot-final-"), os.path.basename(latest))
-                shutil.copy2(latest, final_path)
-                return final_path
+                return latest
 
             raise last_err or RuntimeError("All formats failed")
 
-        return await asyncio.wait_for(loop.run_in_executor(None, _run), timeout=settings.ytdlp_timeout)
+        return await asyncio.wait_for(_run(), timeout=settings.ytdlp_timeout)
     except Exception as e:
         raise RuntimeError(f"Download failed: {e}")
 
@@ -384,7 +497,7 @@ def _yt_dlp_info_only(url: str) -> dict:
         "extractor_args": {"tiktok": {"api_hostname": [TT_HOST_FALLBACK]}},
         "http_headers": {"User-Agent": "Mozilla/5.0", "Referer": "https://www.tiktok.com/"},
     }
-    with YoutubeDL(base) as ydl:
+    with _youtube_dl(base) as ydl:
         return ydl.extract_info(url, download=False)
 
 def _download_best_audio_with_ytdlp(url: str, outdir: str, max_bytes: int) -> str | None:
@@ -403,7 +516,7 @@ def _download_best_audio_with_ytdlp(url: str, outdir: str, max_bytes: int) -> st
         "noprogress": True,
         "extractor_args": {"tiktok": {"api_hostname": [TT_HOST_FALLBACK]}},
     }
-    with YoutubeDL(ydl_opts) as ydl:
+    with _youtube_dl(ydl_opts) as ydl:
         ydl.extract_info(url, download=True)
 
     latest, latest_mtime = None, -1.0
@@ -418,92 +531,206 @@ def _download_best_audio_with_ytdlp(url: str, outdir: str, max_bytes: int) -> st
                 pass
     return latest
 
-def _gallery_dl_music_playurl(url: str) -> str | None:
-    if not shutil.which("gallery-dl"):
-        return None
+def _iter_gallery_dl_json(output: str):
+    # словари метаданных из вывода gallery-dl -j
+    for item in _gallery_dl_nodes(output):
+        if isinstance(item, dict):
+            yield item
+
+def _music_from(data: dict) -> tuple[str | None, str | None]:
+    # (playUrl, music id) из метаданных поста TikTok
+    music = (data or {}).get("music") or {}
+    if not isinstance(music, dict):
+        music = {}
+    play = (
+        music.get("playUrl")
+        or music.get("play_url")
+        or (music.get("url_list", [None])[0] if isinstance(music.get("url_list"), list) else None)
+    )
+    if not play:
+        track = data.get("track")
+        if isinstance(track, dict):
+            play = track.get("play") or track.get("play_addr")
+    music_id = music.get("id") or music.get("mid")
+    return play, (str(music_id) if music_id else None)
+
+async def _gallery_dl_music(url: str) -> tuple[str | None, str | None]:
+    if not binaries.available("gallery-dl"):
+        return None, None
     try:
-        proc = subprocess.run(["gallery-dl", "-j", url], capture_output=True, text=True, timeout=20)
-        if proc.returncode != 0:
-            return None
-        for line in proc.stdout.splitlines():
-            line = line.strip()
-            if not line:
-                continue
-            data = json.loads(line)
-            music = data.get("music") or {}
-            play = (
-                music.get("playUrl")
-                or music.get("play_url")
-                or (music.get("url_list", [None])[0] if isinstance(music.get("url_list"), list) else None)
-            )
-            if not play:
-                track = data.get("track") or {}
-                play = track.get("play") or track.get("play_addr")
+        res = await proc.run(_gallery_dl("-j", url), timeout=20, capture=True, check=False)
+        if res.returncode != 0:
+            return None, None
+        for data in _iter_gallery_dl_json(res.stdout):
+            play, music_id = _music_from(data)
             if play:
-                return play
+                return play, music_id
     except Exception:
-        return None
-    return None
-
-def _download_binary(url: str, outpath: str):
-    headers = {"User-Agent": "Mozilla/5.0"}
-    with httpx.Client(follow_redirects=True, timeout=25, headers=headers) as client:
-        r = client.get(url)
-        r.raise_for_status()
-        with open(outpath, "wb") as f:
-            f.write(r.content)
-
-def download_tiktok_sound(url: str, is_photo: bool = False) -> str:
-    tmp = tempfile.mkdtemp(prefix="tt-sound-tmp-")
-    final_dir = tempfile.mkdtemp(prefix="tt-sound-final-")
+        return None, None
+    return None, None
+
+async def _download_binary(url: str, outpath: str, max_bytes: int | None = None) -> str:
+    # имя файла получает расширение по Content-Type, если в нём его нет
+    headers = await http.fetch_to(url, outpath, max_bytes, headers=TT_HEADERS)
+    if not os.path.splitext(outpath)[1]:
+        ext = mimetypes.guess_extension(headers.get("Content-Type", "").split(";")[0]) or ".m4a"
+        outpath = workspace.move(outpath, os.path.dirname(outpath), os.path.basename(outpath) + ext)
+    return outpath
+
+def _info_entry(info) -> dict:
+    if isinstance(info, dict) and info.get("_type") == "playlist":
+        entries = info.get("entries") or []
+        return next((e for e in entries if e), {}) if entries else {}
+    return info or {}
+
+async def tiktok_post_meta(url: str) -> TikTokPost:
+    # один вызов gallery-dl -j на пост: ссылки на слайды, playUrl и id звука
+    if not binaries.available("gallery-dl"):
+        raise RuntimeError("gallery-dl is not installed")
+    res = await proc.run(_gallery_dl("-j", url), timeout=20, capture=True, check=False)
+    if res.returncode != 0:
+        raise RuntimeError("gallery-dl failed to read post metadata")
+
+    post_id, music_url, music_id = None, None, None
+    images: list[tuple[str, str]] = []
+    for media_url, kw in _gallery_dl_urls(res.stdout):
+        ext = (kw.get("extension") or "").lower()
+        post_id = post_id or kw.get("id")
+        if f".{ext}" in IMAGE_EXTS:
+            images.append((media_url, f"{kw.get('id') or 'tiktok'}_{kw.get('num') or len(images) + 1}.{ext}"))
+        elif f".{ext}" in AUDIO_EXTS and not music_url:
+            music_url = media_url
+
+    for data in _iter_gallery_dl_json(res.stdout):
+        play, mid = _music_from(data)
+        music_url, music_id = music_url or play, music_id or mid
+        if music_url and music_id:
+            break
+
+    return TikTokPost(str(post_id) if post_id else None, images, music_url, music_id)
+
+async def iter_tiktok_images(post: TikTokPost, max_items: int | None = 10) -> AsyncIterator[str]:
+    """
+    Слайды поста TikTok по мере готовности, в порядке следования.
+
+    Все слайды качаются параллельно через общий пул HTTP; очередной путь
+    отдаётся, как только скачан он и все предыдущие. Один файл служит и
+    превью, и оригиналом; освобождает его вызывающий через workspace.release().
+    """
+    images = post.images[:max_items] if max_items is not None else post.images
+    if not images:
+        raise RuntimeError("No images in post")
+
+    job = workspace.job_dir("tt-images-")
+    originals_dir = workspace.subdir(job, "original")
+    sem = asyncio.Semaphore(POST_FETCH_CONCURRENCY)
+
+    async def _fetch(media_url: str, name: str) -> str:
+        async with sem:
+            dst = os.path.join(originals_dir, name)
+            await http.fetch_to(media_url, dst, headers=TT_HEADERS)
+            if os.path.getsize(dst) == 0:
+                raise RuntimeError("Empty image")
+            return dst
+
+    produced = 0
     try:
+        tasks = [asyncio.create_task(_fetch(u, n)) for u, n in images]
+        try:
+            for (_, name), task in zip(images, tasks):
+                try:
+                    path = await task
+                except Exception as e:
+                    logger.warning(f"TikTok: слайд {name} не скачан: {e}")
+                    continue
+                produced += 1
+                yield path
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        if not produced:
+            raise RuntimeError("No images downloaded")
+    except BaseException:
+        workspace.release(job)
+        raise
+
+async def fetch_tiktok_sound(post: TikTokPost, cache_key: tuple[str, str] | None = None) -> TikTokSound:
+    if not post.music_url:
+        raise RuntimeError("No playable music url found")
+    music_key = ("tiktok", f"music:{post.music_id}") if post.music_id else None
+
+    job = workspace.job_dir("tt-sound-")
+    try:
+        for key in filter(None, (music_key, cache_key)):
+            cached = blobstore.checkout(*key, "sound", job)
+            if cached:
+                return TikTokSound(cached, post.music_id)
+
+        ext = os.path.splitext(urlparse(post.music_url).path)[1].lower()
+        out = os.path.join(job, "tiktok_sound" + (ext if ext in AUDIO_EXTS else ""))
+        final = await _download_binary(post.music_url, out, settings.max_mb * 1024 * 1024)
+        if os.path.getsize(final) == 0:
+            raise RuntimeError("Empty audio file")
+
+        for key in filter(None, (cache_key, music_key)):
+            blobstore.store(*key, "sound", final)
+        return TikTokSound(final, post.music_id)
+    except BaseException:
+        workspace.release(job)
+        raise
+
+async def download_tiktok_sound(
+    url: str,
+    is_photo: bool = False,
+    cache_key: tuple[str, str] | None = None,
+) -> TikTokSound:
+    loop = asyncio.get_running_loop()
+    job = workspace.job_dir("tt-sound-")
+    tmp = None
+    try:
+        if cache_key:
+            cached = blobstore.checkout(*cache_key, "sound", job)
+            if cached:
+                return TikTokSound(cached, None)  # music id по посту знает кэш в БД (cache.get_tiktok_music_id)
+        tmp = workspace.subdir(job, "tmp")
         max_bytes = settings.max_mb * 1024 * 1024
 
-        def _finalize(local_path: str) -> str:
+        def _finalize(local_path: str, music_id: str | None = None) -> TikTokSound:
             if not local_path or not os.path.exists(local_path) or os.path.getsize(local_path) == 0:
                 raise RuntimeError("Empty audio file")
-            final = os.path.join(final_dir, os.path.basename(local_path))
-            shutil.copy2(local_path, final)
-            return final
+            final = workspace.move(local_path, job)
+            if cache_key:
+                blobstore.store(*cache_key, "sound", final)
+            if music_id:
+                blobstore.store("tiktok", f"music:{music_id}", "sound", final)
+            return TikTokSound(final, music_id)
+
+        async def _info(u: str) -> dict:
+            return _info_entry(await loop.run_in_executor(None, _yt_dlp_info_only, u))
+
+        async def _best_audio(u: str) -> str | None:
+            return await loop.run_in_executor(None, _download_best_audio_with_ytdlp, u, tmp, max_bytes)
 
         if is_photo:
-            play = _gallery_dl_music_playurl(url)
+            play, music_id = await _gallery_dl_music(url)
             if play:
-                ext = ".m4a"
-                try:
-                    with httpx.Client(follow_redirects=True, timeout=10) as c:
-                        head = c.head(play)
-                        guess = mimetypes.guess_extension(head.headers.get("Content-Type", "") or "")
-                        if guess:
-                            ext = guess
-                except Exception:
-                    pass
-                out = os.path.join(tmp, "tiktok_sound" + ext)
-                _download_binary(play, out)
-                return _finalize(out)
+                out = await _download_binary(play, os.path.join(tmp, "tiktok_sound"), max_bytes)
+                return _finalize(out, music_id)
 
             for u in _normalize_tiktok_url(url, exclude_photo=True):
                 try:
-                    info = _yt_dlp_info_only(u)
+                    info = await _info(u)
                 except Exception:
                     continue
-                if isinstance(info, dict) and info.get("_type") == "playlist":
-                    entries = info.get("entries") or []
-                    info = next((e for e in entries if e), {}) if entries else {}
-                music = (info or {}).get("music") or {}
-                play = (
-                    music.get("playUrl")
-                    or music.get("play_url")
-                    or (music.get("url_list", [None])[0] if isinstance(music.get("url_list"), list) else None)
-                )
+                play, music_id = _music_from(info)
                 if play:
-                    out = os.path.join(tmp, "tiktok_sound.m4a")
-                    _download_binary(play, out)
-                    return _finalize(out)
+                    out = await _download_binary(play, os.path.join(tmp, "tiktok_sound.m4a"), max_bytes)
+                    return _finalize(out, music_id)
 
             for u in _normalize_tiktok_url(url, exclude_photo=True):
                 try:
-                    produced = _download_best_audio_with_ytdlp(u, tmp, max_bytes)
+                    produced = await _best_audio(u)
                     if produced and os.path.getsize(produced) > 0:
                         return _finalize(produced)
                 except Exception:
@@ -512,32 +739,21 @@ def download_tiktok_sound(url: str, is_photo: bool = False) -> str:
             raise RuntimeError("No playable music url found (photo-post)")
 
         try:
-            info = _yt_dlp_info_only(url)
-            if isinstance(info, dict) and info.get("_type") == "playlist":
-                entries = info.get("entries") or []
-                info = next((e for e in entries if e), {}) if entries else {}
-            music = (info or {}).get("music") or {}
-            play = (
-                music.get("playUrl")
-                or music.get("play_url")
-                or (music.get("url_list", [None])[0] if isinstance(music.get("url_list"), list) else None)
-            )
+            play, music_id = _music_from(await _info(url))
             if play:
-                out = os.path.join(tmp, "tiktok_sound.m4a")
-                _download_binary(play, out)
-                return _finalize(out)
+                out = await _download_binary(play, os.path.join(tmp, "tiktok_sound.m4a"), max_bytes)
+                return _finalize(out, music_id)
         except Exception:
             pass
 
-        play = _gallery_dl_music_playurl(url)
+        play, music_id = await _gallery_dl_music(url)
         if play:
-            out = os.path.join(tmp, "tiktok_sound.m4a")
-            _download_binary(play, out)
-            return _finalize(out)
+            out = await _download_binary(play, os.path.join(tmp, "tiktok_sound.m4a"), max_bytes)
+            return _finalize(out, music_id)
 
         for u in _normalize_tiktok_url(url):
             try:
-                produced = _download_best_audio_with_ytdlp(u, tmp, max_bytes)
+                produced = await _best_audio(u)
                 if produced and os.path.getsize(produced) > 0:
                     return _finalize(produced)
             except Exception:
@@ -545,59 +761,12 @@ def download_tiktok_sound(url: str, is_photo: bool = False) -> str:
 
         raise RuntimeError("No playable music url found")
     except Exception as e:
-        shutil.rmtree(tmp, ignore_errors=True)
+        workspace.release(job)
         raise RuntimeError(f"Failed to fetch audio: {e}")
-
-def download_spotify_track(url: str, max_mb: int = None) -> str:
-    if not shutil.which("spotdl"):
-        raise RuntimeError("spotdl not found")
-    
-    if max_mb is None:
-        max_mb = settings.max_mb
-    
-    max_bytes = max_mb * 1024 * 1024
-    
-    tmpdir = tempfile.mkdtemp(prefix="telegram-bot-spotify-")
-    final_dir = tempfile.mkdtemp(prefix="telegram-bot-spotify-final-")
-    
-    try:
-        cmd = [
-            "spotdl", 
-            "download",
-            url
-        ]
-        
-        result = subprocess.run(
-            cmd, 
-            capture_output=True, 
-            text=True, 
-            timeout=300,
-            cwd=tmpdir
-        )
-        
-        if result.returncode != 0:
-            raise RuntimeError(f"spotdl failed: {result.stderr}")
-        
-        downloaded_files = []
-        for root, _, files in os.walk(tmpdir):
-            for file in files:
-                if file.endswith('.mp3'):
-                    file_path = os.path.join(root, file)
-                    downloaded_files.append((file_path, os.path.getmtime(file_path)))
-        
-        if not downloaded_files:
-            raise RuntimeError("No files downloaded by spotdl")
-        
-        downloaded_files.sort(key=lambda x: x[1], reverse=True)
-        source_file = downloaded_files[0][0]
-        
-        if os.path.getsize(source_file) > max_bytes:
-            raise RuntimeError(f"File too large: {os.path.getsize(source_file)} bytes")
-        
-        final_path = os.path.join(final_dir, os.path.basename(source_file))
-        shutil.copy2(source_file, final_path)
-        
-        return final_path
-        
+    except BaseException:
+        # отмена (wait_for в обработчике по таймауту): каталог задачи не ждёт janitor
+        workspace.release(job)
+        raise
     finally:
-        shutil.rmtree(tmpdir, ignore_errors=True)
\ No newline at end of file
+        if tmp:
+            await asyncio.to_thread(shutil.rmtree, tmp, True)
@@ -0,0 +1,244 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+from sqlalchemy import select
+
+from app.core.config import settings
+from app.core.db import Session
+from app.core.models import SpotifyMatch
+from app.core import workspace, blobstore, proc, metrics, binaries
+
+logger = logging.getLogger(__name__)
+
+URL_RE = re.compile(r"spotify\.com/(?:intl-[a-z]+/)?(track|album|playlist)/([A-Za-z0-9]+)", re.I)
+
+@dataclass
+class SpotifyTrack:
+    id: str
+    title: str
+    performer: str | None
+    duration: int | None
+    meta: dict   # Song.json от spotdl: по нему трек собирается заново без запроса к Spotify
+
+    @classmethod
+    def from_meta(cls, meta: dict) -> "SpotifyTrack":
+        return cls(
+            id=meta.get("song_id") or meta.get("url", ""),
+            title=meta.get("name") or "track",
+            performer=meta.get("artist"),
+            duration=meta.get("duration"),
+            meta=meta,
+        )
+
+def parse_url(url: str) -> tuple[str, str] | None:
+    # ("track" | "album" | "playlist", id)
+    m = URL_RE.search(url)
+    return (m.group(1).lower(), m.group(2)) if m else None
+
+class SpotdlEngine:
+    """
+    Тёплая сессия spotdl внутри процесса.
+
+    Клиент Spotify и загрузчик создаются один раз и живут в собственном пуле
+    потоков (SPOTIFY_THREADS): не нужно каждый раз запускать интерпретатор и
+    импортировать spotdl. Если spotdl не инициализировался, available() — False,
+    и одиночные треки качаются через CLI.
+    """
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=max(1, settings.spotify_threads), thread_name_prefix="spotdl")
+        self._lock = threading.Lock()
+        self._downloader = None
+        self._error: Exception | None = None
+        self._staging_locks: dict[str, list] = {}  # track id -> [Lock, число ожидающих]
+
+    def _get(self):
+        with self._lock:
+            if self._downloader is None and self._error is None:
+                try:
+                    from spotdl import Spotdl
+                    from spotdl.utils.config import SPOTIFY_OPTIONS
+
+                    staging = os.path.join(workspace.ROOT, "spotdl")
+                    os.makedirs(staging, exist_ok=True)
+                    spotdl = Spotdl(
+                        client_id=settings.spotify_client_id or SPOTIFY_OPTIONS["client_id"],
+                        client_secret=settings.spotify_client_secret or SPOTIFY_OPTIONS["client_secret"],
+                        downloader_settings={
+                            "output": os.path.join(staging, "{track-id}.{output-ext}"),
+                            "format": "mp3",
+                            "overwrite": "force",
+                            "threads": max(1, settings.spotify_threads),
+                            "lyrics_providers": [],
+                            "ffmpeg": settings.ffmpeg_path or "ffmpeg",
+                            "simple_tui": True,
+                            "log_level": "ERROR",
+                        },
+                    )
+                    self._downloader = spotdl.downloader
+                    logger.info("spotdl: сессия инициализирована")
+                except Exception as e:
+                    self._error = e
+                    logger.warning(f"spotdl недоступен внутри процесса, используется CLI: {e}")
+            if self._downloader is None:
+                raise RuntimeError(f"spotdl недоступен: {self._error}")
+            return self._downloader
+
+    async def run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def available(self) -> bool:
+        try:
+            self._get()
+        except RuntimeError:
+            return False
+        return True
+
+    def resolve(self, kind: str, url: str) -> list[dict]:
+        self._get()
+        from spotdl.types.song import Song
+        from spotdl.types.album import Album
+        from spotdl.types.playlist import Playlist
+
+        if kind == "track":
+            return [Song.from_url(url).json]
+        # без fetch_songs: метаданные берутся из самого списка, без запроса на каждый трек
+        songs = (Album if kind == "album" else Playlist).from_url(url, fetch_songs=False).songs
+        return [song.json for song in songs[:settings.spotify_max_tracks]]
+
+    @contextmanager
+    def _staging(self, track_id: str):
+        # шаблон вывода общий для сессии (spotdl/{track-id}.mp3, overwrite=force):
+        # параллельные загрузки одного трека иначе перезаписывают и уносят чужой файл
+        with self._lock:
+            entry = self._staging_locks.setdefault(track_id, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._staging_locks[track_id]
+
+    def download(self, meta: dict, youtube_url: str | None, out_dir: str) -> tuple[str, str | None]:
+        from spotdl.types.song import Song
+
+        downloader = self._get()
+        song = Song.from_dict(meta)
+        if youtube_url:
+            song.download_url = youtube_url  # соответствие уже известно: поиск на YouTube пропускается
+        with self._staging(song.song_id):
+            song, path = downloader.search_and_download(song)
+            if path is None:
+                raise RuntimeError(f"spotdl не скачал {song.display_name}")
+            return workspace.move(str(path), out_dir), song.download_url
+
+engine = SpotdlEngine()
+
+async def _load_matches(ids: list[str]) -> dict[str, SpotifyMatch]:
+    async with Session() as s:
+        rows = await s.execute(select(SpotifyMatch).where(SpotifyMatch.spotify_id.in_(ids)))
+        return {row.spotify_id: row for row in rows.scalars()}
+
+async def _save_matches(tracks: list[SpotifyTrack], youtube_urls: dict[str, str] | None = None):
+    youtube_urls = youtube_urls or {}
+    now = datetime.now(timezone.utc)
+    async with Session() as s:
+        rows = await s.execute(select(SpotifyMatch).where(SpotifyMatch.spotify_id.in_([t.id for t in tracks])))
+        existing = {row.spotify_id: row for row in rows.scalars()}
+        for t in tracks:
+            row = existing.get(t.id)
+            if row is None:
+                row = SpotifyMatch(spotify_id=t.id, meta=json.dumps(t.meta, ensure_ascii=False))
+                s.add(row)
+            else:
+                row.meta = json.dumps(t.meta, ensure_ascii=False)
+            if t.id in youtube_urls:
+                row.youtube_url = youtube_urls[t.id]
+            row.updated_at = now
+        await s.commit()
+
+async def resolve(url: str) -> list[SpotifyTrack]:
+    parsed = parse_url(url)
+    if not parsed:
+        raise RuntimeError("Неподдерживаемая ссылка Spotify")
+    kind, spotify_id = parsed
+
+    if kind == "track":
+        row = (await _load_matches([spotify_id])).get(spotify_id)
+        if row:
+            return [SpotifyTrack.from_meta(json.loads(row.meta))]
+        if not await engine.run(engine.available):
+            return [SpotifyTrack(spotify_id, "track", None, None, {"url": url, "song_id": spotify_id})]
+
+    tracks = [SpotifyTrack.from_meta(m) for m in await engine.run(engine.resolve, kind, url)]
+    if tracks:
+        await _save_matches(tracks)
+    return tracks
+
+async def download_track(track: SpotifyTrack, max_mb: int | None = None, cache_key: tuple[str, str] | None = None) -> str:
+    max_bytes = (max_mb or settings.max_mb) * 1024 * 1024
+    job = workspace.job_dir("spotify-")
+    try:
+        if cache_key:
+            cached = blobstore.checkout(*cache_key, "audio", job)
+            if cached:
+                return cached
+
+        if await engine.run(engine.available):
+            row = (await _load_matches([track.id])).get(track.id)
+            known_url = row.youtube_url if row else None
+            with metrics.stage("download"):
+                path, matched_url = await engine.run(engine.download, track.meta, known_url, job)
+            if matched_url and matched_url != known_url:
+                await _save_matches([track], {track.id: matched_url})
+        else:
+            with metrics.stage("download"):
+                path = await _download_cli(track.meta["url"], job)
+        metrics.add_bytes("download", os.path.getsize(path))
+
+        if os.path.getsize(path) > max_bytes:
+            raise RuntimeError(f"File too large: {os.path.getsize(path)} bytes")
+        if cache_key:
+            blobstore.store(*cache_key, "audio", path)
+        return path
+    except BaseException:
+        workspace.release(job)
+        raise
+
+async def _download_cli(url: str, job: str) -> str:
+    if not binaries.available("spotdl"):
+        raise RuntimeError("spotdl not found")
+    tmpdir = workspace.subdir(job, "work")
+    try:
+        result = await proc.run(
+            ["spotdl", "download", url], timeout=300, cwd=tmpdir, check=False,
+            on_line=lambda line: logger.debug(f"spotdl: {line}"),
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"spotdl failed: {result.stderr}")
+
+        downloaded = []
+        for root, _, files in os.walk(tmpdir):
+            for f in files:
+                if f.endswith(".mp3"):
+                    p = os.path.join(root, f)
+                    downloaded.append((p, os.path.getmtime(p)))
+        if not downloaded:
+            raise RuntimeError("No files downloaded by spotdl")
+
+        downloaded.sort(key=lambda x: x[1], reverse=True)
+        return workspace.move(downloaded[0][0], job)
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
@@ -0,0 +1,118 @@
+import asyncio
+import json
+import os
+import struct
+from dataclasses import dataclass
+
+from app.core import proc
+from app.core.config import settings
+
+THUMB_SIDE = 320  # лимит Bot API на превью: JPEG до 320x320 и 200 KB
+
+@dataclass
+class VideoInfo:
+    width: int | None
+    height: int | None
+    duration: int | None
+    thumbnail: str | None
+
+def moov_first(path: str) -> bool:
+    # проходит по атомам верхнего уровня MP4: moov до mdat — клиент может начать проигрывание сразу
+    try:
+        with open(path, "rb") as f:
+            while True:
+                header = f.read(8)
+                if len(header) < 8:
+                    return False
+                size, box = struct.unpack(">I4s", header)
+                if box == b"moov":
+                    return True
+                if box == b"mdat":
+                    return False
+                header_size = 8
+                if size == 1:
+                    size = struct.unpack(">Q", f.read(8))[0]
+                    header_size = 16
+                # size 0 — атом до конца файла; меньше заголовка — битый файл, дальше не сдвинуться
+                if size < header_size:
+                    return False
+                f.seek(size - header_size, os.SEEK_CUR)
+    except (OSError, struct.error):
+        return False
+
+async def to_streamable_mp4(src: str) -> str:
+    """
+    Приводит видео к MP4 с moov в начале файла (+faststart) за один проход
+    ffmpeg: не-MP4 перекодируется, MP4 с moov в конце перепаковывается без
+    перекодирования, готовый файл возвращается как есть.
+    """
+    root, ext = os.path.splitext(src)
+    if ext.lower() == ".mp4":
+        if await asyncio.to_thread(moov_first, src):
+            return src
+        out = root + ".faststart.mp4"
+        cmd = ["ffmpeg", "-y", "-i", src, "-map", "0", "-c", "copy", "-movflags", "+faststart", out]
+    else:
+        out = root + ".mp4"
+        cmd = [
+            "ffmpeg", "-y", "-i", src,
+            "-c:v", "libx264", "-preset", "veryfast", "-crf", "23",
+            "-c:a", "aac", "-b:a", "192k",
+            "-movflags", "+faststart",
+            out,
+        ]
+    await proc.run(cmd, timeout=settings.ytdlp_timeout)
+    if not os.path.exists(out) or os.path.getsize(out) == 0:
+        raise RuntimeError("ffmpeg conversion failed")
+    if ext.lower() == ".mp4":
+        os.replace(out, src)
+        return src
+    os.remove(src)
+    return out
+
+async def _probe(path: str) -> tuple[int | None, int | None, int | None]:
+    cmd = [
+        "ffprobe", "-v", "error", "-select_streams", "v:0",
+        "-show_entries", "stream=width,height:stream_tags=rotate:stream_side_data=rotation:format=duration",
+        "-of", "json", path,
+    ]
+    res = await proc.run(cmd, timeout=15, capture=True, check=False)
+    if res.returncode != 0:
+        return None, None, None
+    data = json.loads(res.stdout or "{}")
+    stream = (data.get("streams") or [{}])[0]
+    width, height = stream.get("width"), stream.get("height")
+
+    rotation = (stream.get("tags") or {}).get("rotate")
+    for side in stream.get("side_data_list") or []:
+        rotation = side.get("rotation", rotation)
+    if rotation is not None and abs(int(float(rotation))) % 180 == 90:
+        width, height = height, width  # телефонное видео, повёрнутое метаданными
+
+    duration = (data.get("format") or {}).get("duration")
+    return width, height, (round(float(duration)) if duration else None)
+
+async def _thumbnail(path: str, duration: int | None) -> str | None:
+    out = os.path.splitext(path)[0] + ".thumb.jpg"
+    at = min(1.0, duration / 2) if duration else 0.0
+    cmd = [
+        "ffmpeg", "-y", "-ss", f"{at:.2f}", "-i", path, "-frames:v", "1",
+        "-vf", f"scale={THUMB_SIDE}:{THUMB_SIDE}:force_original_aspect_ratio=decrease",
+        "-q:v", "5", out,
+    ]
+    res = await proc.run(cmd, timeout=15, check=False)
+    if res.returncode != 0 or not os.path.exists(out) or os.path.getsize(out) > 200 * 1024:
+        return None
+    return out
+
+async def probe_video(path: str) -> VideoInfo:
+    # метаданные для sendVideo: без них клиент ждёт загрузки файла, чтобы показать кадр и длительность
+    try:
+        width, height, duration = await _probe(path)
+    except Exception:
+        width, height, duration = None, None, None
+    try:
+        thumb = await _thumbnail(path, duration)
+    except Exception:
+        thumb = None
+    return VideoInfo(width, height, duration, thumb)
@@ -1,11 +1,9 @@
 import re
 import os
-from typing import Optional
+import hashlib
 from aiogram import Bot
 from urllib.parse import urlparse
 
-_BOT_MENTION: Optional[str] = None
-
 YOUTUBE_HOST_RE = re.compile(r"(?:^|\.)youtube\.com$", re.I)
 YOUTU_BE_HOST_RE = re.compile(r"(?:^|\.)youtu\.be$", re.I)
 TIKTOK_HOST_RE = re.compile(r"(?:^|\.)tiktok\.com$", re.I)
@@ -13,13 +11,17 @@ INSTAGRAM_HOST_RE = re.compile(r"(?:^|\.)instagram\.com$|(?:^|\.)instagr\.am$",
 SPOTIFY_HOST_RE = re.compile(r"(?:^|\.)spotify\.com$", re.I)
 
 async def bot_mention(bot: Bot) -> str:
-    global _BOT_MENTION
-    if _BOT_MENTION is not None:
-        return _BOT_MENTION
+    # bot.me() кэширует getMe в объекте бота; заполняется при старте (main.py, worker.py)
+    me = await bot.me()
+    return f"@{me.username}" if me.username else ""
 
-    me = await bot.get_me()
-    _BOT_MENTION = f"@{me.username}" if me.username else ""
-    return _BOT_MENTION
+def file_hash(path: str, chunk_size: int = 1024 * 1024) -> str:
+    # потоковый хэш содержимого: файл не читается в память целиком
+    h = hashlib.blake2b(digest_size=32)
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            h.update(chunk)
+    return h.hexdigest()
 
 def _host(url: str) -> str:
     try:
@@ -0,0 +1,49 @@
+"""
+Бенчмарки бота: python -m bench.<имя>.
+
+Модули импортируют app.*, поэтому перед импортом подставляют BOT_TOKEN-заглушку
+и рабочий каталог во временной папке — реальный .env не нужен.
+
+Асинхронная часть запускается через bench.run(): под ней работает сторож цикла
+событий. С --strict (или BENCH_STRICT=1) бенчмарк завершается с кодом 3, если
+цикл хоть раз был заблокирован дольше LOOP_LAG_THRESHOLD_MS, — так синхронный
+вызов на горячем пути ловится как регрессия. FAST_RUNTIME=1 включает тот же
+производительный режим, что и в проде, — так его выигрыш меряется на любом бенчмарке.
+"""
+import os
+import sys
+import tempfile
+
+os.environ.setdefault("BOT_TOKEN", "0:bench")
+os.environ.setdefault("DOWNLOAD_DIR", os.path.join(tempfile.gettempdir(), "bot-bench"))
+
+STRICT_EXIT_CODE = 3
+
+def strict_default() -> bool:
+    return os.getenv("BENCH_STRICT", "0").strip().lower() in {"1", "true", "yes", "on"}
+
+def add_strict_arg(parser):
+    parser.add_argument("--strict", action="store_true", default=strict_default(),
+                        help="ошибка, если цикл событий блокировался дольше LOOP_LAG_THRESHOLD_MS")
+
+def run(coro, strict: bool = False):
+    import asyncio
+    from app.core import runtime, watchdog
+
+    async def _main():
+        wd = watchdog.start()
+        try:
+            return await coro, wd
+        finally:
+            watchdog.stop()
+
+    runtime.install_event_loop()
+    print(f"runtime: {runtime.describe()}")
+    result, wd = asyncio.run(_main())
+    if wd is not None:
+        print(f"loop: макс. задержка {wd.max_lag * 1000:.0f} мс, блокировок > {wd.threshold * 1000:.0f} мс: {wd.stall_count}")
+        if strict and wd.stall_count:
+            for stall in wd.stalls:
+                print(f"--- блокировка {stall.seconds * 1000:.0f}+ мс\n{stall.stack}", file=sys.stderr)
+            sys.exit(STRICT_EXIT_CODE)
+    return result
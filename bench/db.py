@@ -0,0 +1,213 @@
+"""
+Конкурентная запись в БД: UserMiddleware, log_event, save_download_stats,
+upsert_cached_tg_file_id.
+
+    python -m bench.db -u 50 -r 20
+    python -m bench.db -u 50 -r 20 --ops middleware,upsert_file_id
+    python -m bench.db --variant current --variant mypkg.batched:ops
+
+N пользователей параллельно выполняют по R «запросов»; запрос — выбранные
+операции по очереди, как их вызывает бот на одну ссылку. Для каждой
+операции — ops/s, p50/p99; ошибки блокировки ("database is locked")
+считаются слушателем handle_error движка, потому что сами функции их
+глотают. В конце — рост файла БД вместе с -wal/-journal.
+
+Вариант — функция без аргументов, возвращающая словарь {имя операции:
+async fn(user_id, i)}; встроенный "current" вызывает код как есть. Так
+пакетная или пуловая реализация сравнивается с текущей на той же нагрузке:
+--variant module:function. Для каждого варианта — свежая БД.
+
+По умолчанию — SQLite во временном каталоге; --database-url задаёт другую
+базу (например postgresql+asyncpg://..., нужен драйвер).
+"""
+import argparse
+import asyncio
+import contextlib
+import importlib
+import io
+import logging
+import os
+import tempfile
+import time
+from collections import Counter, defaultdict
+from typing import Awaitable, Callable
+
+from sqlalchemy import event
+
+import bench
+from bench.e2e import percentile, make_update
+
+Op = Callable[[int, int], Awaitable[None]]
+OPS = ("middleware", "log_event", "save_download_stats", "upsert_file_id")
+LOCK_MARKERS = ("database is locked", "database table is locked", "deadlock detected", "could not obtain lock")
+DB_FILE_SUFFIXES = ("", "-wal", "-shm", "-journal")
+FIRST_USER_ID = 5_000_000
+
+def current_ops(media_keys: int = 200) -> dict[str, Op]:
+    # текущий код приложения без изменений
+    from app.core.cache import upsert_cached_tg_file_id
+    from app.core.db import Session
+    from app.core.telemetry import UserMiddleware, log_event
+    from app.features.downloader.handlers import save_download_stats
+
+    middleware = UserMiddleware()
+    sample = os.path.join(tempfile.mkdtemp(prefix="bench-db-"), "sample.mp4")
+    with open(sample, "wb") as f:
+        f.write(os.urandom(64 * 1024))
+
+    async def _handler(event, data):
+        return None
+
+    async def _middleware(user_id: int, i: int):
+        await middleware(_handler, make_update(i, user_id, "https://www.youtube.com/shorts/bench"), {})
+
+    async def _log_event(user_id: int, i: int):
+        await log_event(user_id, "download", f"https://www.youtube.com/shorts/b{i}")
+
+    async def _save_download_stats(user_id: int, i: int):
+        await save_download_stats(user_id, f"https://www.youtube.com/shorts/b{i}", sample, "video", 30)
+
+    async def _upsert_file_id(user_id: int, i: int):
+        # общие ключи у разных пользователей — так же, как популярные ролики в проде
+        async with Session() as s:
+            await upsert_cached_tg_file_id(
+                s, source="shorts", extractor="youtube", media_id=f"b{(user_id + i) % media_keys}",
+                kind="video", tg_file_id=f"f{user_id}-{i}", tg_file_unique_id=f"u{user_id}-{i}",
+            )
+
+    return {
+        "middleware": _middleware,
+        "log_event": _log_event,
+        "save_download_stats": _save_download_stats,
+        "upsert_file_id": _upsert_file_id,
+    }
+
+VARIANTS: dict[str, Callable[[], dict[str, Op]]] = {"current": current_ops}
+
+def load_variant(name: str) -> Callable[[], dict[str, Op]]:
+    if name in VARIANTS:
+        return VARIANTS[name]
+    if ":" not in name:
+        raise SystemExit(f"Неизвестный вариант {name!r}: встроенные {sorted(VARIANTS)} или module:function")
+    module, attr = name.split(":", 1)
+    return getattr(importlib.import_module(module), attr)
+
+class DbErrors:
+    """Ошибки DBAPI по слушателю handle_error: функции приложения их перехватывают и печатают."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.total = 0
+        self.locks = 0
+        self.samples: Counter[str] = Counter()
+        event.listen(engine.sync_engine, "handle_error", self._on_error)
+
+    def close(self):
+        event.remove(self.engine.sync_engine, "handle_error", self._on_error)
+
+    def _on_error(self, ctx):
+        text = str(ctx.original_exception)
+        self.total += 1
+        if any(m in text.lower() for m in LOCK_MARKERS):
+            self.locks += 1
+        self.samples[text.splitlines()[0][:120]] += 1
+
+def db_files_size(url: str) -> int:
+    from sqlalchemy.engine import make_url
+
+    u = make_url(url)
+    if not u.get_backend_name().startswith("sqlite") or not u.database:
+        return 0
+    return sum(os.path.getsize(u.database + s) for s in DB_FILE_SUFFIXES if os.path.exists(u.database + s))
+
+def _row(name: str, latencies: list[float], elapsed: float) -> str:
+    ms = [x * 1000 for x in latencies]
+    return f"{name:<22} {len(ms):>7} {len(ms) / elapsed:9.1f} {percentile(ms, 50):8.1f} {percentile(ms, 99):8.1f} {max(ms, default=0):8.1f}"
+
+HEADER = f"{'op':<22} {'n':>7} {'ops/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}"
+
+async def run_variant(name: str, factory, args) -> None:
+    from sqlalchemy import text
+    from app.core import db
+
+    await db.init_db()
+    errors = DbErrors(db.engine)
+    ops = factory()
+    selected = [o for o in args.ops.split(",") if o]
+    missing = [o for o in selected if o not in ops]
+    if missing:
+        raise SystemExit(f"Вариант {name!r} не реализует: {', '.join(missing)}")
+
+    mode = db.engine.dialect.name
+    if mode == "sqlite":
+        async with db.engine.connect() as conn:
+            mode = f"sqlite, journal_mode={(await conn.execute(text('PRAGMA journal_mode'))).scalar()}"
+    # пустые таблицы не показательны: сначала прогрев теми же операциями
+    for i in range(args.warmup):
+        for op in selected:
+            await ops[op](FIRST_USER_ID - 1 - i, i)
+    size_before = db_files_size(args.database_url)
+    errors_before, locks_before = errors.total, errors.locks
+
+    latencies: dict[str, list[float]] = defaultdict(list)
+
+    async def _user(user_id: int):
+        for i in range(args.requests):
+            for op in selected:
+                started = time.perf_counter()
+                await ops[op](user_id, i)
+                latencies[op].append(time.perf_counter() - started)
+
+    # функции приложения печатают свои ошибки — в отчёт они попадают через DbErrors
+    with contextlib.redirect_stdout(io.StringIO()):
+        started = time.perf_counter()
+        await asyncio.gather(*(_user(FIRST_USER_ID + u) for u in range(args.users)))
+        elapsed = time.perf_counter() - started
+
+    growth = db_files_size(args.database_url) - size_before
+    errors.close()
+    print(f"\n== {name}: {args.users} пользователей × {args.requests} запросов, {mode}, {elapsed:.2f} с")
+    print(HEADER)
+    for op in selected:
+        print(_row(op, latencies[op], elapsed))
+    print(_row("всего", [x for op in selected for x in latencies[op]], elapsed))
+    print(f"ошибки БД: {errors.total - errors_before}, из них блокировки: {errors.locks - locks_before}; "
+          f"рост файла БД: {growth / 1024:.0f} KiB")
+    for sample, n in errors.samples.most_common(3):
+        print(f"  {n} × {sample}")
+
+async def main_async(args):
+    from app.core import db
+
+    for i, name in enumerate(args.variant or ["current"]):
+        if i:
+            # у каждого варианта — свежая БД того же вида
+            async with db.engine.begin() as conn:
+                await conn.run_sync(db.Base.metadata.drop_all)
+        await run_variant(name, load_variant(name), args)
+    await db.engine.dispose()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-u", "--users", type=int, default=50, help="одновременных пользователей")
+    parser.add_argument("-r", "--requests", type=int, default=20, help="запросов на пользователя")
+    parser.add_argument("--ops", default=",".join(OPS), help=f"операции запроса через запятую: {', '.join(OPS)}")
+    parser.add_argument("--warmup", type=int, default=20, help="запросов прогрева до замера")
+    parser.add_argument("--variant", action="append", help="current (по умолчанию) или module:function; можно несколько")
+    parser.add_argument("--database-url", help="по умолчанию — SQLite-файл во временном каталоге")
+    bench.add_strict_arg(parser)
+    args = parser.parse_args()
+
+    if not args.database_url:
+        args.database_url = f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(prefix='bench-db-'), 'bench.db')}"
+    os.environ["DATABASE_URL"] = args.database_url
+    logging.basicConfig(level=logging.WARNING)
+
+    # импорт приложения — до запуска цикла: иначе сторож в --strict примет его за блокировку
+    from app.core import cache, db, telemetry  # noqa: F401
+    from app.features.downloader import handlers  # noqa: F401
+
+    bench.run(main_async(args), args.strict)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""
+Сквозная пропускная способность бота без сети.
+
+    python -m bench.e2e -n 200 -c 20 --download-ms 300 --video-kb 2048
+
+Апдейты с сообщениями-ссылками подаются в Dispatcher.feed_update с заданной
+параллельностью. Бот ходит в локальную заглушку Bot API (bench.fake_api),
+а extract_info / download_media / probe_video заменены на заглушки, которые
+отдают локальные файлы с заданной задержкой. Всё остальное — антиспам,
+планировщик, кэши, БД, отправка через RateLimitedSender — настоящее.
+
+Два прохода по одним и тем же ссылкам: uncached (загрузка и отправка файла)
+и cached (ответ по file_id из MediaCache). Для каждого — p50/p95/p99 и rps.
+По умолчанию лимиты Bot API и пороги перегрузки подняты, чтобы мерить
+конвейер, а не ограничители; --real-limits оставляет настройки из окружения.
+С --local-api бот работает как с telegram-bot-api --local (BOT_API_LOCAL=1):
+файлы уходят file://-ссылками, а заглушка читает их с диска сама.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import tempfile
+import time
+from dataclasses import dataclass
+
+import bench
+
+# без --real-limits ограничители не должны быть узким местом бенчмарка
+BENCH_LIMITS = {
+    "TG_GLOBAL_RATE": "100000",
+    "TG_CHAT_RATE": "100000",
+    "SOFT_INFLIGHT": "100000",
+    "HARD_INFLIGHT": "100000",
+    "SOFT_QUEUE_DEPTH": "100000",
+    "HARD_QUEUE_DEPTH": "100000",
+    "SOFT_FREE_DISK_MB": "0",
+    "HARD_FREE_DISK_MB": "0",
+}
+
+def percentile(values: list[float], p: float) -> float:
+    # nearest-rank
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, round(p / 100 * len(ordered) + 0.5) - 1))
+    return ordered[k]
+
+@dataclass
+class PhaseResult:
+    name: str
+    latencies: list[float]
+    elapsed: float
+    errors: int
+
+    def row(self) -> str:
+        ms = [x * 1000 for x in self.latencies]
+        return (
+            f"{self.name:<9} {len(ms):>5} {len(ms) / self.elapsed:8.1f} "
+            f"{percentile(ms, 50):8.0f} {percentile(ms, 95):8.0f} {percentile(ms, 99):8.0f} "
+            f"{max(ms, default=0):8.0f} {self.errors:>6}"
+        )
+
+HEADER = f"{'phase':<9} {'n':>5} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} {'errors':>6}"
+
+class FakeBackends:
+    """
+    Заглушки загрузчиков из media.py. Файлы у каждой ссылки свои (уникальный
+    заголовок перед общим телом), чтобы дедупликация по содержимому не
+    подменяла загрузку.
+    """
+
+    def __init__(self, info_ms: float, download_ms: float, jitter: float, video_kb: int, audio_kb: int):
+        self.info_ms = info_ms
+        self.download_ms = download_ms
+        self.jitter = jitter
+        self.payload = {"video": os.urandom(video_kb * 1024), "audio": os.urandom(audio_kb * 1024)}
+
+    async def _sleep(self, ms: float):
+        if ms > 0:
+            await asyncio.sleep(ms / 1000 * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+    async def extract_info(self, url: str):
+        from app.features.downloader.media import MediaMeta
+
+        await self._sleep(self.info_ms)
+        media_id = url.rstrip("/").rsplit("/", 1)[-1]
+        return MediaMeta(
+            id=media_id, title=f"bench {media_id}", uploader=None, duration=30,
+            filesize_approx=len(self.payload["video"]), webpage_url=url, extractor="youtube",
+        )
+
+    def _write(self, path: str, kind: str, media_id: str):
+        with open(path, "wb") as f:
+            f.write(media_id.encode().ljust(64, b"\0"))
+            f.write(self.payload[kind])
+
+    async def download_media(self, url: str, kind: str = "video", max_mb: int | None = None,
+                             max_height: int | None = None, cache_key: tuple[str, str] | None = None) -> str:
+        from app.core import workspace
+
+        await self._sleep(self.download_ms)
+        media_id = cache_key[1] if cache_key else url.rsplit("/", 1)[-1]
+        job = workspace.job_dir("bench-")
+        path = os.path.join(job, f"{media_id}.{'mp4' if kind == 'video' else 'mp3'}")
+        await asyncio.to_thread(self._write, path, kind, media_id)
+        return path
+
+    async def probe_video(self, path: str):
+        from app.features.downloader.video import VideoInfo
+        return VideoInfo(720, 1280, 30, None)
+
+    def install(self):
+        from app.features.downloader import handlers
+
+        handlers.extract_info = self.extract_info
+        handlers.download_media = self.download_media
+        handlers.probe_video = self.probe_video
+
+def make_update(update_id: int, user_id: int, text: str):
+    from aiogram.types import Update
+
+    return Update.model_validate({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "bench"},
+            "text": text,
+        },
+    })
+
+async def run_phase(name: str, dp, bot, api, urls: list[str], concurrency: int, first_user: int) -> PhaseResult:
+    # у каждого запроса свой пользователь: антиспам (1 запрос в COOLDOWN_SEC) не вмешивается
+    sem = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+    errors_before = api.error_replies
+
+    async def _one(i: int, url: str):
+        update = make_update(first_user + i, first_user + i, url)
+        async with sem:
+            started = time.perf_counter()
+            await dp.feed_update(bot, update)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(_one(i, u) for i, u in enumerate(urls)))
+    return PhaseResult(name, latencies, time.perf_counter() - started, api.error_replies - errors_before)
+
+async def main_async(args, dp) -> list[PhaseResult]:
+    from app.core.db import init_db
+    from app.core import http
+    from bench.fake_api import FakeBotAPI
+
+    await init_db()
+    FakeBackends(args.info_ms, args.download_ms, args.jitter, args.video_kb, args.audio_kb).install()
+
+    urls = [f"https://www.youtube.com/shorts/bench{i:06d}" for i in range(args.count)]
+    results = []
+    async with FakeBotAPI(upload_mbps=args.upload_mbps, local=args.local_api) as api:
+        bot = api.bot()
+        try:
+            results.append(await run_phase("uncached", dp, bot, api, urls, args.concurrency, 1_000_000))
+            results.append(await run_phase("cached", dp, bot, api, urls, args.concurrency, 2_000_000))
+        finally:
+            await bot.session.close()
+            await http.close()
+        calls = ", ".join(f"{m}={n}" for m, n in api.calls.most_common())
+        print(f"Bot API: {calls}; загружено {api.uploaded_bytes / 1024 / 1024:.1f} MB")
+        if api.local:
+            print(f"по локальному пути: {api.local_files} файлов, {api.local_bytes / 1024 / 1024:.1f} MB")
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--count", type=int, default=100, help="ссылок в каждом проходе")
+    parser.add_argument("-c", "--concurrency", type=int, default=20, help="одновременных апдейтов")
+    parser.add_argument("--info-ms", type=float, default=50, help="задержка extract_info")
+    parser.add_argument("--download-ms", type=float, default=300, help="задержка download_media")
+    parser.add_argument("--jitter", type=float, default=0.2, help="разброс задержек, доля")
+    parser.add_argument("--video-kb", type=int, default=1024)
+    parser.add_argument("--audio-kb", type=int, default=256)
+    parser.add_argument("--upload-mbps", type=float, default=0, help="скорость приёма файлов заглушкой, 0 — без ограничения")
+    parser.add_argument("--real-limits", action="store_true", help="не поднимать лимиты Bot API и пороги перегрузки")
+    parser.add_argument("--local-api", action="store_true", help="отправка файлов по пути, как с telegram-bot-api --local")
+    bench.add_strict_arg(parser)
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp(prefix="bench-e2e-")
+    os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{os.path.join(work, 'bench.db')}")
+    if not args.real_limits:
+        for name, value in BENCH_LIMITS.items():
+            os.environ.setdefault(name, value)
+    if args.local_api:
+        # адрес сервера подставит заглушка (FakeBotAPI.bot), BOT_API_URL нужен только для проверки настроек
+        os.environ["BOT_API_LOCAL"] = "1"
+        os.environ.setdefault("BOT_API_URL", "http://127.0.0.1")
+    logging.basicConfig(level=logging.WARNING)
+
+    # импорт приложения — до запуска цикла: иначе сторож в --strict примет его за блокировку
+    from app.bot import dp
+    from app.routers import build_router
+    from bench import fake_api  # noqa: F401
+    dp.include_router(build_router())
+
+    results = bench.run(main_async(args, dp), args.strict)
+    print(HEADER)
+    for r in results:
+        print(r.row())
+
+if __name__ == "__main__":
+    main()
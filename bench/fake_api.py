@@ -0,0 +1,157 @@
+"""
+Локальная заглушка Telegram Bot API на aiohttp для бенчмарков.
+
+Принимает запросы aiogram по адресу /bot<token>/<method>, вычитывает
+загружаемые файлы и отвечает минимальными валидными объектами с новыми
+file_id. Загрузку можно замедлить (upload_mbps), чтобы учесть канал до Telegram.
+
+С local=True заглушка ведёт себя как telegram-bot-api --local: принимает
+file://-ссылки вместо multipart и сама читает файл с диска (нет файла — 400,
+как у настоящего сервера). Без local такие ссылки отклоняются, как в облаке.
+
+    async with FakeBotAPI(local=True) as api:
+        bot = api.bot()
+"""
+import asyncio
+import itertools
+import json
+import os
+import time
+from collections import Counter
+
+from aiohttp import web
+
+MEDIA_FIELDS = {
+    "sendVideo": "video",
+    "sendAudio": "audio",
+    "sendPhoto": "photo",
+    "sendDocument": "document",
+    "sendAnimation": "animation",
+    "sendVoice": "voice",
+}
+ERROR_PREFIXES = ("❌", "⏳", "🔥", "🚦", "📏")  # ответы бота об ошибке/отказе
+
+class FakeBotAPI:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, upload_mbps: float = 0.0, local: bool = False):
+        self.host = host
+        self.port = port
+        self.upload_mbps = upload_mbps
+        self.local = local
+        self.calls: Counter[str] = Counter()
+        self.error_replies = 0
+        self.uploaded_bytes = 0
+        self.local_files = 0
+        self.local_bytes = 0
+        self._ids = itertools.count(1)
+        self._runner: web.AppRunner | None = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def bot(self, token: str = "0:bench", **kwargs):
+        # Bot, который ходит в заглушку через ту же сессию и RateLimitedSender, что и прод
+        from aiogram import Bot
+        from aiogram.client.telegram import TelegramAPIServer
+        from app.core import runtime
+        from app.core.sender import sender
+
+        session = runtime.bot_session(api=TelegramAPIServer.from_base(self.base_url, is_local=self.local))
+        bot = Bot(token=token, session=session, **kwargs)
+        bot.session.middleware(sender)
+        return bot
+
+    async def __aenter__(self):
+        app = web.Application(client_max_size=2 * 1024 ** 3)
+        app.router.add_post("/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._runner.cleanup()
+
+    async def _read_form(self, request: web.Request) -> tuple[dict, int]:
+        fields, uploaded = {}, 0
+        if request.content_type.startswith("multipart/"):
+            reader = await request.multipart()
+            async for part in reader:
+                if part.filename:
+                    while chunk := await part.read_chunk(256 * 1024):
+                        uploaded += len(chunk)
+                else:
+                    fields[part.name] = await part.text()
+        else:
+            fields = dict(await request.post())
+        return fields, uploaded
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.calls[method] += 1
+        fields, uploaded = await self._read_form(request)
+        local_size = 0
+        if local := self._local_paths(method, fields):
+            if not self.local:
+                return self._error("Bad Request: wrong file identifier/HTTP URL specified")
+            try:
+                local_size = sum(os.path.getsize(p) for p in local)
+            except OSError:
+                return self._error("Bad Request: file not found")
+            self.local_files += len(local)
+            self.local_bytes += local_size
+        self.uploaded_bytes += uploaded
+        # локальный файл в Telegram всё равно уходит — с сервера Bot API, по тому же каналу
+        if self.upload_mbps and (uploaded or local_size):
+            await asyncio.sleep((uploaded + local_size) * 8 / (self.upload_mbps * 1_000_000))
+        return web.json_response({"ok": True, "result": self._result(method, fields)})
+
+    def _error(self, description: str) -> web.Response:
+        return web.json_response({"ok": False, "error_code": 400, "description": description}, status=400)
+
+    def _local_paths(self, method: str, fields: dict) -> list[str]:
+        # file://-ссылки в полях файла и превью, в том числе у элементов альбома
+        values = [fields.get(MEDIA_FIELDS[method]), fields.get("thumbnail")] if method in MEDIA_FIELDS else []
+        if method == "sendMediaGroup":
+            for m in json.loads(fields.get("media") or "[]"):
+                values += [m.get("media"), m.get("thumbnail")]
+        return [v[len("file://"):] for v in values if isinstance(v, str) and v.startswith("file://")]
+
+    def _file(self, prefix: str, **extra) -> dict:
+        n = next(self._ids)
+        return {"file_id": f"{prefix}{n}", "file_unique_id": f"u{prefix}{n}", **extra}
+
+    def _message(self, fields: dict) -> dict:
+        chat_id = int(fields.get("chat_id") or 1)
+        return {
+            "message_id": next(self._ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "group"},
+        }
+
+    def _media(self, kind: str) -> dict | list:
+        if kind == "photo":
+            return [self._file("p", width=1280, height=720)]
+        if kind in ("video", "animation"):
+            return self._file(kind[0], width=720, height=1280, duration=30)
+        if kind in ("audio", "voice"):
+            return self._file(kind[0], duration=30)
+        return self._file("d")
+
+    def _result(self, method: str, fields: dict):
+        if method == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+        if method in MEDIA_FIELDS:
+            kind = MEDIA_FIELDS[method]
+            return {**self._message(fields), kind: self._media(kind)}
+        if method == "sendMediaGroup":
+            media = json.loads(fields.get("media") or "[]")
+            return [{**self._message(fields), m["type"]: self._media(m["type"])} for m in media]
+        if method in ("sendMessage", "editMessageText"):
+            text = fields.get("text") or ""
+            if text.startswith(ERROR_PREFIXES):
+                self.error_replies += 1
+            return {**self._message(fields), "text": text}
+        return True  # deleteMessage, sendChatAction и прочие
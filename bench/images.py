@@ -0,0 +1,81 @@
+"""
+Пропускная способность подготовки превью (картинок в секунду).
+
+    python -m bench.images -n 48 -w 1 2 4
+
+Генерирует набор картинок разных форматов и размеров, как в альбомах
+TikTok/Instagram, и прогоняет через make_preview в пуле процессов с разным
+числом воркеров. Второй проход с --cached меряет путь через кэш по хэшу.
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import bench
+from app.core import images
+
+SAMPLES = (
+    ("PNG", (3000, 4000)),
+    ("WEBP", (2160, 3840)),
+    ("JPEG", (6000, 4000)),
+    ("JPEG", (1080, 1920)),   # уже годится как фото — отдаётся без перекодирования
+)
+
+def make_samples(dirpath: str, n: int) -> list[str]:
+    from PIL import Image
+
+    paths = []
+    for i in range(n):
+        fmt, size = SAMPLES[i % len(SAMPLES)]
+        # шум поверх градиента: плохо сжимается, как настоящие фото
+        noise = Image.effect_noise(size, 40).convert("RGB")
+        gradient = Image.linear_gradient("L").resize(size).convert("RGB")
+        img = Image.blend(noise, gradient, 0.5)
+        path = os.path.join(dirpath, f"sample_{i:03d}.{fmt.lower()}")
+        img.save(path, fmt)
+        paths.append(path)
+    return paths
+
+def run_pool(paths: list[str], out_dir: str, workers: int) -> float:
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        dsts = [os.path.join(out_dir, f"{i}.jpg") for i in range(len(paths))]
+        list(pool.map(images.make_preview, paths, dsts))
+    return len(paths) / (time.perf_counter() - started)
+
+async def run_cached(paths: list[str], out_dir: str) -> float:
+    await asyncio.gather(*(images.photo_preview(p, out_dir) for p in paths))  # прогрев кэша
+    started = time.perf_counter()
+    await asyncio.gather(*(images.photo_preview(p, out_dir) for p in paths))
+    rate = len(paths) / (time.perf_counter() - started)
+    images.shutdown()
+    return rate
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--count", type=int, default=32)
+    parser.add_argument("-w", "--workers", type=int, nargs="+", default=[1, 2, os.cpu_count() or 1])
+    parser.add_argument("--cached", action="store_true", help="также замерить повторный проход через кэш")
+    bench.add_strict_arg(parser)
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp(prefix="bench-images-")
+    try:
+        paths = make_samples(work, args.count)
+        mb = sum(os.path.getsize(p) for p in paths) / (1024 * 1024)
+        print(f"{len(paths)} картинок, {mb:.1f} MB")
+        for workers in args.workers:
+            out_dir = tempfile.mkdtemp(dir=work)
+            print(f"workers={workers:<3} {run_pool(paths, out_dir, workers):8.1f} img/s")
+        if args.cached:
+            out_dir = tempfile.mkdtemp(dir=work)
+            print(f"cached      {bench.run(run_cached(paths, out_dir), args.strict):8.1f} img/s")
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Время импорта при холодном старте (python -X importtime).
+
+    python -m bench.importtime                      # main, worker
+    python -m bench.importtime -m app.routers --top 30 --runs 5
+    python -m bench.importtime --budget-ms 3000     # код 1, если медленнее
+
+Каждый модуль импортируется в отдельном интерпретаторе столько раз, сколько
+--runs; берётся самый быстрый прогон (первый обычно ещё компилирует .pyc).
+Отчёт — общее время и самые дорогие модули: по собственному времени и по
+пакетам верхнего уровня (сумма по их модулям). Так видно, что попало в
+импорт на старте и что стоит отложить до первого использования.
+"""
+import argparse
+import os
+import subprocess
+import sys
+from collections import Counter
+from dataclasses import dataclass
+
+import bench  # noqa: F401  BOT_TOKEN и DOWNLOAD_DIR по умолчанию для дочерних интерпретаторов
+
+DEFAULT_MODULES = ("main", "worker")
+
+@dataclass
+class ImportRow:
+    self_us: int
+    cumulative_us: int
+    depth: int
+    name: str
+
+def parse(stderr: str) -> list[ImportRow]:
+    # "import time:      self [us] |  cumulative | imported package", вложенность — отступом
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative, name = line[len("import time:"):].split("|", 2)
+        stripped = name.lstrip(" ")
+        rows.append(ImportRow(int(self_us), int(cumulative), (len(name) - len(stripped) - 1) // 2, stripped))
+    return rows
+
+def measure(module: str) -> list[ImportRow]:
+    res = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, env=os.environ.copy(),
+    )
+    if res.returncode != 0:
+        raise SystemExit(f"import {module} завершился с ошибкой:\n{res.stderr[-2000:]}")
+    return parse(res.stderr)
+
+def report(module: str, rows: list[ImportRow], top: int) -> int:
+    total = sum(r.cumulative_us for r in rows if r.depth == 0)
+    print(f"\n== import {module}: {total / 1000:.0f} мс, модулей {len(rows)}")
+
+    print("\nсамые дорогие модули (собственное время):")
+    for r in sorted(rows, key=lambda r: -r.self_us)[:top]:
+        print(f"{r.self_us / 1000:9.1f} мс  {r.name}")
+
+    packages: Counter[str] = Counter()
+    for r in rows:
+        packages[r.name.split(".")[0]] += r.self_us
+    print("\nпо пакетам верхнего уровня:")
+    for name, us in packages.most_common(top):
+        print(f"{us / 1000:9.1f} мс  {us / total:6.1%}  {name}")
+    return total
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-m", "--module", action="append", help=f"модуль для импорта (по умолчанию: {', '.join(DEFAULT_MODULES)})")
+    parser.add_argument("--runs", type=int, default=3, help="прогонов на модуль, берётся самый быстрый")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--budget-ms", type=float, default=0, help="код 1, если импорт дольше (0 — не проверять)")
+    args = parser.parse_args()
+
+    over = []
+    for module in args.module or DEFAULT_MODULES:
+        runs = [measure(module) for _ in range(max(1, args.runs))]
+        best = min(runs, key=lambda rows: sum(r.cumulative_us for r in rows if r.depth == 0))
+        total = report(module, best, args.top)
+        if args.budget_ms and total / 1000 > args.budget_ms:
+            over.append(f"{module}: {total / 1000:.0f} мс > {args.budget_ms:.0f} мс")
+    if over:
+        print("\nпревышен бюджет: " + "; ".join(over), file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
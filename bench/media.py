@@ -0,0 +1,250 @@
+"""
+Стоимость стратегий загрузчика (media.py) на записанных ответах платформ.
+
+    # один раз, с сетью (и cookies для Instagram): записать фикстуры
+    python -m bench.media fixtures/sample --record \\
+        --youtube https://www.youtube.com/shorts/ID \\
+        --tiktok https://www.tiktok.com/@user/video/ID \\
+        --tiktok-photo https://www.tiktok.com/@user/photo/ID \\
+        --instagram-post https://www.instagram.com/p/ID/
+
+    # дальше офлайн, сколько угодно раз
+    python -m bench.media fixtures/sample -n 5 --latency-ms 40
+
+yt-dlp, gallery-dl и httpx ходят через bench.replay.ReplayProxy
+(DOWNLOAD_PROXY), который отдаёт записанные ответы. Для каждой точки входа —
+время (p50/max), запуски внешних процессов (proc.stats) и HTTP-запросы
+на один прогон, пиковый RSS процесса и пиковый объём DOWNLOAD_DIR/jobs.
+Кэш файлов (BLOB_CACHE_MB) выключен: каждый прогон идёт по всей цепочке.
+
+Ссылки, с которыми записаны фикстуры, сохраняются в scenarios.json рядом
+с ними. Нужны gallery-dl и ffmpeg в PATH, как и в проде.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import resource
+import tempfile
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable
+
+import bench
+from bench.e2e import percentile
+
+SCENARIOS_FILE = "scenarios.json"
+PROBE_INTERVAL_SEC = 0.02
+CATEGORIES = ("youtube", "tiktok", "tiktok-photo", "instagram-post", "instagram-reel")
+
+class Probe(threading.Thread):
+    """Пиковые RSS процесса (/proc/self/statm) и объём каталога задач за время прогона."""
+
+    def __init__(self, jobs_dir: str):
+        super().__init__(name="bench-probe", daemon=True)
+        self.jobs_dir = jobs_dir
+        self.peak_rss = 0
+        self.peak_disk = 0
+        self._stop_event = threading.Event()
+        self._page = os.sysconf("SC_PAGE_SIZE")
+
+    def _rss(self) -> int:
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * self._page
+        except OSError:
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # пик за всё время процесса
+
+    def _sample(self):
+        from app.core.workspace import _dir_size
+        self.peak_rss = max(self.peak_rss, self._rss())
+        self.peak_disk = max(self.peak_disk, _dir_size(self.jobs_dir))
+
+    def run(self):
+        while not self._stop_event.wait(PROBE_INTERVAL_SEC):
+            self._sample()
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        self._sample()
+
+@dataclass
+class EntryResult:
+    name: str
+    url: str
+    latencies: list[float] = field(default_factory=list)
+    failures: list[str] = field(default_factory=list)
+    launches: Counter = field(default_factory=Counter)
+    http_requests: int = 0
+    served_bytes: int = 0
+    peak_rss: int = 0
+    peak_disk: int = 0
+
+    def row(self) -> str:
+        runs = len(self.latencies) + len(self.failures) or 1
+        ms = [x * 1000 for x in self.latencies]
+        procs = " ".join(f"{b}={n / runs:g}" for b, n in sorted(self.launches.items())) or "-"
+        return (
+            f"{self.name:<24} {len(self.latencies):>3}/{runs:<3} {percentile(ms, 50):8.0f} {max(ms, default=0):8.0f} "
+            f"{self.http_requests / runs:6.1f} {self.served_bytes / runs / 1024 / 1024:8.2f} "
+            f"{self.peak_rss / 1024 / 1024:8.1f} {self.peak_disk / 1024 / 1024:8.1f}  {procs}"
+        )
+
+HEADER = (
+    f"{'entry point':<24} {'ok/n':>7} {'p50 ms':>8} {'max ms':>8} {'http':>6} {'MB/run':>8} "
+    f"{'RSS MB':>8} {'disk MB':>8}  процессы/прогон"
+)
+
+def _paths(result) -> list[str]:
+    if isinstance(result, str):
+        return [result]
+    if isinstance(result, list):
+        return [getattr(x, "path", x) for x in result]
+    return [getattr(result, "path", None)]
+
+def entry_points(category: str, url: str) -> list[tuple[str, Callable[[], Awaitable]]]:
+    # (имя, корутина-фабрика) — те же вызовы, что делают обработчики для ссылки этого типа
+    from app.features.downloader import media
+
+    async def _collect(agen) -> list:
+        return [x async for x in agen]
+
+    async def _tiktok_slides():
+        post = await media.tiktok_post_meta(url)
+        return await _collect(media.iter_tiktok_images(post))
+
+    async def _tiktok_post_sound():
+        post = await media.tiktok_post_meta(url)
+        return await media.fetch_tiktok_sound(post)
+
+    info = ("extract_info", lambda: media.extract_info(url))
+    video = ("download_media video", lambda: media.download_media(url, "video"))
+    audio = ("download_media audio", lambda: media.download_media(url, "audio"))
+    return {
+        "youtube": [info, video, audio],
+        "tiktok": [info, video, ("download_tiktok_sound", lambda: media.download_tiktok_sound(url))],
+        "tiktok-photo": [
+            ("tiktok_post_meta+images", _tiktok_slides),
+            ("tiktok_post_meta+sound", _tiktok_post_sound),
+            ("download_tiktok_sound photo", lambda: media.download_tiktok_sound(url, is_photo=True)),
+        ],
+        "instagram-post": [("iter_instagram_post_media", lambda: _collect(media.iter_instagram_post_media(url)))],
+        "instagram-reel": [info, video],
+    }[category]
+
+async def measure(name: str, url: str, factory, runs: int, proxy) -> EntryResult:
+    from app.core import proc, workspace
+
+    res = EntryResult(name, url)
+    for _ in range(runs):
+        launches = Counter({b: st["launches"] for b, st in proc.stats.items()})
+        requests, served = proxy.total_requests, proxy.served_bytes
+        probe = Probe(workspace.JOBS_DIR)
+        probe.start()
+        started = time.perf_counter()
+        try:
+            result = await factory()
+        except Exception as e:
+            res.failures.append(str(e))
+        else:
+            res.latencies.append(time.perf_counter() - started)
+            # из потока release удаляет сразу: следующий прогон не видит чужих файлов на диске
+            await asyncio.to_thread(workspace.release, *filter(None, _paths(result)))
+        finally:
+            await asyncio.to_thread(probe.stop)
+        res.launches.update(Counter({b: st["launches"] for b, st in proc.stats.items()}) - launches)
+        res.http_requests += proxy.total_requests - requests
+        res.served_bytes += proxy.served_bytes - served
+        res.peak_rss = max(res.peak_rss, probe.peak_rss)
+        res.peak_disk = max(res.peak_disk, probe.peak_disk)
+    return res
+
+async def main_async(args, scenarios: dict[str, list[str]], proxy) -> list[EntryResult]:
+    from app.core import http
+
+    results = []
+    try:
+        for category, urls in scenarios.items():
+            for url in urls:
+                for name, factory in entry_points(category, url):
+                    r = await measure(name, url, factory, 1 if args.record else args.runs, proxy)
+                    print(f"{category}: {r.row()}", flush=True)
+                    results.append(r)
+    finally:
+        await http.close()
+    return results
+
+def load_scenarios(args) -> dict[str, list[str]]:
+    path = os.path.join(args.fixtures, SCENARIOS_FILE)
+    given = {c: getattr(args, c.replace("-", "_")) for c in CATEGORIES if getattr(args, c.replace("-", "_"))}
+    if args.record:
+        if not given:
+            raise SystemExit("--record: укажите хотя бы одну ссылку (--youtube, --tiktok, ...)")
+        os.makedirs(args.fixtures, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(given, f, ensure_ascii=False, indent=2)
+        return given
+    if given:
+        return given
+    if not os.path.exists(path):
+        raise SystemExit(f"Нет {path}: сначала запишите фикстуры с --record")
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+async def _with_proxy(args, scenarios):
+    from bench.replay import ReplayProxy
+
+    async with ReplayProxy(args.fixtures, record=args.record, latency_ms=args.latency_ms) as proxy:
+        # настройки и клиенты читают окружение при первом обращении — подставляем до него
+        os.environ.update(proxy.env())
+        from app.core.config import settings
+        settings.download_proxy = proxy.url
+        results = await main_async(args, scenarios, proxy)
+        if proxy.misses:
+            print(f"\nНет в фикстурах ({len(proxy.misses)}), первые:")
+            for miss in proxy.misses[:10]:
+                print(f"  {miss}")
+        hosts = ", ".join(f"{h}={n}" for h, n in proxy.requests.most_common(8))
+        print(f"\nHTTP через прокси: {proxy.total_requests} ({hosts})")
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("fixtures", help="каталог фикстур")
+    parser.add_argument("--record", action="store_true", help="ходить в сеть и записать ответы в каталог фикстур")
+    parser.add_argument("-n", "--runs", type=int, default=3, help="прогонов каждой точки входа")
+    parser.add_argument("--latency-ms", type=float, default=0, help="задержка каждого ответа прокси")
+    for c in CATEGORIES:
+        parser.add_argument(f"--{c}", action="append", metavar="URL")
+    bench.add_strict_arg(parser)
+    args = parser.parse_args()
+    scenarios = load_scenarios(args)
+
+    os.environ.setdefault("BLOB_CACHE_MB", "0")
+    if not os.getenv("INSTAGRAM_COOKIES") and not args.record:
+        # при воспроизведении cookies не проверяются, но media.py требует файл
+        cookies = os.path.join(tempfile.mkdtemp(prefix="bench-media-"), "cookies.txt")
+        with open(cookies, "w") as f:
+            f.write("# Netscape HTTP Cookie File\n")
+        os.environ["INSTAGRAM_COOKIES"] = cookies
+    logging.basicConfig(level=logging.WARNING)
+
+    # импорт приложения — до запуска цикла: иначе сторож в --strict примет его за блокировку
+    from app.features.downloader import media  # noqa: F401
+    from bench import replay  # noqa: F401
+
+    results = bench.run(_with_proxy(args, scenarios), args.strict)
+    print(HEADER)
+    for r in results:
+        print(r.row())
+        if r.failures:
+            print(f"{'':<24} ошибка: {r.failures[0][:200]}")
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    print(f"макс. RSS дочерних процессов (gallery-dl, ffmpeg): {children:.1f} MB")
+
+if __name__ == "__main__":
+    main()
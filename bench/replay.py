@@ -0,0 +1,300 @@
+"""
+Локальная подмена TikTok / Instagram / YouTube для бенчмарков загрузчиков.
+
+ReplayProxy — HTTP-прокси, через который ходят yt-dlp, gallery-dl и httpx
+(DOWNLOAD_PROXY). HTTPS он расшифровывает сам: на CONNECT отвечает
+сертификатом запрошенного хоста, подписанным собственным CA (openssl), и
+отдаёт ответы из каталога фикстур вместо сети. Клиенты доверяют этому CA
+через SSL_CERT_FILE (httpx) и REQUESTS_CA_BUNDLE (gallery-dl); yt-dlp
+сертификаты не проверяет (nocheckcertificate).
+
+С record=True прокси ходит в настоящую сеть и записывает ответы — так
+фикстуры снимаются один раз, а дальше бенчмарк работает офлайн.
+
+Каталог фикстур:
+    responses.jsonl   {"method", "url", "status", "headers", "body"} на строку
+    bodies/<sha1>     тела ответов; одинаковые хранятся один раз
+
+Ответ ищется по методу и полному URL, затем — по методу, хосту и пути без
+query (подписи и метки времени в ссылках CDN меняются от запуска к запуску).
+Несколько записей на один ключ отдаются по кругу. Range поддерживается,
+поэтому записывается всегда полное тело.
+"""
+import asyncio
+import hashlib
+import ipaddress
+import json
+import os
+import re
+import shutil
+import ssl
+import subprocess
+import tempfile
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from http import HTTPStatus
+from urllib.parse import urlsplit
+
+import httpx
+
+CHUNK_SIZE = 1024 * 1024
+HEAD_LIMIT = 256 * 1024
+# не пересылаются и не записываются: относятся к соединению или к кодированию тела
+HOP_HEADERS = {
+    "connection", "keep-alive", "proxy-connection", "proxy-authorization", "te", "trailer",
+    "transfer-encoding", "upgrade", "content-length", "content-encoding",
+}
+RANGE_RE = re.compile(r"bytes=(\d*)-(\d*)$")
+
+@dataclass
+class Recorded:
+    status: int
+    headers: list[tuple[str, str]]
+    body: str  # путь относительно каталога фикстур
+
+def _openssl(*args: str):
+    subprocess.run(["openssl", *args], check=True, capture_output=True)
+
+class CertAuthority:
+    """Одноразовый CA и сертификаты хостов через openssl CLI (ключи EC P-256 — быстро)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.cert = os.path.join(path, "ca.pem")
+        self.key = os.path.join(path, "ca.key")
+        _openssl(
+            "req", "-x509", "-newkey", "ec", "-pkeyopt", "ec_paramgen_curve:prime256v1", "-nodes",
+            "-days", "2", "-subj", "/CN=bench replay CA", "-keyout", self.key, "-out", self.cert,
+            "-addext", "basicConstraints=critical,CA:TRUE",
+            "-addext", "keyUsage=critical,keyCertSign,cRLSign",
+        )
+
+    def server_context(self, host: str) -> ssl.SSLContext:
+        name = re.sub(r"[^\w.-]", "_", host)
+        key, csr, crt, ext = (os.path.join(self.path, f"{name}.{x}") for x in ("key", "csr", "pem", "ext"))
+        try:
+            san = f"IP:{ipaddress.ip_address(host)}"
+        except ValueError:
+            san = f"DNS:{host}"
+        with open(ext, "w") as f:
+            f.write(
+                f"subjectAltName={san}\nbasicConstraints=CA:FALSE\n"
+                "keyUsage=critical,digitalSignature\nextendedKeyUsage=serverAuth\n"
+                "authorityKeyIdentifier=keyid\n"
+            )
+        _openssl("req", "-newkey", "ec", "-pkeyopt", "ec_paramgen_curve:prime256v1", "-nodes",
+                 "-subj", f"/CN={host}", "-keyout", key, "-out", csr)
+        _openssl("x509", "-req", "-in", csr, "-CA", self.cert, "-CAkey", self.key, "-CAcreateserial",
+                 "-days", "2", "-extfile", ext, "-out", crt)
+        ctx = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        ctx.load_cert_chain(crt, key)
+        ctx.set_alpn_protocols(["http/1.1"])
+        return ctx
+
+class FixtureStore:
+    def __init__(self, root: str):
+        self.root = root
+        self.index = os.path.join(root, "responses.jsonl")
+        self._exact: dict[tuple[str, str], list[Recorded]] = defaultdict(list)
+        self._by_path: dict[tuple[str, str, str], list[Recorded]] = defaultdict(list)
+        self._turn: Counter = Counter()
+
+    @staticmethod
+    def _path_key(method: str, url: str) -> tuple[str, str, str]:
+        parts = urlsplit(url)
+        return method, parts.hostname or "", parts.path
+
+    def load(self) -> int:
+        if not os.path.exists(self.index):
+            return 0
+        n = 0
+        with open(self.index, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                d = json.loads(line)
+                rec = Recorded(d["status"], [tuple(h) for h in d["headers"]], d["body"])
+                self._exact[(d["method"], d["url"])].append(rec)
+                self._by_path[self._path_key(d["method"], d["url"])].append(rec)
+                n += 1
+        return n
+
+    def find(self, method: str, url: str) -> Recorded | None:
+        for key in ((method, url), self._path_key(method, url)):
+            records = (self._exact if len(key) == 2 else self._by_path).get(key)
+            if records:
+                i = self._turn[key]
+                self._turn[key] += 1
+                return records[i % len(records)]
+        return None
+
+    def file(self, rec: Recorded) -> str:
+        return os.path.join(self.root, rec.body)
+
+    def add(self, method: str, url: str, status: int, headers: list[tuple[str, str]], body: bytes) -> Recorded:
+        # вызывается из потока: запись тел не держит цикл событий
+        name = os.path.join("bodies", hashlib.sha1(body).hexdigest())
+        path = os.path.join(self.root, name)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(body)
+        rec = Recorded(status, headers, name)
+        with open(self.index, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"method": method, "url": url, "status": status, "headers": headers, "body": name}) + "\n")
+        return rec
+
+def _read_chunk(path: str, offset: int, size: int) -> bytes:
+    with open(path, "rb") as f:
+        f.seek(offset)
+        return f.read(size)
+
+async def _read_head(reader: asyncio.StreamReader) -> tuple[str, str, dict[str, str]] | None:
+    try:
+        raw = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError:
+        return None  # клиент закрыл keep-alive соединение
+    lines = raw.decode("latin-1").split("\r\n")
+    method, target, _ = lines[0].split(" ", 2)
+    headers = {}
+    for line in lines[1:]:
+        if ":" in line:
+            k, v = line.split(":", 1)
+            headers[k.strip().lower()] = v.strip()
+    return method, target, headers
+
+class ReplayProxy:
+    def __init__(self, fixtures: str, record: bool = False, host: str = "127.0.0.1", port: int = 0,
+                 latency_ms: float = 0.0):
+        self.store = FixtureStore(fixtures)
+        self.record = record
+        self.host = host
+        self.port = port
+        self.latency_ms = latency_ms
+        self.requests: Counter[str] = Counter()  # по хостам
+        self.misses: list[str] = []
+        self.served_bytes = 0
+        self._certs_dir = ""
+        self._ca: CertAuthority | None = None
+        self._contexts: dict[str, asyncio.Task] = {}
+        self._server: asyncio.base_events.Server | None = None
+        self._upstream: httpx.AsyncClient | None = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def total_requests(self) -> int:
+        return sum(self.requests.values())
+
+    def env(self) -> dict[str, str]:
+        # для процесса бенчмарка и дочерних gallery-dl: прокси и доверие к его CA
+        return {"DOWNLOAD_PROXY": self.url, "SSL_CERT_FILE": self._ca.cert, "REQUESTS_CA_BUNDLE": self._ca.cert}
+
+    async def __aenter__(self):
+        os.makedirs(self.store.root, exist_ok=True)
+        loaded = await asyncio.to_thread(self.store.load)
+        if not self.record and not loaded:
+            raise RuntimeError(f"В {self.store.index} нет записанных ответов: сначала --record")
+        self._certs_dir = tempfile.mkdtemp(prefix="bench-replay-ca-")
+        self._ca = await asyncio.to_thread(CertAuthority, self._certs_dir)
+        if self.record:
+            # trust_env=False: запись идёт в настоящую сеть мимо подставленных SSL_CERT_FILE/прокси
+            self._upstream = httpx.AsyncClient(timeout=httpx.Timeout(60, connect=15), trust_env=False)
+        self._server = await asyncio.start_server(self._on_client, self.host, self.port, limit=HEAD_LIMIT)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def __aexit__(self, *exc):
+        self._server.close()
+        await self._server.wait_closed()
+        if self._upstream is not None:
+            await self._upstream.aclose()
+        shutil.rmtree(self._certs_dir, ignore_errors=True)
+
+    async def _tls(self, host: str) -> ssl.SSLContext:
+        # сертификат хоста выпускается один раз; параллельные CONNECT ждут тот же выпуск
+        task = self._contexts.get(host)
+        if task is None:
+            task = self._contexts[host] = asyncio.create_task(asyncio.to_thread(self._ca.server_context, host))
+        return await task
+
+    async def _on_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            head = await _read_head(reader)
+            if head is None:
+                return
+            method, target, headers = head
+            if method == "CONNECT":
+                host, _, port = target.rpartition(":")
+                # контекст — до ответа 200: иначе ClientHello успеет уйти в буфер обычного потока
+                ctx = await self._tls(host)
+                writer.write(b"HTTP/1.1 200 Connection established\r\n\r\n")
+                await writer.start_tls(ctx)
+                origin = f"https://{host}" if port == "443" else f"https://{target}"
+                head = await _read_head(reader)
+            else:
+                origin = ""  # обычный HTTP через прокси: в строке запроса абсолютный URL
+            while head is not None:
+                method, target, headers = head
+                body = await reader.readexactly(int(headers.get("content-length") or 0))
+                if not await self._respond(writer, method, origin + target, headers, body):
+                    break
+                head = await _read_head(reader)
+        except (ConnectionError, ssl.SSLError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            writer.close()
+
+    async def _fetch_upstream(self, method: str, url: str, headers: dict, body: bytes) -> Recorded:
+        # Range и Accept-Encoding не пересылаются: записывается полное раскодированное тело
+        fwd = {k: v for k, v in headers.items() if k not in HOP_HEADERS and k not in ("host", "range", "accept-encoding")}
+        r = await self._upstream.request(method, url, headers=fwd, content=body or None)
+        resp_headers = [(k, v) for k, v in r.headers.multi_items() if k.lower() not in HOP_HEADERS]
+        return await asyncio.to_thread(self.store.add, method, url, r.status_code, resp_headers, r.content)
+
+    async def _respond(self, writer: asyncio.StreamWriter, method: str, url: str, headers: dict, body: bytes) -> bool:
+        self.requests[urlsplit(url).hostname or "?"] += 1
+        if self.record:
+            rec = await self._fetch_upstream(method, url, headers, body)
+        else:
+            rec = self.store.find(method, url)
+
+        status, resp_headers, path, offset, length = 404, [], None, 0, 0
+        if rec is None:
+            self.misses.append(f"{method} {url}")
+        else:
+            status, resp_headers, path = rec.status, list(rec.headers), self.store.file(rec)
+            length = os.path.getsize(path)
+            m = RANGE_RE.match(headers.get("range", ""))
+            if m and status == 200 and length:
+                start, end = m.groups()
+                if start:
+                    offset, last = int(start), min(int(end) if end else length - 1, length - 1)
+                else:
+                    offset, last = max(0, length - int(end or 0)), length - 1
+                resp_headers.append(("Content-Range", f"bytes {offset}-{last}/{length}"))
+                status, length = 206, max(0, last - offset + 1)
+
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+        try:
+            phrase = HTTPStatus(status).phrase
+        except ValueError:
+            phrase = ""
+        lines = [f"HTTP/1.1 {status} {phrase}", *(f"{k}: {v}" for k, v in resp_headers), f"Content-Length: {length}"]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1", "replace"))
+        if method != "HEAD":
+            # тело читается с диска кусками: память бенчмарка не растёт от размера файлов
+            sent = 0
+            while sent < length:
+                chunk = await asyncio.to_thread(_read_chunk, path, offset + sent, min(CHUNK_SIZE, length - sent))
+                if not chunk:
+                    break
+                writer.write(chunk)
+                await writer.drain()
+                sent += len(chunk)
+            self.served_bytes += sent
+        await writer.drain()
+        return headers.get("connection", "").lower() != "close"
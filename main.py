@@ -5,12 +5,17 @@ import sys
 from app.bot import bot, dp
 from app.routers import build_router
 from app.core.db import init_db
+from app.core.config import settings
+from app.core import workspace, http, images, metrics, tracing, watchdog, binaries, runtime
+from app.features.downloader import media
 
 # Настройка логирования
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
+if settings.log_json:
+    tracing.use_json_logs()
 logger = logging.getLogger(__name__)
 
 # Флаг для graceful shutdown
@@ -21,15 +26,36 @@ def signal_handler(signum, frame):
     logger.info(f"Получен сигнал {signum}, начинаю shutdown...")
     shutdown_event.set()
 
+async def _warm_up():
+    # внешние программы с версиями и yt_dlp — в фоне: отвечать можно, не дожидаясь их
+    try:
+        await binaries.discover()
+        await asyncio.get_running_loop().run_in_executor(None, media.warm_up)
+    except Exception as e:
+        logger.warning(f"Прогрев не удался: {e}")
+
 async def _run():
     try:
         # Инициализация базы данных
         logger.info("Инициализация базы данных...")
         await init_db()
         logger.info("База данных инициализирована")
+
+        runtime.log_active()
+        watchdog.start()
+        asyncio.create_task(_warm_up())
+
+        # Уборка каталогов, брошенных предыдущим запуском
+        await asyncio.to_thread(workspace.sweep)
+        asyncio.create_task(workspace.janitor_loop())
+
+        metrics_runner = None
+        if settings.metrics_port:
+            metrics_runner = await metrics.serve(settings.metrics_host, settings.metrics_port)
         
-        # Запуск бота
-        logger.info("Запуск бота...")
+        # getMe — при старте, а не на первом запросе пользователя (bot_mention)
+        me = await bot.me()
+        logger.info(f"Запуск бота @{me.username}...")
         await dp.start_polling(bot, stop_signals=())
         
         # Ожидание сигнала shutdown
@@ -37,7 +63,12 @@ async def _run():
         
         # Graceful shutdown
         logger.info("Остановка бота...")
+        watchdog.stop()
         await bot.session.close()
+        await http.close()
+        if metrics_runner:
+            await metrics_runner.cleanup()
+        images.shutdown()
         logger.info("Бот остановлен")
         
     except Exception as e:
@@ -55,6 +86,7 @@ def main():
         logger.info("Роутеры подключены")
         
         # Запуск основного цикла
+        runtime.install_event_loop()
         asyncio.run(_run())
     except KeyboardInterrupt:
         logger.info("Получен сигнал прерывания")
@@ -0,0 +1,78 @@
+import argparse
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select, delete
+
+from app.core.db import Session, init_db
+from app.core.models import RequestTrace
+
+def _parse_age(value: str) -> timedelta:
+    # 30m, 6h, 2d
+    units = {"m": "minutes", "h": "hours", "d": "days"}
+    return timedelta(**{units[value[-1]]: float(value[:-1])})
+
+def _utcnow() -> datetime:
+    # как в app.core.jobs: время в БД хранится без часового пояса, в UTC
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def _fmt_bytes(n: int) -> str:
+    return f"{n / (1024 * 1024):.1f}M" if n else "-"
+
+async def _slowest(limit: int, since: timedelta | None, handler: str | None, errors: bool):
+    q = select(RequestTrace).order_by(RequestTrace.total_sec.desc()).limit(limit)
+    if since:
+        q = q.where(RequestTrace.ts >= _utcnow() - since)
+    if handler:
+        q = q.where(RequestTrace.handler == handler)
+    if errors:
+        q = q.where(RequestTrace.error.is_not(None))
+    async with Session() as s:
+        rows = (await s.execute(q)).scalars().all()
+
+    if not rows:
+        print("Нет записей")
+        return
+    for r in rows:
+        print(
+            f"{r.total_sec:8.2f}s  {r.ts:%Y-%m-%d %H:%M:%S}  {r.request_id}  {r.handler}/{r.strategy or '-'}"
+            f"  down={_fmt_bytes(r.bytes_down)} up={_fmt_bytes(r.bytes_up)}"
+            f"{'  error=' + r.error if r.error else ''}"
+        )
+        print(f"          {r.url}")
+        stages = sorted(json.loads(r.stages or "{}").items(), key=lambda kv: -kv[1])
+        for name, sec in stages:
+            share = sec / r.total_sec * 100 if r.total_sec else 0
+            print(f"          {name:<28} {sec:8.2f}s {share:5.0f}%")
+        cache = json.loads(r.cache or "{}")
+        if cache:
+            print("          кэш: " + ", ".join(f"{k}={v}" for k, v in sorted(cache.items())))
+        print()
+
+async def _prune(older_than: timedelta):
+    async with Session() as s:
+        result = await s.execute(
+            delete(RequestTrace).where(RequestTrace.ts < _utcnow() - older_than)
+        )
+        await s.commit()
+    print(f"Удалено записей: {result.rowcount}")
+
+async def _main(args):
+    await init_db()
+    if args.prune:
+        await _prune(_parse_age(args.prune))
+    else:
+        await _slowest(args.top, _parse_age(args.since) if args.since else None, args.handler, args.errors)
+
+def main():
+    parser = argparse.ArgumentParser(description="Самые медленные запросы из таблицы request_traces с разбивкой по этапам")
+    parser.add_argument("-n", "--top", type=int, default=20, help="сколько запросов показать")
+    parser.add_argument("--since", help="только за последние 30m / 6h / 2d")
+    parser.add_argument("--handler", help="handle_url или job")
+    parser.add_argument("--errors", action="store_true", help="только завершившиеся ошибкой")
+    parser.add_argument("--prune", metavar="AGE", help="удалить записи старше AGE (например 14d) и выйти")
+    asyncio.run(_main(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
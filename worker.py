@@ -0,0 +1,186 @@
+import logging
+import asyncio
+import argparse
+import signal
+import sys
+from aiogram.types import Message
+from aiogram.exceptions import TelegramBadRequest
+from app.bot import bot
+from app.core.config import settings
+from app.core.db import init_db
+from app.core import workspace, http, images, metrics, tracing, watchdog, binaries, runtime
+from app.features.downloader import media
+from app.core.jobs import (
+    claim_job, renew_lease, complete_job, fail_job, reap_dead_jobs, worker_id, JobRun, running
+)
+from app.features.downloader.handlers import process_url
+from app.features.downloader.cost import CostRejectedError
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+if settings.log_json:
+    tracing.use_json_logs()
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL_SEC = 1.0
+
+shutdown_event = asyncio.Event()
+
+def signal_handler(signum, frame):
+    """Обработчик сигналов: дорабатываем текущие задачи и выходим"""
+    logger.info(f"Получен сигнал {signum}, завершаю воркер...")
+    shutdown_event.set()
+
+async def _warm_up():
+    # внешние программы с версиями и yt_dlp — в фоне: отвечать можно, не дожидаясь их
+    try:
+        await binaries.discover()
+        await asyncio.get_running_loop().run_in_executor(None, media.warm_up)
+    except Exception as e:
+        logger.warning(f"Прогрев не удался: {e}")
+
+async def _heartbeat(job_id: int, owner: str, work: asyncio.Task):
+    # продлеваем аренду, пока задача выполняется; если воркер умрёт — её заберёт другой.
+    # Потерянная аренда — задачу уже может выполнять другой воркер: эту прерываем
+    while True:
+        await asyncio.sleep(settings.job_lease_sec / 3)
+        try:
+            renewed = await renew_lease(job_id, owner, settings.job_lease_sec)
+        except Exception as e:
+            # сбой БД (например, database is locked) — не потеря аренды: пробуем на следующем такте
+            logger.warning(f"Не удалось продлить аренду задачи {job_id}: {e}")
+            continue
+        if not renewed:
+            logger.warning(f"Аренда задачи {job_id} потеряна, прерываю её")
+            work.cancel()
+            return
+
+async def _finish(chat_id: int, status_message_id: int | None):
+    if not status_message_id:
+        return
+    try:
+        await bot.delete_message(chat_id, status_message_id)
+    except TelegramBadRequest:
+        pass
+
+async def _process(job, run: JobRun):
+    msg = Message.model_validate_json(job.message).as_(bot)
+    with running(run):
+        async with tracing.request("job", job.user_tg_id, job.url):
+            await process_url(msg, job.url)
+
+async def _execute(job, owner: str):
+    run = JobRun(job.id)
+    work = asyncio.create_task(_process(job, run))
+    hb = asyncio.create_task(_heartbeat(job.id, owner, work))
+    try:
+        await work
+    except asyncio.CancelledError:
+        if hb.done():
+            return  # аренда потеряна: статус задачи теперь за её новым владельцем
+        hb.cancel()
+        raise
+    except CostRejectedError as e:
+        # повторять бессмысленно: оценка стоимости не изменится
+        hb.cancel()
+        await complete_job(job.id, owner)
+        await _finish(job.chat_id, job.status_message_id)
+        await bot.send_message(job.chat_id, f"📏 {e}")
+        return
+    except Exception as e:
+        hb.cancel()
+        if run.delivered:
+            # часть уже отправлена: повтор прислал бы её заново — задача завершается как есть
+            logger.warning(f"Задача {job.id} упала после отправки {run.delivered} сообщ.: {e}")
+            await complete_job(job.id, owner)
+            await _finish(job.chat_id, job.status_message_id)
+            try:
+                await bot.send_message(job.chat_id, f"⚠️ Отправлено не всё: {e}")
+            except Exception:
+                pass
+            return
+        logger.warning(f"Задача {job.id} (попытка {job.attempts}) упала: {e}")
+        if not await fail_job(job.id, owner, f"{type(e).__name__}: {e}"):
+            await _finish(job.chat_id, job.status_message_id)
+            try:
+                await bot.send_message(job.chat_id, f"❌ Произошла ошибка: {e}")
+            except Exception:
+                pass
+        return
+    hb.cancel()
+    await complete_job(job.id, owner)
+    await _finish(job.chat_id, job.status_message_id)
+
+async def _slot_loop(owner: str):
+    while not shutdown_event.is_set():
+        job = await claim_job(owner, settings.job_lease_sec)
+        if job is None:
+            try:
+                await asyncio.wait_for(shutdown_event.wait(), timeout=POLL_INTERVAL_SEC)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        logger.info(f"Взята задача {job.id}: {job.url}")
+        await _execute(job, owner)
+
+async def _reaper_loop():
+    while not shutdown_event.is_set():
+        for job in await reap_dead_jobs():
+            logger.warning(f"Задача {job.id} исчерпала попытки")
+            await _finish(job.chat_id, job.status_message_id)
+            try:
+                await bot.send_message(job.chat_id, "❌ Не удалось обработать ссылку, попробуйте позже.")
+            except Exception:
+                pass
+        try:
+            await asyncio.wait_for(shutdown_event.wait(), timeout=settings.job_lease_sec)
+        except asyncio.TimeoutError:
+            pass
+
+async def _run(concurrency: int, metrics_port: int):
+    metrics_runner = None
+    try:
+        runtime.log_active()
+        watchdog.start()
+        asyncio.create_task(_warm_up())
+        await init_db()
+        await bot.me()  # getMe заранее: bot_mention в подписях не ждёт его на первой задаче
+        await asyncio.to_thread(workspace.sweep)
+        asyncio.create_task(workspace.janitor_loop())
+        if metrics_port:
+            metrics_runner = await metrics.serve(settings.metrics_host, metrics_port)
+        owner = worker_id()
+        logger.info(f"Воркер {owner} запущен, параллельных задач: {concurrency}")
+        await asyncio.gather(
+            _reaper_loop(),
+            *(_slot_loop(f"{owner}/{i}") for i in range(concurrency)),
+        )
+    except Exception as e:
+        logger.error(f"Ошибка воркера: {e}")
+        sys.exit(1)
+    finally:
+        watchdog.stop()
+        await bot.session.close()
+        await http.close()
+        images.shutdown()
+        if metrics_runner:
+            await metrics_runner.cleanup()
+        logger.info("Воркер остановлен")
+
+def main():
+    parser = argparse.ArgumentParser(description="Воркер загрузок: выполняет задачи из таблицы jobs")
+    parser.add_argument("-c", "--concurrency", type=int, default=settings.worker_concurrency)
+    parser.add_argument("--metrics-port", type=int, default=settings.metrics_port, help="порт /metrics, 0 — выключен")
+    args = parser.parse_args()
+
+    signal.signal(signal.SIGINT, signal_handler)
+    signal.signal(signal.SIGTERM, signal_handler)
+
+    runtime.install_event_loop()
+    asyncio.run(_run(max(1, args.concurrency), args.metrics_port))
+
+if __name__ == "__main__":
+    main()